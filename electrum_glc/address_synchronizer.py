@@ -24,20 +24,22 @@
 import asyncio
 import threading
 import itertools
+import bisect
 from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List, Mapping
 
 from .crypto import sha256
 from . import bitcoin, util
 from .bitcoin import COINBASE_MATURITY
-from .util import profiler, bfh, TxMinedInfo, UnrelatedTransactionException, with_lock, OldTaskGroup
+from .util import profiler, bfh, TxMinedInfo, UnrelatedTransactionException, OldTaskGroup
 from .transaction import Transaction, TxOutput, TxInput, PartialTxInput, TxOutpoint, PartialTransaction
-from .synchronizer import Synchronizer
+from .synchronizer import Synchronizer, history_status
 from .verifier import SPV
 from .blockchain import hash_header, Blockchain
 from .i18n import _
 from .logging import Logger
-from .util import EventListener, event_listener
+from .util import EventListener
 
 if TYPE_CHECKING:
     from .network import Network
@@ -57,6 +59,68 @@ class HistoryItem(NamedTuple):
     delta: int
     fee: Optional[int]
     balance: int
+    monotonic_timestamp: int  # max timestamp of the history up to this item; txs not mined count as far future
+
+
+MAX_TIMESTAMP = 999_999_999_999  # timestamp used for txs that are not mined yet
+
+
+class HistoryIndex:
+    """History of a set of addresses, sorted by txpos, with running balances.
+
+    Txs whose delta or position might have changed are marked dirty, and their
+    entries are recomputed the next time the history is read. Running balances
+    are only recomputed from the first entry that changed.
+    """
+
+    def __init__(self, domain: Set[str]):
+        self.domain = domain
+        self.keys = []  # type: List[Tuple[Tuple[int, int], str]]  # sorted (txpos, txid)
+        self.balances = []  # type: List[int]  # balance after the tx at the same index of self.keys
+        self.monotonic_timestamps = []  # type: List[int]  # max timestamp up to the same index of self.keys
+        self.deltas = {}  # type: Dict[str, int]  # txid -> delta
+        self.txpos = {}  # type: Dict[str, Tuple[int, int]]  # txid -> txpos
+        self.dirty = set()  # type: Set[str]  # txids
+
+
+NUM_UTXO_INDEX_SHARDS = 64
+
+
+# value, is_cb, height of the tx, and (address, value) of the inputs of the tx
+# that spend confirmed coins if the tx is unconfirmed
+UtxoIndexEntry = Tuple[int, bool, int, Tuple[Tuple[str, int], ...]]
+
+
+class UtxoIndexSnapshot:
+    """Read-only view of the utxo index, as of the last committed write.
+
+    A snapshot is never modified once published (except for its balance caches),
+    so readers can query it without taking any lock. Addresses are sharded, and
+    writers publish a new snapshot that only copies the shards that changed.
+    The partial balances of the shards that did not change are carried over.
+    The heights needed to count a coin as confirmed are recorded along with it,
+    so that a balance is computed from the state of a single snapshot.
+    """
+
+    def __init__(self, shards: Tuple[Dict[str, Dict[str, UtxoIndexEntry]], ...],
+                 shard_balances: Tuple[Dict[bytes, Tuple[int, Tuple[int, int, int]]], ...] = None):
+        self.shards = shards  # address -> prevout -> entry
+        # (local height, balance) of the domain, per cache key
+        self.balance_cache = {}  # type: Dict[bytes, Tuple[int, Tuple[int, int, int]]]
+        # (local height, balance) of the addresses of the domain that are in each shard, per cache key
+        self.shard_balances = shard_balances or tuple({} for i in range(NUM_UTXO_INDEX_SHARDS))
+        self.balance_cache_lock = threading.Lock()
+
+    @classmethod
+    def empty(cls) -> 'UtxoIndexSnapshot':
+        return cls(tuple({} for i in range(NUM_UTXO_INDEX_SHARDS)))
+
+    @staticmethod
+    def get_shard_index(address: str) -> int:
+        return hash(address) % NUM_UTXO_INDEX_SHARDS
+
+    def get_addr_utxos(self, address: str) -> Mapping[str, UtxoIndexEntry]:
+        return self.shards[self.get_shard_index(address)].get(address, {})
 
 
 class AddressSynchronizer(Logger, EventListener):
@@ -89,7 +153,7 @@ class AddressSynchronizer(Logger, EventListener):
         # thread local storage for caching stuff
         self.threadlocal_cache = threading.local()
 
-        self._get_balance_cache = {}
+        self._history_indexes = {}  # type: Dict[bytes, HistoryIndex]  # domain hash -> index
 
         self.load_and_cleanup()
 
@@ -189,10 +253,6 @@ class AddressSynchronizer(Logger, EventListener):
             self.asyncio_loop = network.asyncio_loop
             self.register_callbacks()
 
-    @event_listener
-    def on_event_blockchain_updated(self, *args):
-        self._get_balance_cache = {}  # invalidate cache
-
     async def stop(self):
         if self.network:
             try:
@@ -208,8 +268,8 @@ class AddressSynchronizer(Logger, EventListener):
                 self.db.put('stored_height', self.get_local_height())
 
     def add_address(self, address):
-        if address not in self.db.history:
-            self.db.history[address] = []
+        if not self.db.is_addr_in_history(address):
+            self.db.set_addr_history(address, [], status=None)
             self.set_up_to_date(False)
         if self.synchronizer:
             self.synchronizer.add(address)
@@ -262,7 +322,7 @@ class AddressSynchronizer(Logger, EventListener):
             raise Exception("cannot add tx without txid to wallet history")
         # we need self.transaction_lock but get_tx_height will take self.lock
         # so we need to take that too here, to enforce order of locks
-        with self.lock, self.transaction_lock:
+        with self.lock, self._writing_utxo_index():
             # NOTE: returning if tx in self.transactions might seem like a good idea
             # BUT we track is_mine inputs in a txn, and during subsequent calls
             # of add_transaction tx, we might learn of more-and-more inputs of
@@ -313,7 +373,7 @@ class AddressSynchronizer(Logger, EventListener):
                         pass
                     else:
                         self.db.add_txi_addr(tx_hash, addr, ser, v)
-                        self._get_balance_cache.clear()  # invalidate cache
+                        self._add_txi_to_utxo_index(tx_hash, addr, ser)
             for txi in tx.inputs():
                 if txi.is_coinbase_input():
                     continue
@@ -331,14 +391,16 @@ class AddressSynchronizer(Logger, EventListener):
                 addr = txo.address
                 if addr and self.is_mine(addr):
                     self.db.add_txo_addr(tx_hash, addr, n, v, is_coinbase)
-                    self._get_balance_cache.clear()  # invalidate cache
+                    self._add_txo_to_utxo_index(addr, ser, v, is_coinbase)
                     # give v to txi that spends me
                     next_tx = self.db.get_spent_outpoint(tx_hash, n)
                     if next_tx is not None:
                         self.db.add_txi_addr(next_tx, addr, ser, v)
+                        self._add_txi_to_utxo_index(next_tx, addr, ser)
                         self._add_tx_to_local_history(next_tx)
             # add to local history
             self._add_tx_to_local_history(tx_hash)
+            self._mark_balance_changed(tx_hash)
             # save
             self.db.add_transaction(tx_hash, tx)
             self.db.add_num_inputs_to_tx(tx_hash, len(tx.inputs()))
@@ -350,7 +412,7 @@ class AddressSynchronizer(Logger, EventListener):
         """Removes a transaction AND all its dependents/children
         from the wallet history.
         """
-        with self.lock, self.transaction_lock:
+        with self.lock, self._writing_utxo_index():
             to_remove = {tx_hash}
             to_remove |= self.get_depending_transactions(tx_hash)
             for txid in to_remove:
@@ -377,19 +439,20 @@ class AddressSynchronizer(Logger, EventListener):
                     if spending_txid == tx_hash:
                         self.db.remove_spent_outpoint(prevout_hash, prevout_n)
 
-        with self.lock, self.transaction_lock:
+        with self.lock, self._writing_utxo_index():
             self.logger.info(f"removing tx from history {tx_hash}")
             tx = self.db.remove_transaction(tx_hash)
             remove_from_spent_outpoints()
             self._remove_tx_from_local_history(tx_hash)
-            for addr in itertools.chain(self.db.get_txi_addresses(tx_hash), self.db.get_txo_addresses(tx_hash)):
-                self._get_balance_cache.clear()  # invalidate cache
+            self._remove_tx_from_utxo_index(tx_hash)
+            self._balance_cache_is_stale = True
             self.db.remove_txi(tx_hash)
             self.db.remove_txo(tx_hash)
             self.db.remove_tx_fee(tx_hash)
             self.db.remove_verified_tx(tx_hash)
             self.unverified_tx.pop(tx_hash, None)
             self.unconfirmed_tx.pop(tx_hash, None)
+            self._mark_history_index_dirty(tx_hash)
             if tx:
                 for idx, txo in enumerate(tx.outputs()):
                     scripthash = bitcoin.script_to_scripthash(txo.scriptpubkey.hex())
@@ -419,9 +482,10 @@ class AddressSynchronizer(Logger, EventListener):
                     self.unverified_tx.pop(tx_hash, None)
                     self.unconfirmed_tx.pop(tx_hash, None)
                     self.db.remove_verified_tx(tx_hash)
+                    self._mark_history_index_dirty(tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
-            self.db.set_addr_history(addr, hist)
+            self.db.set_addr_history(addr, hist, status=history_status(hist))
 
         for tx_hash, tx_height in hist:
             # add it in case it was previously unconfirmed
@@ -442,6 +506,34 @@ class AddressSynchronizer(Logger, EventListener):
         self._address_history_changed_events = defaultdict(asyncio.Event)  # address -> Event
         for txid in itertools.chain(self.db.list_txi(), self.db.list_txo()):
             self._add_tx_to_local_history(txid)
+        # the synchronizer compares the stored status of each address with the server's
+        for addr in self.db.list_addrs_without_history_status():
+            hist = self.db.get_addr_history(addr)
+            if hist != ['*']:
+                self.db.set_addr_history_status(addr, history_status(hist))
+        self.load_utxo_index()
+
+    @profiler
+    def load_utxo_index(self):
+        # The working copy of the index, only accessed with the transaction_lock.
+        # Readers use self._utxo_snapshot, see _writing_utxo_index.
+        self._addr_utxos = {}  # type: Dict[str, Dict[str, Tuple[int, bool]]]  # address -> prevout -> (value, is_cb)
+        self._spent_txos = {}  # type: Dict[str, str]  # prevout -> spending txid, only for our outputs
+        self._utxo_snapshot = UtxoIndexSnapshot.empty()
+        self._utxo_index_changed_addrs = set()  # type: Set[str]
+        # addresses whose coins may be counted differently, e.g. after a tx got mined
+        self._balance_changed_addrs = set()  # type: Set[str]
+        self._balance_cache_is_stale = False
+        self._utxo_index_num_writers = 0
+        with self._writing_utxo_index():
+            for txid in self.db.list_txi():
+                for addr in self.db.get_txi_addresses(txid):
+                    for prevout_str, v in self.db.get_txi_addr(txid, addr):
+                        self._add_txi_to_utxo_index(txid, addr, prevout_str)
+            for txid in self.db.list_txo():
+                for addr in self.db.get_txo_addresses(txid):
+                    for n, (v, is_cb) in self.db.get_txo_addr(txid, addr).items():
+                        self._add_txo_to_utxo_index(addr, txid + ':%d'%n, v, is_cb)
 
     @profiler
     def check_history(self):
@@ -466,10 +558,13 @@ class AddressSynchronizer(Logger, EventListener):
 
     def clear_history(self):
         with self.lock:
-            with self.transaction_lock:
+            with self._writing_utxo_index():
                 self.db.clear_history()
                 self._history_local.clear()
-                self._get_balance_cache.clear()  # invalidate cache
+                self._history_indexes.clear()
+                self._utxo_index_changed_addrs |= set(self._addr_utxos)
+                self._addr_utxos.clear()
+                self._spent_txos.clear()
 
     def get_txpos(self, tx_hash: str) -> Tuple[int, int]:
         """Returns (height, txpos) tuple, even if the tx is unverified."""
@@ -504,42 +599,120 @@ class AddressSynchronizer(Logger, EventListener):
                 self.threadlocal_cache.local_height = orig_val
         return f
 
-    @with_lock
-    @with_transaction_lock
     @with_local_height_cached
-    def get_history(self, domain) -> Sequence[HistoryItem]:
-        domain = set(domain)
-        # 1. Get the history of each address in the domain, maintain the
-        #    delta of a tx as the sum of its deltas on domain addresses
-        tx_deltas = defaultdict(int)  # type: Dict[str, int]
-        for addr in domain:
-            h = self.get_address_history(addr)
-            for tx_hash, height in h:
-                tx_deltas[tx_hash] += self.get_tx_delta(tx_hash, addr)
-        # 2. create sorted history
-        history = []
-        for tx_hash in tx_deltas:
-            delta = tx_deltas[tx_hash]
-            tx_mined_status = self.get_tx_height(tx_hash)
-            fee = self.get_tx_fee(tx_hash)
-            history.append((tx_hash, tx_mined_status, delta, fee))
-        history.sort(key = lambda x: self.get_txpos(x[0]))
-        # 3. add balance
-        h2 = []
-        balance = 0
-        for tx_hash, tx_mined_status, delta, fee in history:
-            balance += delta
-            h2.append(HistoryItem(
+    def get_history(
+            self,
+            domain,
+            *,
+            from_height: int = None,
+            to_height: int = None,
+            after: Tuple[Tuple[int, int], str] = None,
+            limit: int = None,
+            newest_first: bool = False,
+    ) -> Sequence[HistoryItem]:
+        """Returns the history of domain, sorted by txpos.
+
+        Only txs mined in [from_height, to_height) are returned. Txs that are
+        not mined are sorted after all mined txs, so they are included with
+        from_height and excluded with to_height. With limit, at most that many
+        items are returned, starting from the oldest (or the newest one if
+        newest_first). after is the (txpos, txid) of an item, and only the items
+        that come after it, in the order they are returned, are included.
+        """
+        with self.lock, self.transaction_lock:
+            index = self._get_history_index(domain)
+            start, stop = 0, len(index.keys)
+            if from_height is not None:
+                start = bisect.bisect_left(index.keys, ((from_height,),))
+            if to_height is not None:
+                stop = bisect.bisect_left(index.keys, ((to_height,),))
+            if after is not None and not newest_first:
+                start = max(start, bisect.bisect_right(index.keys, tuple(after)))
+            if after is not None and newest_first:
+                stop = min(stop, bisect.bisect_left(index.keys, tuple(after)))
+            stop = max(start, stop)
+            positions = range(start, stop)
+            if newest_first:
+                positions = reversed(positions)
+            if limit is not None:
+                positions = itertools.islice(positions, limit)
+            # copy the entries, as the index is updated in place by writers
+            entries = [(index.keys[i][1], index.deltas[index.keys[i][1]], index.balances[i], index.monotonic_timestamps[i])
+                       for i in positions]
+        # the items are built without holding the locks, so that we do not block incoming txs
+        h = []
+        for tx_hash, delta, balance, monotonic_timestamp in entries:
+            h.append(HistoryItem(
                 txid=tx_hash,
-                tx_mined_status=tx_mined_status,
+                tx_mined_status=self.get_tx_height(tx_hash),
                 delta=delta,
-                fee=fee,
-                balance=balance))
+                fee=self.get_tx_fee(tx_hash),
+                balance=balance,
+                monotonic_timestamp=monotonic_timestamp))
+        return h
+
+    def _get_history_index(self, domain) -> HistoryIndex:
+        domain = set(domain)
+        key = sha256(','.join(sorted(domain)))
+        index = self._history_indexes.pop(key, None)
+        if index is None:
+            index = HistoryIndex(domain)
+            for addr in domain:
+                index.dirty |= self._history_local.get(addr, set())
+        # keep the most recently used indexes only
+        self._history_indexes[key] = index
+        while len(self._history_indexes) > 10:
+            self._history_indexes.pop(next(iter(self._history_indexes)))
+        if not index.dirty:
+            return index
+        # 1. remove the entries of dirty txs
+        removed = []
+        for tx_hash in index.dirty:
+            if tx_hash in index.txpos:
+                removed.append((index.txpos.pop(tx_hash), tx_hash))
+                del index.deltas[tx_hash]
+        # 2. compute the delta of dirty txs as the sum of their deltas on domain addresses
+        added = []
+        for tx_hash in index.dirty:
+            addrs = set(self.db.get_txi_addresses(tx_hash)) | set(self.db.get_txo_addresses(tx_hash))
+            addrs &= domain
+            if not addrs:
+                continue
+            index.deltas[tx_hash] = sum(self.get_tx_delta(tx_hash, addr) for addr in addrs)
+            index.txpos[tx_hash] = self.get_txpos(tx_hash)
+            added.append((index.txpos[tx_hash], tx_hash))
+        index.dirty.clear()
+        # 3. update sorted keys
+        if len(removed) + len(added) > len(index.keys) // 8:
+            index.keys = sorted((txpos, tx_hash) for tx_hash, txpos in index.txpos.items())
+            first_changed = 0
+        else:
+            first_changed = len(index.keys)
+            for item in removed:
+                i = bisect.bisect_left(index.keys, item)
+                del index.keys[i]
+                first_changed = min(first_changed, i)
+            for item in added:
+                i = bisect.bisect_left(index.keys, item)
+                index.keys.insert(i, item)
+                first_changed = min(first_changed, i)
+        # 4. update running balances and timestamps
+        del index.balances[first_changed:]
+        del index.monotonic_timestamps[first_changed:]
+        balance = index.balances[-1] if index.balances else 0
+        monotonic_timestamp = index.monotonic_timestamps[-1] if index.monotonic_timestamps else 0
+        for txpos, tx_hash in index.keys[first_changed:]:
+            balance += index.deltas[tx_hash]
+            index.balances.append(balance)
+            timestamp = self.get_tx_height(tx_hash).timestamp
+            monotonic_timestamp = max(monotonic_timestamp, timestamp or MAX_TIMESTAMP)
+            index.monotonic_timestamps.append(monotonic_timestamp)
         # sanity check
         c, u, x = self.get_balance(domain)
         if balance != c + u + x:
+            self._history_indexes.clear()
             raise Exception("wallet.get_history() failed balance sanity-check")
-        return h2
+        return index
 
     def _add_tx_to_local_history(self, txid):
         with self.transaction_lock:
@@ -548,6 +721,7 @@ class AddressSynchronizer(Logger, EventListener):
                 cur_hist.add(txid)
                 self._history_local[addr] = cur_hist
                 self._mark_address_history_changed(addr)
+            self._mark_history_index_dirty(txid)
 
     def _remove_tx_from_local_history(self, txid):
         with self.transaction_lock:
@@ -560,6 +734,127 @@ class AddressSynchronizer(Logger, EventListener):
                 else:
                     self._history_local[addr] = cur_hist
                     self._mark_address_history_changed(addr)
+            self._mark_history_index_dirty(txid)
+
+    @contextmanager
+    def _writing_utxo_index(self):
+        """Takes the transaction_lock to change the utxo index.
+        The changes are published to readers at once, as a new snapshot,
+        when the outermost of these contexts exits.
+        """
+        with self.transaction_lock:
+            self._utxo_index_num_writers += 1
+            try:
+                yield
+            finally:
+                self._utxo_index_num_writers -= 1
+                if self._utxo_index_num_writers == 0:
+                    self._publish_utxo_snapshot()
+
+    def _publish_utxo_snapshot(self) -> None:
+        if (not self._utxo_index_changed_addrs and not self._balance_changed_addrs
+                and not self._balance_cache_is_stale):
+            return
+        shards = list(self._utxo_snapshot.shards)
+        copied = set()
+        tx_infos = {}  # txid -> (height, confirmed inputs)
+        for addr in self._utxo_index_changed_addrs | self._balance_changed_addrs:
+            i = UtxoIndexSnapshot.get_shard_index(addr)
+            if i not in copied:
+                shards[i] = dict(shards[i])
+                copied.add(i)
+            utxos = self._addr_utxos.get(addr)
+            if utxos:
+                shards[i][addr] = {prevout_str: (value, is_cb) + self._get_utxo_index_tx_info(prevout_str, tx_infos)
+                                   for prevout_str, (value, is_cb) in utxos.items()}
+            else:
+                shards[i].pop(addr, None)
+        # the partial balances of the other shards are still valid
+        if self._balance_cache_is_stale:
+            shard_balances = [{} for i in range(NUM_UTXO_INDEX_SHARDS)]
+        else:
+            shard_balances = list(self._utxo_snapshot.shard_balances)
+            for i in copied:
+                shard_balances[i] = {}
+        self._utxo_index_changed_addrs.clear()
+        self._balance_changed_addrs.clear()
+        self._balance_cache_is_stale = False
+        self._utxo_snapshot = UtxoIndexSnapshot(tuple(shards), tuple(shard_balances))
+
+    def _get_utxo_index_tx_info(self, prevout_str: str,
+                                tx_infos: Dict[str, Tuple[int, Tuple[Tuple[str, int], ...]]]):
+        """Returns the height of the tx that created the coin, and if it is unconfirmed,
+        the inputs of that tx that spend our confirmed coins. Results are stored in tx_infos.
+        """
+        txid = prevout_str.split(':')[0]
+        info = tx_infos.get(txid)
+        if info is None:
+            tx_height = self.get_tx_height(txid).height
+            confirmed_inputs = ()
+            if tx_height <= 0:
+                confirmed_inputs = tuple(
+                    (addr, v) for addr in self.db.get_txi_addresses(txid)
+                    for prevout_str2, v in self.db.get_txi_addr(txid, addr)
+                    if self.get_tx_height(prevout_str2.split(':')[0]).height > 0)
+            info = tx_infos[txid] = (tx_height, confirmed_inputs)
+        return info
+
+    def _mark_balance_changed(self, txid: str) -> None:
+        """Called when the height or the inputs of txid changed. Whether a coin
+        counts as confirmed depends on the height of the tx that created it,
+        and on the heights of the parents of that tx.
+        """
+        with self._writing_utxo_index():
+            for addr in self.db.get_txo_addresses(txid):
+                self._balance_changed_addrs.add(addr)
+                for n in self.db.get_txo_addr(txid, addr):
+                    child_txid = self._spent_txos.get(txid + ':%d' % n)
+                    if child_txid:
+                        self._balance_changed_addrs.update(self.db.get_txo_addresses(child_txid))
+
+    def _add_txo_to_utxo_index(self, addr: str, prevout_str: str, value: int, is_cb: bool) -> None:
+        with self._writing_utxo_index():
+            if prevout_str not in self._spent_txos:
+                self._addr_utxos.setdefault(addr, {})[prevout_str] = (value, is_cb)
+                self._utxo_index_changed_addrs.add(addr)
+
+    def _add_txi_to_utxo_index(self, spending_txid: str, addr: str, prevout_str: str) -> None:
+        with self._writing_utxo_index():
+            self._spent_txos[prevout_str] = spending_txid
+            utxos = self._addr_utxos.get(addr)
+            if utxos is not None:
+                utxos.pop(prevout_str, None)
+                self._utxo_index_changed_addrs.add(addr)
+
+    def _remove_tx_from_utxo_index(self, txid: str) -> None:
+        """Undoes the effects of txid on the utxo index.
+        Must be called before the txi and txo of txid are removed from the db.
+        """
+        with self._writing_utxo_index():
+            # coins spent by txid become unspent again
+            for addr in self.db.get_txi_addresses(txid):
+                for prevout_str, v in self.db.get_txi_addr(txid, addr):
+                    if self._spent_txos.get(prevout_str) != txid:
+                        continue
+                    self._spent_txos.pop(prevout_str)
+                    prev_txid, prev_n = prevout_str.split(':')
+                    outputs = self.db.get_txo_addr(prev_txid, addr)
+                    if int(prev_n) in outputs:
+                        value, is_cb = outputs[int(prev_n)]
+                        self._add_txo_to_utxo_index(addr, prevout_str, value, is_cb)
+            # coins created by txid are gone
+            for addr in self.db.get_txo_addresses(txid):
+                utxos = self._addr_utxos.get(addr, {})
+                for n in self.db.get_txo_addr(txid, addr):
+                    utxos.pop(txid + ':%d'%n, None)
+                if not utxos:
+                    self._addr_utxos.pop(addr, None)
+                self._utxo_index_changed_addrs.add(addr)
+
+    def _mark_history_index_dirty(self, txid: str) -> None:
+        """The delta or the position of txid in the history might have changed."""
+        for index in self._history_indexes.values():
+            index.dirty.add(txid)
 
     def _mark_address_history_changed(self, addr: str) -> None:
         def set_and_clear():
@@ -581,12 +876,15 @@ class AddressSynchronizer(Logger, EventListener):
         await self._address_history_changed_events[addr].wait()
 
     def add_unverified_or_unconfirmed_tx(self, tx_hash, tx_height):
+        with self.lock:
+            self._mark_history_index_dirty(tx_hash)
         if self.db.is_in_verified_tx(tx_hash):
             if tx_height <= 0:
                 # tx was previously SPV-verified but now in mempool (probably reorg)
                 with self.lock:
-                    self.db.remove_verified_tx(tx_hash)
                     self.unconfirmed_tx[tx_hash] = tx_height
+                    self.db.remove_verified_tx(tx_hash)
+                    self._mark_balance_changed(tx_hash)
                 if self.verifier:
                     self.verifier.remove_spv_proof_for_tx(tx_hash)
         else:
@@ -595,19 +893,29 @@ class AddressSynchronizer(Logger, EventListener):
                     self.unverified_tx[tx_hash] = tx_height
                 else:
                     self.unconfirmed_tx[tx_hash] = tx_height
+                self._mark_balance_changed(tx_hash)
 
     def remove_unverified_tx(self, tx_hash, tx_height):
         with self.lock:
             new_height = self.unverified_tx.get(tx_hash)
             if new_height == tx_height:
                 self.unverified_tx.pop(tx_hash, None)
+                self._mark_history_index_dirty(tx_hash)
+                self._mark_balance_changed(tx_hash)
 
     def add_verified_tx(self, tx_hash: str, info: TxMinedInfo):
-        # Remove from the unverified map and add to the verified map
+        self.add_verified_txs([(tx_hash, info)])
+
+    def add_verified_txs(self, items: Sequence[Tuple[str, TxMinedInfo]]):
+        # Add to the verified map and remove from the unverified map (in this order, see get_tx_height)
         with self.lock:
-            self.unverified_tx.pop(tx_hash, None)
-            self.db.add_verified_tx(tx_hash, info)
-        util.trigger_callback('adb_added_verified_tx', self, tx_hash)
+            self.db.add_verified_txs(items)
+            for tx_hash, info in items:
+                self.unverified_tx.pop(tx_hash, None)
+                self._mark_history_index_dirty(tx_hash)
+                self._mark_balance_changed(tx_hash)
+        for tx_hash, info in items:
+            util.trigger_callback('adb_added_verified_tx', self, tx_hash)
 
     def get_unverified_txs(self) -> Dict[str, int]:
         '''Returns a map from tx hash to transaction height'''
@@ -624,7 +932,6 @@ class AddressSynchronizer(Logger, EventListener):
                 if tx_height > above_height:
                     header = blockchain.read_header(tx_height)
                     if not header or hash_header(header) != info.header_hash:
-                        self.db.remove_verified_tx(tx_hash)
                         # NOTE: we should add these txns to self.unverified_tx,
                         # but with what height?
                         # If on the new fork after the reorg, the txn is at the
@@ -635,6 +942,9 @@ class AddressSynchronizer(Logger, EventListener):
                         # into unverified_tx with the old height, and if we get
                         # a status update, that will overwrite it.
                         self.unverified_tx[tx_hash] = tx_height
+                        self.db.remove_verified_tx(tx_hash)
+                        self._mark_history_index_dirty(tx_hash)
+                        self._mark_balance_changed(tx_hash)
                         txs.add(tx_hash)
 
         for tx_hash in txs:
@@ -655,26 +965,28 @@ class AddressSynchronizer(Logger, EventListener):
     def get_tx_height(self, tx_hash: str) -> TxMinedInfo:
         if tx_hash is None:  # ugly backwards compat...
             return TxMinedInfo(height=TX_HEIGHT_LOCAL, conf=0)
-        with self.lock:
-            verified_tx_mined_info = self.db.get_verified_tx(tx_hash)
-            if verified_tx_mined_info:
-                conf = max(self.get_local_height() - verified_tx_mined_info.height + 1, 0)
-                return verified_tx_mined_info._replace(conf=conf)
-            elif tx_hash in self.unverified_tx:
-                height = self.unverified_tx[tx_hash]
-                return TxMinedInfo(height=height, conf=0)
-            elif tx_hash in self.unconfirmed_tx:
-                height = self.unconfirmed_tx[tx_hash]
-                return TxMinedInfo(height=height, conf=0)
-            elif tx_hash in self.future_tx:
-                num_blocks_remainining = self.future_tx[tx_hash] - self.get_local_height()
-                if num_blocks_remainining > 0:
-                    return TxMinedInfo(height=TX_HEIGHT_FUTURE, conf=-num_blocks_remainining)
-                else:
-                    return TxMinedInfo(height=TX_HEIGHT_LOCAL, conf=0)
+        # Note: this does not take self.lock, so that readers do not wait for writers.
+        # Writers that move a tx from one of these maps to another add it to the new
+        # map before removing it from the old one, and we look them up in that order.
+        verified_tx_mined_info = self.db.get_verified_tx(tx_hash)
+        if verified_tx_mined_info:
+            conf = max(self.get_local_height() - verified_tx_mined_info.height + 1, 0)
+            return verified_tx_mined_info._replace(conf=conf)
+        height = self.unverified_tx.get(tx_hash)
+        if height is not None:
+            return TxMinedInfo(height=height, conf=0)
+        height = self.unconfirmed_tx.get(tx_hash)
+        if height is not None:
+            return TxMinedInfo(height=height, conf=0)
+        wanted_height = self.future_tx.get(tx_hash)
+        if wanted_height is not None:
+            num_blocks_remainining = wanted_height - self.get_local_height()
+            if num_blocks_remainining > 0:
+                return TxMinedInfo(height=TX_HEIGHT_FUTURE, conf=-num_blocks_remainining)
             else:
-                # local transaction
                 return TxMinedInfo(height=TX_HEIGHT_LOCAL, conf=0)
+        # local transaction
+        return TxMinedInfo(height=TX_HEIGHT_LOCAL, conf=0)
 
     def set_up_to_date(self, up_to_date):
         with self.lock:
@@ -786,26 +1098,33 @@ class AddressSynchronizer(Logger, EventListener):
         out = {}
         for prevout_str, v in coins.items():
             tx_height, value, is_cb = v
-            prevout = TxOutpoint.from_str(prevout_str)
-            utxo = PartialTxInput(prevout=prevout, is_coinbase_output=is_cb)
-            utxo._trusted_address = address
-            utxo._trusted_value_sats = value
-            utxo.block_height = tx_height
+            utxo = self._make_txo(address, prevout_str, value, is_cb, tx_height)
             if prevout_str in spent:
                 txid, height = spent[prevout_str]
                 utxo.spent_txid = txid
                 utxo.spent_height = height
-            else:
-                utxo.spent_txid = None
-                utxo.spent_height = None
-            out[prevout] = utxo
+            out[utxo.prevout] = utxo
         return out
 
+    @staticmethod
+    def _make_txo(address: str, prevout_str: str, value: int, is_cb: bool, tx_height: int) -> PartialTxInput:
+        prevout = TxOutpoint.from_str(prevout_str)
+        utxo = PartialTxInput(prevout=prevout, is_coinbase_output=is_cb)
+        utxo._trusted_address = address
+        utxo._trusted_value_sats = value
+        utxo.block_height = tx_height
+        utxo.spent_txid = None
+        utxo.spent_height = None
+        return utxo
+
     def get_addr_utxo(self, address: str) -> Dict[TxOutpoint, PartialTxInput]:
-        out = self.get_addr_outputs(address)
-        for k, v in list(out.items()):
-            if v.spent_height is not None:
-                out.pop(k)
+        # uses the utxo index, so this does not depend on the size of the address history
+        out = {}
+        for prevout_str, (value, is_cb, snapshot_height, confirmed_inputs) in self._utxo_snapshot.get_addr_utxos(address).items():
+            # not snapshot_height: whether a future tx is still in the future depends on the local height
+            tx_height = self.get_tx_height(prevout_str.split(':')[0]).height
+            utxo = self._make_txo(address, prevout_str, value, is_cb, tx_height)
+            out[utxo.prevout] = utxo
         return out
 
     # return the total amount ever received by an address
@@ -829,53 +1148,64 @@ class AddressSynchronizer(Logger, EventListener):
 
         cache_key = sha256(','.join(sorted(domain)) + ';'
                            + ','.join(sorted(excluded_coins)))
-        cached_value = self._get_balance_cache.get(cache_key)
-        if cached_value:
-            return cached_value
-
-        coins = {}
-        for address in domain:
-            coins.update(self.get_addr_outputs(address))
+        # we read a snapshot of the utxo index, without blocking writers
+        snapshot = self._utxo_snapshot
+        local_height = self.get_local_height()
+        # readers of the same snapshot wait for each other, so that its balance is only computed once
+        with snapshot.balance_cache_lock:
+            cached_value = snapshot.balance_cache.get(cache_key)
+            if cached_value and cached_value[0] == local_height:
+                return cached_value[1]
+            # cache result.
+            # The caches belong to the snapshot, so that a result computed from an old
+            # snapshot is never returned once a transaction is added to/removed from
+            # history. Results are only valid at the local height they were computed
+            # at (maturity...), so new blocks do not need to touch the snapshot.
+            # Only the shards that changed since the previous snapshot are recomputed.
+            addrs_by_shard = defaultdict(list)
+            for address in domain:
+                addrs_by_shard[UtxoIndexSnapshot.get_shard_index(address)].append(address)
+            c = u = x = 0
+            for i, addrs in addrs_by_shard.items():
+                shard_balance = snapshot.shard_balances[i].get(cache_key)
+                if shard_balance is None or shard_balance[0] != local_height:
+                    shard_balance = local_height, self._compute_balance(snapshot, addrs, domain, excluded_coins)
+                    snapshot.shard_balances[i][cache_key] = shard_balance
+                c += shard_balance[1][0]
+                u += shard_balance[1][1]
+                x += shard_balance[1][2]
+            result = c, u, x
+            snapshot.balance_cache[cache_key] = local_height, result
+        return result
 
+    def _compute_balance(self, snapshot: UtxoIndexSnapshot, addresses: Sequence[str], domain: Set[str],
+                         excluded_coins: Set[str]) -> Tuple[int, int, int]:
+        """Returns the balance of the coins of addresses, as counted for domain.
+        Only reads the snapshot, and the local height.
+        """
         c = u = x = 0
         mempool_height = self.get_local_height() + 1  # height of next block
-        for utxo in coins.values():
-            if utxo.spent_height is not None:
-                continue
-            if utxo.prevout.to_str() in excluded_coins:
-                continue
-            v = utxo.value_sats()
-            tx_height = utxo.block_height
-            is_cb = utxo._is_coinbase_output
-            if is_cb and tx_height + COINBASE_MATURITY > mempool_height:
-                x += v
-            elif tx_height > 0:
-                c += v
-            else:
-                txid = utxo.prevout.txid.hex()
-                tx = self.db.get_transaction(txid)
-                assert tx is not None # txid comes from get_addr_io
-                # we look at the outputs that are spent by this transaction
-                # if those outputs are ours and confirmed, we count this coin as confirmed
-                confirmed_spent_amount = 0
-                for txin in tx.inputs():
-                    if txin.prevout in coins:
-                        coin = coins[txin.prevout]
-                        if coin.block_height > 0:
-                            confirmed_spent_amount += coin.value_sats()
-                # Compare amount, in case tx has confirmed and unconfirmed inputs, or is a coinjoin.
-                # (fixme: tx may have multiple change outputs)
-                if confirmed_spent_amount >= v:
+        # only the unspent outputs of the domain are visited, using the utxo index
+        for address in addresses:
+            for prevout_str, (v, is_cb, tx_height, confirmed_inputs) in snapshot.get_addr_utxos(address).items():
+                if prevout_str in excluded_coins:
+                    continue
+                if is_cb and tx_height + COINBASE_MATURITY > mempool_height:
+                    x += v
+                elif tx_height > 0:
                     c += v
                 else:
-                    c += confirmed_spent_amount
-                    u += v - confirmed_spent_amount
-        result = c, u, x
-        # cache result.
-        # Cache needs to be invalidated if a transaction is added to/
-        # removed from history; or on new blocks (maturity...)
-        self._get_balance_cache[cache_key] = result
-        return result
+                    # we look at the outputs that are spent by this transaction
+                    # if those outputs are ours (in domain) and confirmed, we count this coin as confirmed
+                    confirmed_spent_amount = sum(v2 for addr, v2 in confirmed_inputs if addr in domain)
+                    # Compare amount, in case tx has confirmed and unconfirmed inputs, or is a coinjoin.
+                    # (fixme: tx may have multiple change outputs)
+                    if confirmed_spent_amount >= v:
+                        c += v
+                    else:
+                        c += confirmed_spent_amount
+                        u += v - confirmed_spent_amount
+        return c, u, x
 
     @with_local_height_cached
     def get_utxos(
@@ -902,7 +1232,11 @@ class AddressSynchronizer(Logger, EventListener):
             domain = set(domain) - set(excluded_addresses)
         mempool_height = block_height + 1  # height of next block
         for addr in domain:
-            txos = self.get_addr_outputs(addr)
+            if confirmed_spending_only:
+                # we might need outputs that are spent by unconfirmed txs
+                txos = self.get_addr_outputs(addr)
+            else:
+                txos = self.get_addr_utxo(addr)
             for txo in txos.values():
                 if txo.spent_height is not None:
                     if not confirmed_spending_only:
@@ -38,7 +38,7 @@ from .keystore import bip44_derivation, purpose48_derivation, Hardware_KeyStore,
 from .wallet import (Imported_Wallet, Standard_Wallet, Multisig_Wallet,
                      wallet_types, Wallet, Abstract_Wallet)
 from .storage import WalletStorage, StorageEncryptionVersion
-from .wallet_db import WalletDB
+from .wallet_db import WalletDB, create_wallet_db
 from .i18n import _
 from .util import UserCancelled, InvalidPassword, WalletFileException, UserFacingException
 from .simple_config import SimpleConfig
@@ -266,6 +266,8 @@ class BaseWizard(Logger):
             self.add_cosigner_dialog(index=i, run_next=self.on_restore_from_key, is_valid=keystore.is_bip32_key)
 
     def on_restore_from_key(self, text):
+        # generate the used addresses in bulk once we are online
+        self.data['needs_address_discovery'] = True
         k = keystore.from_master_key(text)
         self.on_keystore(k)
 
@@ -516,6 +518,7 @@ class BaseWizard(Logger):
         self.restore_seed_dialog(run_next=f, test=test)
 
     def on_restore_seed(self, seed, seed_type, is_ext):
+        self.data['needs_address_discovery'] = True
         self.seed_type = seed_type if seed_type != 'electrum' else mnemonic.seed_type(seed)
         if self.seed_type == 'bip39':
             def f(passphrase):
@@ -678,9 +681,12 @@ class BaseWizard(Logger):
         pw_args = self.pw_args
         self.pw_args = None  # clean-up so that it can get GC-ed
         storage = WalletStorage(path)
-        if pw_args.encrypt_storage:
+        db_backend = self.config.get('wallet_db_backend', 'json')
+        if pw_args.encrypt_storage and db_backend == 'sqlite':
+            self.logger.info("not encrypting the wallet file: not supported for sqlite wallets")
+        elif pw_args.encrypt_storage:
             storage.set_password(pw_args.password, enc_version=pw_args.storage_enc_version)
-        db = WalletDB('', manual_upgrades=False)
+        db = create_wallet_db(db_backend=db_backend)
         db.set_keystore_encryption(bool(pw_args.password) and pw_args.encrypt_keystore)
         for key, value in self.data.items():
             db.put(key, value)
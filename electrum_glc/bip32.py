@@ -96,6 +96,23 @@ def _CKD_pub(parent_pubkey: bytes, parent_chaincode: bytes, child_index: bytes)
     return child_pubkey, child_chaincode
 
 
+def CKD_pub_range(parent_pubkey: bytes, parent_chaincode: bytes, start: int, stop: int) -> List[bytes]:
+    """Like CKD_pub, for the children range(start, stop) of the same parent,
+    but only returns their pubkeys. The parent pubkey is parsed only once.
+    """
+    if start < 0: raise ValueError('the bip32 index needs to be non-negative')
+    if stop > BIP32_PRIME: raise Exception('not possible to derive hardened child from parent pubkey')
+    tweaks = [hmac_oneshot(parent_chaincode, parent_pubkey + child_index.to_bytes(length=4, byteorder="big"),
+                           hashlib.sha512)[0:32]
+              for child_index in range(start, stop)]
+    pubkeys = ecc.ECPubkey(parent_pubkey).tweak_add_many(tweaks)
+    for i, pubkey in enumerate(pubkeys):
+        if pubkey is None:
+            # invalid child: CKD_pub raises the same exception as it would for this index alone
+            CKD_pub(parent_pubkey, parent_chaincode, start + i)
+    return pubkeys
+
+
 def xprv_header(xtype: str, *, net=None) -> bytes:
     if net is None:
         net = constants.net
@@ -201,8 +201,8 @@ def rev_hex(s: str) -> str:
     return bh2u(bfh(s)[::-1])
 
 
-def int_to_hex(i: int, length: int=1) -> str:
-    """Converts int to little-endian hex string.
+def int_to_bytes(i: int, length: int=1) -> bytes:
+    """Converts int to little-endian bytes.
     `length` is the number of bytes available
     """
     if not isinstance(i, int):
@@ -213,9 +213,14 @@ def int_to_hex(i: int, length: int=1) -> str:
     if i < 0:
         # two's complement
         i = range_size + i
-    s = hex(i)[2:].rstrip('L')
-    s = "0"*(2*length - len(s)) + s
-    return rev_hex(s)
+    return i.to_bytes(length, byteorder="little")
+
+
+def int_to_hex(i: int, length: int=1) -> str:
+    """Converts int to little-endian hex string.
+    `length` is the number of bytes available
+    """
+    return int_to_bytes(i, length).hex()
 
 def script_num_to_hex(i: int) -> str:
     """See CScriptNum in Bitcoin Core.
@@ -241,19 +246,23 @@ def script_num_to_hex(i: int) -> str:
     return bh2u(result)
 
 
-def var_int(i: int) -> str:
+def var_int_bytes(i: int) -> bytes:
     # https://en.bitcoin.it/wiki/Protocol_specification#Variable_length_integer
     # https://github.com/bitcoin/bitcoin/blob/efe1ee0d8d7f82150789f1f6840f139289628a2b/src/serialize.h#L247
     # "CompactSize"
     assert i >= 0, i
     if i<0xfd:
-        return int_to_hex(i)
+        return bytes((i,))
     elif i<=0xffff:
-        return "fd"+int_to_hex(i,2)
+        return b"\xfd"+int_to_bytes(i,2)
     elif i<=0xffffffff:
-        return "fe"+int_to_hex(i,4)
+        return b"\xfe"+int_to_bytes(i,4)
     else:
-        return "ff"+int_to_hex(i,8)
+        return b"\xff"+int_to_bytes(i,8)
+
+
+def var_int(i: int) -> str:
+    return var_int_bytes(i).hex()
 
 
 def witness_push(item: str) -> str:
@@ -460,13 +469,17 @@ def script_to_address(script: str, *, net=None) -> str:
 
 def address_to_script(addr: str, *, net=None) -> str:
     if net is None: net = constants.net
-    if not is_address(addr, net=net):
-        raise BitcoinException(f"invalid bitcoin address: {addr}")
-    witver, witprog = segwit_addr.decode_segwit_address(net.SEGWIT_HRP, addr)
+    # decoding bech32 is slow: only do it once, instead of via is_address
+    try:
+        witver, witprog = segwit_addr.decode_segwit_address(net.SEGWIT_HRP, addr)
+    except Exception:
+        witprog = None
     if witprog is not None:
         if not (0 <= witver <= 16):
             raise BitcoinException(f'impossible witness version: {witver}')
         return construct_script([witver, bytes(witprog)])
+    if not is_b58_address(addr, net=net):
+        raise BitcoinException(f"invalid bitcoin address: {addr}")
     addrtype, hash_160_ = b58_address_to_hash160(addr)
     if addrtype == net.ADDRTYPE_P2PKH:
         script = pubkeyhash_to_p2pkh_script(bh2u(hash_160_))
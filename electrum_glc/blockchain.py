@@ -20,10 +20,16 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import asyncio
+import concurrent.futures
+import json
+import mmap
+import multiprocessing
 import os
+import sys
 import threading
 import time
-from typing import Optional, Dict, Mapping, Sequence
+from typing import Optional, Dict, Mapping, Sequence, BinaryIO
 
 from . import util
 from .bitcoin import hash_encode, int_to_hex, rev_hex
@@ -32,18 +38,22 @@ from . import constants
 from .util import bfh, bh2u, with_lock
 from .simple_config import SimpleConfig
 from .logging import get_logger, Logger
+from . import scrypt
 
-try:
-    import scrypt
-    getPoWHash = lambda x: scrypt.hash(x, x, N=1024, r=1, p=1, buflen=32)
-except ImportError:
+if not scrypt.has_fast_backend():
     util.print_msg("Warning: package scrypt not available; synchronization could be very slow")
-    from .scrypt import scrypt_1024_1_1_80 as getPoWHash
+getPoWHash = scrypt.scrypt_1024_1_1_80_fast
 
 
 _logger = get_logger(__name__)
 
 HEADER_SIZE = 80  # bytes
+HASH_SIZE = 32  # bytes
+
+# headers appended by save_header are buffered in memory and written out in one go,
+# once this many are pending, or the oldest pending one is this old, or at shutdown.
+WRITE_BUFFER_MAX_HEADERS = 2016
+WRITE_BUFFER_MAX_AGE = 10  # seconds
 
 # see https://github.com/bitcoin/bitcoin/blob/feedb9c84e72e4fff489810a2bbeec09bcda5763/src/chainparams.cpp#L76
 MAX_TARGET = 0x00000fffffffffffffffffffffffffffffffffffffffffffffffffffffffffff
@@ -95,6 +105,53 @@ def pow_hash_header(header):
     return hash_encode(getPoWHash(bfh(serialize_header(header))))
 
 
+# persistent pool of worker processes used to compute PoW hashes in parallel.
+# created on first use, see get_pow_executor
+_pow_executor = None  # type: Optional[concurrent.futures.Executor]
+_pow_executor_num_workers = 0
+_pow_executor_lock = threading.Lock()
+
+
+def get_num_verification_workers(config: 'SimpleConfig') -> int:
+    """Number of worker processes used to verify the PoW of header chunks.
+    0 or 1 means headers are hashed in-process.
+    """
+    num_workers = config.get('header_verification_workers', None)
+    if num_workers is None:
+        if 'ANDROID_DATA' in os.environ:
+            return 0
+        # frozen builds only use worker processes if enabled in the config
+        if getattr(sys, 'frozen', False):
+            return 0
+        return os.cpu_count() or 0
+    return max(0, int(num_workers))
+
+
+def get_pow_executor(num_workers: int) -> Optional[concurrent.futures.Executor]:
+    global _pow_executor, _pow_executor_num_workers
+    if num_workers <= 1:
+        return None
+    with _pow_executor_lock:
+        if _pow_executor is not None and _pow_executor_num_workers != num_workers:
+            _pow_executor.shutdown(wait=False)
+            _pow_executor = None
+        if _pow_executor is None:
+            # note: forking a process that runs threads (asyncio loop, GUI) is unsafe
+            _pow_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context('spawn'))
+            _pow_executor_num_workers = num_workers
+        return _pow_executor
+
+
+def shutdown_pow_executor() -> None:
+    global _pow_executor
+    with _pow_executor_lock:
+        if _pow_executor is not None:
+            _pow_executor.shutdown(wait=False)
+            _pow_executor = None
+
+
 # key: blockhash hex at forkpoint
 # the chain at some key is the best chain that includes the given hash
 blockchains = {}  # type: Dict[str, Blockchain]
@@ -113,6 +170,7 @@ def read_blockchains(config: 'SimpleConfig'):
         header_after_cp = best_chain.read_header(constants.net.max_checkpoint()+1)
         if not header_after_cp or not best_chain.can_connect(header_after_cp, check_height=False):
             _logger.info("[blockchain] deleting best chain. cannot connect header after last cp to last cp.")
+            best_chain.close_file()
             os.unlink(best_chain.path())
             best_chain.update_size()
     # forks
@@ -150,9 +208,11 @@ def read_blockchains(config: 'SimpleConfig'):
         # consistency checks
         h = b.read_header(b.forkpoint)
         if first_hash != hash_header(h):
+            b.close_file()
             delete_chain(filename, "incorrect first hash for chain")
             return
         if not b.parent.can_connect(h, check_height=False):
+            b.close_file()
             delete_chain(filename, "cannot connect chain to parent")
             return
         chain_id = b.get_id()
@@ -162,14 +222,130 @@ def read_blockchains(config: 'SimpleConfig'):
     for filename in l:
         instantiate_chain(filename)
 
+    load_chainwork_cache(config)
+
 
 def get_best_chain() -> 'Blockchain':
     return blockchains[constants.net.GENESIS]
 
+
+def flush_stale_write_buffers() -> None:
+    with blockchains_lock: chains = list(blockchains.values())
+    for chain in chains:
+        chain.maybe_flush_write_buffer()
+    if chains:
+        save_chainwork_cache(chains[0].config)
+
+
+def close_headers_files() -> None:
+    """Writes out all buffered headers and closes the headers files. Call at shutdown."""
+    with blockchains_lock: chains = list(blockchains.values())
+    for chain in chains:
+        chain.close_file()
+    if chains:
+        save_chainwork_cache(chains[0].config, force=True)
+
 # block hash -> chain work; up to and including that block
 _CHAINWORK_CACHE = {
     "0000000000000000000000000000000000000000000000000000000000000000": 0,  # virtual block at height -1
 }  # type: Dict[str, int]
+# hash of last block of a retarget period -> target of the next period
+_TARGET_CACHE = {}  # type: Dict[str, int]
+# hash of last block of a retarget period -> its height. these are persisted in the chainwork cache file,
+# together with the targets
+_RETARGET_HEIGHTS = {}  # type: Dict[str, int]
+_chainwork_cache_dirty = False
+_chainwork_cache_save_time = 0.0
+CHAINWORK_CACHE_SAVE_INTERVAL = 60  # seconds
+
+
+def _add_to_retarget_caches(height: int, block_hash: str, *, chainwork: int = None, target: int = None) -> None:
+    global _chainwork_cache_dirty
+    _RETARGET_HEIGHTS[block_hash] = height
+    if chainwork is not None:
+        _CHAINWORK_CACHE[block_hash] = chainwork
+    if target is not None and _TARGET_CACHE.get(block_hash) != target:
+        _TARGET_CACHE[block_hash] = target
+        # only the targets are persisted
+        _chainwork_cache_dirty = True
+
+
+def _get_chainwork_cache_path(config: 'SimpleConfig') -> str:
+    return os.path.join(util.get_headers_dir(config), 'blockchain_headers.chainwork')
+
+
+def load_chainwork_cache(config: 'SimpleConfig') -> None:
+    """Loads the (height, hash, target) entries of retarget periods,
+    as saved by save_chainwork_cache, and recomputes the chainwork from them.
+    An entry is only used if one of our chains has that hash at that height,
+    and the target matches the one computed from the headers of that period.
+    """
+    path = _get_chainwork_cache_path(config)
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        entries = [(int(height), str(block_hash), target)
+                   for height, block_hash, target in entries]
+    except (OSError, ValueError, TypeError) as e:
+        _logger.info(f"[blockchain] ignoring chainwork cache: {e!r}")
+        return
+    with blockchains_lock: chains = list(blockchains.values())
+    num_valid = 0
+    for height, block_hash, target in entries:
+        if (height + 1) % 2016 != 0 or not isinstance(target, int):
+            continue
+        if not any(chain.check_hash(height, block_hash)
+                   and _cached_target_matches_headers(chain, height, target)
+                   for chain in chains):
+            continue
+        # note: these are already on disk, so the cache is not marked dirty
+        _RETARGET_HEIGHTS[block_hash] = height
+        _TARGET_CACHE[block_hash] = target
+        num_valid += 1
+    _logger.info(f"[blockchain] loaded chainwork cache. {num_valid} of {len(entries)} entries are valid")
+    # chainwork is not persisted, as it is cheap to sum up from the targets
+    for chain in chains:
+        chain._update_chainwork_cache()
+
+
+def _cached_target_matches_headers(chain: 'Blockchain', height: int, target: int) -> bool:
+    # note: the bits of the next header cannot be used to check the target, as
+    #       Goldcoin retargets differently. verify_header only checks the PoW of
+    #       each header against its own bits.
+    try:
+        return chain.compute_target(height // 2016) == target
+    except MissingHeader:
+        return False
+
+
+def save_chainwork_cache(config: 'SimpleConfig', *, force: bool = False) -> None:
+    """Persists the target cache, if it changed.
+    Unless force is set, this is rate-limited to once per CHAINWORK_CACHE_SAVE_INTERVAL.
+    """
+    global _chainwork_cache_dirty, _chainwork_cache_save_time
+    if not _chainwork_cache_dirty:
+        return
+    now = time.monotonic()
+    if not force and now - _chainwork_cache_save_time < CHAINWORK_CACHE_SAVE_INTERVAL:
+        return
+    _chainwork_cache_dirty = False
+    _chainwork_cache_save_time = now
+    heights = dict(_RETARGET_HEIGHTS)
+    entries = [(height, block_hash, _TARGET_CACHE[block_hash])
+               for block_hash, height in sorted(heights.items(), key=lambda x: x[1])
+               if block_hash in _TARGET_CACHE]
+    path = _get_chainwork_cache_path(config)
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except OSError as e:
+        _logger.info(f"[blockchain] failed to save chainwork cache: {e!r}")
 
 
 def init_headers_file_for_best_chain():
@@ -177,6 +353,7 @@ def init_headers_file_for_best_chain():
     filename = b.path()
     length = HEADER_SIZE * len(constants.net.CHECKPOINTS) * 2016
     if not os.path.exists(filename) or os.path.getsize(filename) < length:
+        b.close_file()
         with open(filename, 'wb') as f:
             if length > 0:
                 f.seek(length - 1)
@@ -205,6 +382,19 @@ class Blockchain(Logger):
         self._forkpoint_hash = forkpoint_hash  # blockhash at forkpoint. "first hash"
         self._prev_hash = prev_hash  # blockhash immediately before forkpoint
         self.lock = threading.RLock()
+        # read-only map of our headers file, (re)created on demand in _get_mmap
+        self._mmap = None  # type: Optional[mmap.mmap]
+        # chunk index -> sha256d of the headers in that chunk, filled lazily.
+        # all-zero entries are not computed yet.
+        self._hash_index = {}  # type: Dict[int, bytearray]
+        # our headers file, kept open between writes
+        self._file = None  # type: Optional[BinaryIO]
+        self._file_path = None  # type: Optional[str]
+        # headers appended by save_header that are not written to our headers file yet
+        self._write_buffer = bytearray()
+        self._write_buffer_time = None  # type: Optional[float]
+        self._needs_fsync = False  # see write(fsync=False)
+        self._truncate_partial_header()
         self.update_size()
 
     @property
@@ -301,17 +491,35 @@ class Blockchain(Logger):
     def update_size(self) -> None:
         p = self.path()
         self._size = os.path.getsize(p)//HEADER_SIZE if os.path.exists(p) else 0
+        self._size += len(self._write_buffer) // HEADER_SIZE
+
+    def _truncate_partial_header(self) -> None:
+        """Crash recovery: if we were interrupted while writing a header,
+        drop the incomplete header at the end of the file.
+        """
+        p = self.path()
+        if not os.path.exists(p):
+            return
+        size = os.path.getsize(p)
+        if size % HEADER_SIZE == 0:
+            return
+        self.logger.warning(f"truncating partially written header at end of {p}")
+        with open(p, 'rb+') as f:
+            f.truncate(size - size % HEADER_SIZE)
+            f.flush()
+            os.fsync(f.fileno())
 
     @classmethod
-    def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None) -> None:
+    def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None,
+                      *, pow_hash: str = None) -> None:
         _hash = hash_header(header)
-        _powhash = pow_hash_header(header)
         if expected_header_hash and expected_header_hash != _hash:
             raise Exception("hash mismatches with expected: {} vs {}".format(expected_header_hash, _hash))
         if prev_hash != header.get('prev_block_hash'):
             raise Exception("prev hash mismatch: %s vs %s" % (prev_hash, header.get('prev_block_hash')))
         if constants.net.TESTNET:
             return
+        _powhash = pow_hash if pow_hash is not None else pow_hash_header(header)
         # bits = cls.target_to_bits(target)
         # if bits != header.get('bits'):
         #     raise Exception("bits mismatch: %s vs %s" % (bits, header.get('bits')))
@@ -325,11 +533,39 @@ class Blockchain(Logger):
         if block_hash_as_num > target:
             raise InvalidHeader(f"insufficient proof of work: {block_hash_as_num} vs target {target}")
 
-    def verify_chunk(self, index: int, data: bytes) -> None:
+    async def compute_pow_hashes(self, data: bytes) -> Optional[bytes]:
+        """Returns the concatenated PoW hashes of the headers in data,
+        to be passed to verify_chunk. The work is split across the worker
+        processes of the verification pool, if enabled.
+        """
+        if constants.net.TESTNET:
+            return None  # PoW is not checked
+        num = len(data) // HEADER_SIZE
+        data = bytes(data[:num*HEADER_SIZE])
+        num_workers = get_num_verification_workers(self.config)
+        executor = get_pow_executor(num_workers)
+        if executor is None or num <= 1:
+            return scrypt.scrypt_1024_1_1_80_batch(data)
+        loop = asyncio.get_running_loop()
+        per_worker = -(-num // num_workers)
+        futures = [loop.run_in_executor(executor, scrypt.scrypt_1024_1_1_80_batch,
+                                        data[start*HEADER_SIZE : (start+per_worker)*HEADER_SIZE])
+                   for start in range(0, num, per_worker)]
+        return b''.join(await asyncio.gather(*futures))
+
+    def verify_chunk(self, index: int, data: bytes, *, pow_hashes: bytes = None) -> None:
+        """Checks the prev-hash linkage of the headers in data,
+        and their PoW unless pow_hashes (see compute_pow_hashes) is given.
+        """
         num = len(data) // HEADER_SIZE
         start_height = index * 2016
         prev_hash = self.get_hash(start_height - 1)
         target = self.get_target(index-1)
+        if pow_hashes is None and not constants.net.TESTNET:
+            # hash the whole chunk at once; much faster than one header at a time
+            pow_hashes = scrypt.scrypt_1024_1_1_80_batch(data[:num*HEADER_SIZE])
+        if pow_hashes is not None and len(pow_hashes) != num * scrypt.HASH_SIZE:
+            raise Exception(f"unexpected number of pow hashes: {len(pow_hashes)} for {num} headers")
         for i in range(num):
             height = start_height + i
             try:
@@ -338,7 +574,10 @@ class Blockchain(Logger):
                 expected_header_hash = None
             raw_header = data[i*HEADER_SIZE : (i+1)*HEADER_SIZE]
             header = deserialize_header(raw_header, index*2016 + i)
-            self.verify_header(header, prev_hash, target, expected_header_hash)
+            pow_hash = None
+            if pow_hashes is not None:
+                pow_hash = hash_encode(pow_hashes[i*scrypt.HASH_SIZE : (i+1)*scrypt.HASH_SIZE])
+            self.verify_header(header, prev_hash, target, expected_header_hash, pow_hash=pow_hash)
             prev_hash = hash_header(header)
 
     @with_lock
@@ -355,13 +594,13 @@ class Blockchain(Logger):
         return os.path.join(d, filename)
 
     @with_lock
-    def save_chunk(self, index: int, chunk: bytes):
+    def save_chunk(self, index: int, chunk: bytes, *, fsync: bool = True):
         assert index >= 0, index
         chunk_within_checkpoint_region = index < len(self.checkpoints)
         # chunks in checkpoint region are the responsibility of the 'main chain'
         if chunk_within_checkpoint_region and self.parent is not None:
             main_chain = get_best_chain()
-            main_chain.save_chunk(index, chunk)
+            main_chain.save_chunk(index, chunk, fsync=fsync)
             return
 
         delta_height = (index * 2016 - self.forkpoint)
@@ -372,8 +611,18 @@ class Blockchain(Logger):
             chunk = chunk[-delta_bytes:]
             delta_bytes = 0
         truncate = not chunk_within_checkpoint_region
-        self.write(chunk, delta_bytes, truncate)
+        self.write(chunk, delta_bytes, truncate, fsync=fsync)
         self.swap_with_parent()
+        self._update_chainwork_cache()
+
+    def _update_chainwork_cache(self) -> None:
+        """Extends the chainwork and target caches to the retarget periods we just completed."""
+        if constants.net.TESTNET:
+            return
+        try:
+            self.get_chainwork()
+        except MissingHeader:
+            pass
 
     def swap_with_parent(self) -> None:
         with self.lock, blockchains_lock:
@@ -410,6 +659,8 @@ class Blockchain(Logger):
         # swap files
         # child takes parent's name
         # parent's new name will be something new (not child's old name)
+        self._flush_write_buffer()
+        parent._flush_write_buffer()
         self.assert_headers_file_available(self.path())
         child_old_name = self.path()
         with open(self.path(), 'rb') as f:
@@ -428,6 +679,8 @@ class Blockchain(Logger):
         self._forkpoint_hash, parent._forkpoint_hash = parent._forkpoint_hash, hash_raw_header(bh2u(parent_data[:HEADER_SIZE]))
         self._prev_hash, parent._prev_hash = parent._prev_hash, self._prev_hash
         # parent's new name
+        self._close_file()
+        parent._close_file()
         os.replace(child_old_name, parent.path())
         self.update_size()
         parent.update_size()
@@ -450,19 +703,142 @@ class Blockchain(Logger):
             raise FileNotFoundError('Cannot find headers file but headers_dir is there. Should be at {}'.format(path))
 
     @with_lock
-    def write(self, data: bytes, offset: int, truncate: bool=True) -> None:
+    def invalidate_header_store(self, from_height: int = None) -> None:
+        """Closes the map of our headers file, and forgets the hashes of
+        the headers at and above from_height (all of them by default).
+        Must be called before our headers file is modified other than by appending.
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if from_height is None or from_height <= self.forkpoint:
+            self._hash_index.clear()
+            return
+        first_chunk = from_height // 2016
+        for index in [index for index in self._hash_index if index > first_chunk]:
+            del self._hash_index[index]
+        chunk = self._hash_index.get(first_chunk)
+        if chunk is not None:
+            start = from_height % 2016 * HASH_SIZE
+            chunk[start:] = bytes(len(chunk) - start)
+
+    def _get_mmap(self, min_size: int) -> Optional[mmap.mmap]:
+        """Returns a read-only map of our headers file, spanning at least min_size bytes,
+        or None if the file is shorter than that.
+        """
+        if self._mmap is not None and len(self._mmap) >= min_size:
+            return self._mmap
+        if self._mmap is not None:
+            # the file has grown since we mapped it
+            self._mmap.close()
+            self._mmap = None
+        name = self.path()
+        self.assert_headers_file_available(name)
+        with open(name, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < min_size or size == 0:
+                return None
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _get_file(self) -> BinaryIO:
         filename = self.path()
-        self.assert_headers_file_available(filename)
-        with open(filename, 'rb+') as f:
-            if truncate and offset != self._size * HEADER_SIZE:
-                f.seek(offset)
-                f.truncate()
+        if self._file is not None and self._file_path != filename:
+            self._close_file()
+        if self._file is None:
+            self.assert_headers_file_available(filename)
+            self._file = open(filename, 'rb+')
+            self._file_path = filename
+        return self._file
+
+    def _close_file(self) -> None:
+        self.invalidate_header_store()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_path = None
+
+    @with_lock
+    def close_file(self) -> None:
+        """Writes out buffered headers and closes our headers file.
+        It gets reopened on demand.
+        """
+        if os.path.exists(self.path()):
+            self.fsync()
+        self._write_buffer.clear()
+        self._write_buffer_time = None
+        self._needs_fsync = False
+        self._close_file()
+
+    @with_lock
+    def write(self, data: bytes, offset: int, truncate: bool=True, *, fsync: bool=True) -> None:
+        """Writes data to our headers file at offset.
+        If fsync is False, the caller is responsible for calling fsync() later.
+        """
+        # so that offsets refer to the file
+        self._flush_write_buffer()
+        # note: the map must be closed before truncating, as touching pages
+        #       past the end of the file would crash us (and on Windows mapped files cannot be truncated)
+        self.invalidate_header_store(from_height=self.forkpoint + offset // HEADER_SIZE)
+        f = self._get_file()
+        if truncate and offset != self._size * HEADER_SIZE:
             f.seek(offset)
-            f.write(data)
-            f.flush()
+            f.truncate()
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        if fsync:
             os.fsync(f.fileno())
+            self._needs_fsync = False
+        else:
+            self._needs_fsync = True
         self.update_size()
 
+    @with_lock
+    def _append(self, data: bytes) -> None:
+        """Appends headers through the write buffer."""
+        assert len(data) % HEADER_SIZE == 0, len(data)
+        if not self._write_buffer:
+            self._write_buffer_time = time.monotonic()
+        self._write_buffer += data
+        self._size += len(data) // HEADER_SIZE
+        if len(self._write_buffer) >= WRITE_BUFFER_MAX_HEADERS * HEADER_SIZE:
+            self.fsync()
+        else:
+            self.maybe_flush_write_buffer()
+
+    def _flush_write_buffer(self) -> None:
+        """Writes buffered headers to our headers file, without fsync."""
+        if not self._write_buffer:
+            return
+        data = bytes(self._write_buffer)
+        offset = (self._size - len(data) // HEADER_SIZE) * HEADER_SIZE
+        f = self._get_file()
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        self._write_buffer.clear()
+        self._write_buffer_time = None
+        self._needs_fsync = True
+
+    @with_lock
+    def maybe_flush_write_buffer(self) -> None:
+        if self._write_buffer_time is None:
+            return
+        if time.monotonic() - self._write_buffer_time >= WRITE_BUFFER_MAX_AGE:
+            self.fsync()
+
+    @with_lock
+    def fsync(self) -> None:
+        """Writes out buffered headers, and flushes writes done with
+        write(fsync=False) to disk.
+        """
+        self._flush_write_buffer()
+        if not self._needs_fsync:
+            return
+        os.fsync(self._get_file().fileno())
+        self._needs_fsync = False
+
     @with_lock
     def save_header(self, header: dict) -> None:
         delta = header.get('block_height') - self.forkpoint
@@ -470,29 +846,60 @@ class Blockchain(Logger):
         # headers are only _appended_ to the end:
         assert delta == self.size(), (delta, self.size())
         assert len(data) == HEADER_SIZE
-        self.write(data, delta*HEADER_SIZE)
+        self._append(data)
         self.swap_with_parent()
+        if header.get('block_height') % 2016 == 0:
+            # the previous retarget period is complete
+            self._update_chainwork_cache()
 
     @with_lock
-    def read_header(self, height: int) -> Optional[dict]:
+    def read_raw_header(self, height: int) -> Optional[bytes]:
         if height < 0:
             return
         if height < self.forkpoint:
-            return self.parent.read_header(height)
+            return self.parent.read_raw_header(height)
         if height > self.height():
             return
         delta = height - self.forkpoint
-        name = self.path()
-        self.assert_headers_file_available(name)
-        with open(name, 'rb') as f:
-            f.seek(delta * HEADER_SIZE)
-            h = f.read(HEADER_SIZE)
-            if len(h) < HEADER_SIZE:
-                raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
+        num_headers_in_file = self._size - len(self._write_buffer) // HEADER_SIZE
+        if delta >= num_headers_in_file:
+            start = (delta - num_headers_in_file) * HEADER_SIZE
+            return bytes(self._write_buffer[start:start+HEADER_SIZE])
+        start = delta * HEADER_SIZE
+        m = self._get_mmap(start + HEADER_SIZE)
+        if m is None:
+            raise Exception('Expected to read a full header at height {}'.format(height))
+        h = m[start:start+HEADER_SIZE]
         if h == bytes([0])*HEADER_SIZE:
             return None
+        return h
+
+    def read_header(self, height: int) -> Optional[dict]:
+        h = self.read_raw_header(height)
+        if h is None:
+            return None
         return deserialize_header(h, height)
 
+    @with_lock
+    def _get_raw_hash(self, height: int) -> bytes:
+        """Returns sha256d of the header at height, using the hash index."""
+        if self.forkpoint > height >= 0:
+            return self.parent._get_raw_hash(height)
+        chunk = self._hash_index.get(height // 2016)
+        start = height % 2016 * HASH_SIZE
+        if chunk is not None:
+            h = bytes(chunk[start:start+HASH_SIZE])
+            if h != bytes(HASH_SIZE):
+                return h
+        raw_header = self.read_raw_header(height)
+        if raw_header is None:
+            raise MissingHeader(height)
+        h = sha256d(raw_header)
+        if chunk is None:
+            chunk = self._hash_index[height // 2016] = bytearray(2016 * HASH_SIZE)
+        chunk[start:start+HASH_SIZE] = h
+        return h
+
     def header_at_tip(self) -> Optional[dict]:
         """Return latest header."""
         height = self.height()
@@ -527,10 +934,7 @@ class Blockchain(Logger):
             h, t, _ = self.checkpoints[index]
             return h
         else:
-            header = self.read_header(height)
-            if header is None:
-                raise MissingHeader(height)
-            return hash_header(header)
+            return hash_encode(self._get_raw_hash(height))
 
     def get_timestamp(self, height):
         if height < len(self.checkpoints) * 2016 and (height+1) % 2016 == 0:
@@ -548,10 +952,23 @@ class Blockchain(Logger):
         if index < len(self.checkpoints):
             h, t, _ = self.checkpoints[index]
             return t
-        # new target
+        last_height = index * 2016 + 2015
+        last_hash = self.get_hash(last_height)
+        cached_target = _TARGET_CACHE.get(last_hash)
+        if cached_target is not None:
+            return cached_target
+        new_target = self.compute_target(index)
+        _add_to_retarget_caches(last_height, last_hash, target=new_target)
+        return new_target
+
+    def compute_target(self, index: int) -> int:
+        """Computes the target of chunk index+1 from the headers of chunk index,
+        without using the target cache.
+        """
+        last_height = index * 2016 + 2015
         # Litecoin: go back the full period unless it's the first retarget
         first_timestamp = self.get_timestamp(index * 2016 - 1 if index > 0 else 0)
-        last = self.read_header(index * 2016 + 2015)
+        last = self.read_header(last_height)
         if not first_timestamp or not last:
             raise MissingHeader()
         bits = last.get('bits')
@@ -562,8 +979,7 @@ class Blockchain(Logger):
         nActualTimespan = min(nActualTimespan, nTargetTimespan * 4)
         new_target = min(MAX_TARGET, (target * nActualTimespan) // nTargetTimespan)
         # not any target can be represented in 32 bits:
-        new_target = self.bits_to_target(self.target_to_bits(new_target))
-        return new_target
+        return self.bits_to_target(self.target_to_bits(new_target))
 
     @classmethod
     def bits_to_target(cls, bits: int) -> int:
@@ -631,7 +1047,7 @@ class Blockchain(Logger):
             work_in_single_header = self.chainwork_of_header_at_height(cached_height)
             work_in_chunk = 2016 * work_in_single_header
             running_total += work_in_chunk
-            _CHAINWORK_CACHE[self.get_hash(cached_height)] = running_total
+            _add_to_retarget_caches(cached_height, self.get_hash(cached_height), chainwork=running_total)
         cached_height += 2016
         work_in_single_header = self.chainwork_of_header_at_height(cached_height)
         work_in_last_partial_chunk = (height % 2016 + 1) * work_in_single_header
@@ -661,12 +1077,12 @@ class Blockchain(Logger):
             return False
         return True
 
-    def connect_chunk(self, idx: int, hexdata: str) -> bool:
+    def connect_chunk(self, idx: int, hexdata: str, *, pow_hashes: bytes = None, fsync: bool = True) -> bool:
         assert idx >= 0, idx
         try:
             data = bfh(hexdata)
-            self.verify_chunk(idx, data)
-            self.save_chunk(idx, data)
+            self.verify_chunk(idx, data, pow_hashes=pow_hashes)
+            self.save_chunk(idx, data, fsync=fsync)
             return True
         except BaseException as e:
             self.logger.info(f'verify_chunk idx {idx} failed: {repr(e)}')
@@ -22,9 +22,10 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import random
 from collections import defaultdict
 from math import floor, log10
-from typing import NamedTuple, List, Callable, Sequence, Union, Dict, Tuple, Mapping, Type
+from typing import NamedTuple, List, Callable, Sequence, Union, Dict, Tuple, Mapping, Type, Optional
 from decimal import Decimal
 
 from .bitcoin import sha256, COIN, is_address
@@ -87,6 +88,18 @@ class ScoredCandidate(NamedTuple):
     buckets: List[Bucket]
 
 
+class SelectionParams(NamedTuple):
+    """What is known about the tx before choosing coins. Lets the fee of a
+    set of buckets be computed from the bucket weights, without building a tx.
+    """
+    input_value: int              # value of the fixed inputs
+    spent_amount: int             # value of the fixed outputs
+    base_weight: int              # weight of the tx with the fixed inputs and outputs only
+    change_weight: int            # weight of one change output
+    fee_estimator_w: Callable[[int], int]
+    dust_threshold: int
+
+
 def strip_unneeded(bkts: List[Bucket], sufficient_funds) -> List[Bucket]:
     '''Remove buckets that are unnecessary in achieving the spend amount'''
     if sufficient_funds([], bucket_value_sum=0):
@@ -103,6 +116,10 @@ def strip_unneeded(bkts: List[Bucket], sufficient_funds) -> List[Bucket]:
 
 class CoinChooserBase(Logger):
 
+    # whether make_tx passes the SelectionParams to choose_buckets.
+    # Off by default, for subclasses that override choose_buckets without them.
+    uses_selection_params = False
+
     def __init__(self, *, enable_output_value_rounding: bool):
         Logger.__init__(self)
         self.enable_output_value_rounding = enable_output_value_rounding
@@ -324,6 +341,15 @@ class CoinChooserBase(Logger):
                                                             dust_threshold=dust_threshold,
                                                             base_weight=base_weight)
 
+        change_addr = change_addrs[0] if change_addrs else (coins[0].address if coins else None)
+        params = SelectionParams(
+            input_value=input_value,
+            spent_amount=spent_amount,
+            base_weight=base_weight,
+            change_weight=4 * Transaction.estimated_output_size_for_address(change_addr) if change_addr else 0,
+            fee_estimator_w=fee_estimator_w,
+            dust_threshold=dust_threshold)
+
         # Collect the coins into buckets
         all_buckets = self.bucketize_coins(coins, fee_estimator_vb=fee_estimator_vb)
         # Filter some buckets out. Only keep those that have positive effective value.
@@ -332,8 +358,10 @@ class CoinChooserBase(Logger):
         # (e.g. CoinChooserPrivacy ensures that same-address coins go into one bucket)
         all_buckets = list(filter(lambda b: b.effective_value > 0, all_buckets))
         # Choose a subset of the buckets
+        kwargs = {'params': params} if self.uses_selection_params else {}
         scored_candidate = self.choose_buckets(all_buckets, sufficient_funds,
-                                               self.penalty_func(base_tx, tx_from_buckets=tx_from_buckets))
+                                               self.penalty_func(base_tx, tx_from_buckets=tx_from_buckets),
+                                               **kwargs)
         tx = scored_candidate.tx
 
         self.logger.info(f"using {len(tx.inputs())} inputs")
@@ -343,7 +371,8 @@ class CoinChooserBase(Logger):
 
     def choose_buckets(self, buckets: List[Bucket],
                        sufficient_funds: Callable,
-                       penalty_func: Callable[[List[Bucket]], ScoredCandidate]) -> ScoredCandidate:
+                       penalty_func: Callable[[List[Bucket]], ScoredCandidate],
+                       *, params: SelectionParams = None) -> ScoredCandidate:
         raise NotImplemented('To be subclassed')
 
 
@@ -476,8 +505,214 @@ class CoinChooserPrivacy(CoinChooserRandom):
         return penalty
 
 
+class CoinChooserBranchAndBound(CoinChooserBase):
+    """Attempts to minimize fees, and to avoid creating change.
+    Coins from the same address are spent together, as with the Privacy chooser.
+    It searches for a set of coins that pays for the transaction without
+    leaving any change, and compares it with the cheapest sets that need a
+    change output. The set paying the least fees is used.
+    Confirmed coins are preferred to unconfirmed ones.
+    """
+
+    uses_selection_params = True
+
+    BNB_MAX_TRIES = 100_000
+    # max number of buckets looked at while approximating the best subset
+    KNAPSACK_MAX_STEPS = 200_000
+
+    def keys(self, coins):
+        return [coin.scriptpubkey.hex() for coin in coins]
+
+    def penalty_func(self, base_tx, *, tx_from_buckets):
+        # a single candidate is built, all the scoring was done on bucket values
+        def penalty(buckets: List[Bucket]) -> ScoredCandidate:
+            tx, change_outputs = tx_from_buckets(buckets)
+            return ScoredCandidate(0, tx, buckets)
+        return penalty
+
+    def choose_buckets(self, buckets, sufficient_funds, penalty_func, *, params):
+        tiers = [
+            [bkt for bkt in buckets if bkt.min_height > 0],   # confirmed
+            [bkt for bkt in buckets if bkt.min_height >= 0],  # confirmed or unconfirmed
+            buckets,
+        ]
+        for bkts in tiers:
+            selected = self._select_buckets(bkts, sufficient_funds, params)
+            if selected is not None:
+                break
+        else:
+            raise NotEnoughFunds()
+        self.logger.info(f"Total number of buckets: {len(buckets)}. Selected: {len(selected)}")
+        return penalty_func(selected)
+
+    def _select_buckets(self, buckets: List[Bucket], sufficient_funds,
+                        params: SelectionParams) -> Optional[List[Bucket]]:
+        if sufficient_funds([], bucket_value_sum=0):
+            return []
+        if params.input_value + sum(bkt.value for bkt in buckets) < params.spent_amount:
+            return None
+        fee_estimator_w = params.fee_estimator_w
+        # the effective values of the buckets already account for the fee of their inputs
+        base_weight = params.base_weight + (2 if any(bkt.witness for bkt in buckets) else 0)
+        target = params.spent_amount - params.input_value + fee_estimator_w(base_weight)
+        change_fee = fee_estimator_w(base_weight + params.change_weight) - fee_estimator_w(base_weight)
+        # any excess below this is not worth a change output, and goes to fees
+        cost_of_change = change_fee + params.dust_threshold
+        buckets = sorted(buckets, key=lambda b: b.effective_value, reverse=True)
+        # Candidates are compared by their "waste": the fees paid for their inputs,
+        # plus either the excess going to fees, or the fee of the change output.
+        best = self._branch_and_bound(buckets, target, cost_of_change, sufficient_funds)
+        # candidates with change
+        target += cost_of_change
+        candidates = []
+        larger = [bkt for bkt in buckets if bkt.effective_value >= target]
+        if larger:
+            candidates.append([larger[-1]])
+        candidates.append(self._approximate_best_subset(buckets[len(larger):], target))
+        candidates.append(self._largest_first(buckets, target))
+        candidates.append(self._largest_first(
+            sorted(buckets, key=lambda b: b.effective_value / b.weight, reverse=True), target))
+        for selected in filter(None, candidates):
+            waste = self._input_fees(selected) + change_fee
+            if best is not None and waste >= best[1]:
+                continue
+            selected = self._top_up(selected, buckets, sufficient_funds)
+            if selected is not None:
+                best = selected, self._input_fees(selected) + change_fee
+        if best is not None:
+            return best[0]
+        # not enough for a change output, but maybe enough without
+        return self._top_up([], buckets, sufficient_funds)
+
+    @classmethod
+    def _input_fees(cls, buckets: List[Bucket]) -> int:
+        return sum(bkt.value - bkt.effective_value for bkt in buckets)
+
+    def _branch_and_bound(self, buckets: List[Bucket], target: int, cost_of_change: int,
+                          sufficient_funds) -> Optional[Tuple[List[Bucket], int]]:
+        """Depth-first search for a set of buckets with an effective value in
+        [target, target + cost_of_change], i.e. that needs no change output.
+        Returns the one with the least waste found within BNB_MAX_TRIES steps,
+        and its waste. `buckets` must be sorted by decreasing effective value.
+        """
+        values = [bkt.effective_value for bkt in buckets]
+        fees = [bkt.value - bkt.effective_value for bkt in buckets]
+        # available[i]: sum of the values we can still add when deciding about bucket i
+        available = [0] * (len(values) + 1)
+        for i in reversed(range(len(values))):
+            available[i] = available[i + 1] + values[i]
+        upper_bound = target + cost_of_change
+        best = None  # type: Optional[List[Bucket]]
+        best_waste = None
+        selected = []  # type: List[int]
+        value = 0
+        fee = 0
+        depth = 0
+        for tries in range(self.BNB_MAX_TRIES):
+            if (value + available[depth] < target or value > upper_bound
+                    or (best is not None and fee > best_waste)):
+                backtrack = True
+            elif value >= target:
+                backtrack = True
+                waste = fee + value - target
+                if best is None or waste < best_waste:
+                    # effective values are estimates (segwit flag, fee rounding)
+                    candidate = [buckets[i] for i in selected]
+                    if sufficient_funds(candidate, bucket_value_sum=sum(bkt.value for bkt in candidate)):
+                        best, best_waste = candidate, waste
+            else:
+                backtrack = False
+                # if the previous bucket has the same value and was excluded,
+                # including this one instead would explore the same sums again
+                if not (depth > 0 and values[depth] == values[depth - 1]
+                        and (not selected or selected[-1] != depth - 1)):
+                    selected.append(depth)
+                    value += values[depth]
+                    fee += fees[depth]
+                depth += 1
+            if backtrack:
+                if not selected:
+                    break  # explored everything
+                # exclude the last included bucket, and go on from there
+                last = selected.pop()
+                value -= values[last]
+                fee -= fees[last]
+                depth = last + 1
+        if best is None:
+            return None
+        return best, best_waste
+
+    def _approximate_best_subset(self, buckets: List[Bucket], target: int) -> Optional[List[Bucket]]:
+        """Returns the subset of buckets with the smallest effective value
+        >= target we can find, by stochastic approximation, as in the
+        knapsack solver of Bitcoin Core. `buckets` must be sorted by
+        decreasing effective value.
+        """
+        values = [bkt.effective_value for bkt in buckets]
+        total = sum(values)
+        if total < target:
+            return None
+        # randomness is derived from the coins, see make_tx
+        rng = random.Random(self.p.get_bytes(32))
+        best = [True] * len(values)
+        best_value = total
+        num_iterations = max(1, min(1000, self.KNAPSACK_MAX_STEPS // len(values)))
+        for i in range(num_iterations):
+            if best_value == target:
+                break
+            included = [False] * len(values)
+            value = 0
+            reached_target = False
+            for npass in range(2):
+                if reached_target:
+                    break
+                for j in range(len(values)):
+                    # first pass: include randomly; second pass: include the rest
+                    if (rng.getrandbits(1) if npass == 0 else not included[j]):
+                        value += values[j]
+                        included[j] = True
+                        if value >= target:
+                            reached_target = True
+                            if value < best_value:
+                                best_value = value
+                                best = list(included)
+                            value -= values[j]
+                            included[j] = False
+        return [bkt for bkt, inc in zip(buckets, best) if inc]
+
+    @classmethod
+    def _largest_first(cls, buckets: List[Bucket], target: int) -> Optional[List[Bucket]]:
+        selected = []
+        value = 0
+        for bkt in buckets:
+            if value >= target:
+                break
+            selected.append(bkt)
+            value += bkt.effective_value
+        return selected if value >= target else None
+
+    @classmethod
+    def _top_up(cls, selected: List[Bucket], buckets: List[Bucket],
+                sufficient_funds) -> Optional[List[Bucket]]:
+        """Adds buckets, largest first, until `selected` is sufficient."""
+        selected = list(selected)
+        value = sum(bkt.value for bkt in selected)
+        if sufficient_funds(selected, bucket_value_sum=value):
+            return selected
+        selected_descs = {bkt.desc for bkt in selected}
+        for bkt in buckets:
+            if bkt.desc in selected_descs:
+                continue
+            selected.append(bkt)
+            value += bkt.value
+            if sufficient_funds(selected, bucket_value_sum=value):
+                return selected
+        return None
+
+
 COIN_CHOOSERS = {
     'Privacy': CoinChooserPrivacy,
+    'BranchAndBound': CoinChooserBranchAndBound,
 }  # type: Mapping[str, Type[CoinChooserBase]]
 
 def get_name(config):
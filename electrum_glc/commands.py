@@ -35,9 +35,9 @@ import asyncio
 import inspect
 from collections import defaultdict
 from functools import wraps, partial
-from itertools import repeat
+from itertools import repeat, islice
 from decimal import Decimal
-from typing import Optional, TYPE_CHECKING, Dict, List
+from typing import Optional, TYPE_CHECKING, Dict, List, Tuple
 import os
 
 from .import util, ecc
@@ -52,6 +52,9 @@ from .transaction import (Transaction, multisig_script, TxOutput, PartialTransac
 from .invoices import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED
 from .synchronizer import Notifier
 from .wallet import Abstract_Wallet, create_new_wallet, restore_wallet_from_text, Deterministic_Wallet, BumpFeeStrategy
+from .wallet_db import DB_BACKENDS, load_wallet_db
+from .wallet_sqlite_db import convert_wallet_db
+from .storage import WalletStorage
 from .address_synchronizer import TX_HEIGHT_LOCAL
 from .mnemonic import Mnemonic
 from .lnutil import SENT, RECEIVED
@@ -89,6 +92,17 @@ def satoshis(amount):
 def format_satoshis(x):
     return str(Decimal(x)/COIN) if x is not None else None
 
+def history_cursor_to_str(txpos: Tuple[int, int], txid: str) -> str:
+    return '%d:%d:%s' % (txpos[0], txpos[1], txid)
+
+def history_cursor_from_str(cursor: str) -> Tuple[Tuple[int, int], str]:
+    try:
+        height, pos, txid = cursor.split(':')
+        assert is_hash256_str(txid)
+        return (int(height), int(pos)), txid
+    except Exception:
+        raise Exception(f"invalid history cursor: {cursor!r}") from None
+
 
 class Command:
     def __init__(self, func, s):
@@ -245,7 +259,8 @@ class Commands:
         return await self.daemon._stop_wallet(wallet_path)
 
     @command('')
-    async def create(self, passphrase=None, password=None, encrypt_file=True, seed_type=None, wallet_path=None):
+    async def create(self, passphrase=None, password=None, encrypt_file=None, seed_type=None, db_backend=None,
+                     wallet_path=None):
         """Create a new wallet.
         If you want to be prompted for an argument, type '?' or ':' (concealed)
         """
@@ -254,6 +269,7 @@ class Commands:
                               password=password,
                               encrypt_file=encrypt_file,
                               seed_type=seed_type,
+                              db_backend=db_backend,
                               config=self.config)
         return {
             'seed': d['seed'],
@@ -262,7 +278,8 @@ class Commands:
         }
 
     @command('')
-    async def restore(self, text, passphrase=None, password=None, encrypt_file=True, wallet_path=None):
+    async def restore(self, text, passphrase=None, password=None, encrypt_file=None, db_backend=None,
+                      wallet_path=None):
         """Restore a wallet from text. Text can be a seed phrase, a master
         public key, a master private key, a list of Goldcoin addresses
         or Goldcoin private keys.
@@ -274,12 +291,31 @@ class Commands:
                                      passphrase=passphrase,
                                      password=password,
                                      encrypt_file=encrypt_file,
+                                     db_backend=db_backend,
                                      config=self.config)
         return {
             'path': d['wallet'].storage.path,
             'msg': d['msg'],
         }
 
+    @command('')
+    async def convert_wallet_db(self, db_backend, wallet_path=None):
+        """Convert the wallet file to another db backend ('json' or 'sqlite').
+        The wallet must not be open, and the file must not be encrypted.
+        """
+        if db_backend not in DB_BACKENDS:
+            raise Exception(f"Unknown db backend: {db_backend!r}")
+        if self.daemon and self.daemon.get_wallet(wallet_path):
+            raise Exception("Close the wallet first!")
+        storage = WalletStorage(wallet_path)
+        if not storage.file_exists():
+            raise Exception("Wallet file not found")
+        if storage.is_sqlite() == (db_backend == 'sqlite'):
+            return False
+        db = load_wallet_db(storage, manual_upgrades=False)
+        convert_wallet_db(storage, db, to_sqlite=(db_backend == 'sqlite'))
+        return True
+
     @command('wp')
     async def password(self, password=None, new_password=None, encrypt_file=None, wallet: Abstract_Wallet = None):
         """Change wallet password. """
@@ -734,8 +770,12 @@ class Commands:
 
     @command('w')
     async def onchain_history(self, year=None, show_addresses=False, show_fiat=False, wallet: Abstract_Wallet = None,
-                              from_height=None, to_height=None):
-        """Wallet onchain history. Returns the transaction history of your wallet."""
+                              from_height=None, to_height=None, limit=None, cursor=None, stream=False):
+        """Wallet onchain history. Returns the transaction history of your wallet.
+        With limit or cursor, returns one page of transactions, without summary, and the
+        cursor of the next page. With stream, transactions are returned one at a time,
+        as newline-delimited JSON over the JSON-RPC interface.
+        """
         kwargs = {
             'show_addresses': show_addresses,
             'from_height': from_height,
@@ -752,7 +792,30 @@ class Commands:
             fx = FxThread(self.config, None)
             kwargs['fx'] = fx
 
-        return json_normalize(wallet.get_detailed_history(**kwargs))
+        if limit is None and cursor is None and not stream:
+            return json_normalize(wallet.get_detailed_history(**kwargs))
+        if cursor is not None:
+            kwargs['after'] = history_cursor_from_str(cursor)
+        items = wallet.iter_detailed_history(**kwargs)
+        if limit is not None:
+            items = islice(items, limit)
+        if stream:
+            return self._stream_history_items(items)
+        transactions = list(items)
+        next_cursor = None
+        if transactions and len(transactions) == limit:
+            txid = transactions[-1]['txid']
+            next_cursor = history_cursor_to_str(wallet.adb.get_txpos(txid), txid)
+        return {
+            'transactions': json_normalize(transactions),
+            'next_cursor': next_cursor,
+        }
+
+    async def _stream_history_items(self, items):
+        for item in items:
+            yield json_normalize(item)
+            # do not block the event loop while the history is computed
+            await asyncio.sleep(0)
 
     @command('wp')
     async def bumpfee(self, tx, new_fee_rate, from_coins=None, strategies=None, password=None, unsigned=False, wallet: Abstract_Wallet = None):
@@ -1341,6 +1404,7 @@ param_descriptions = {
     'height': 'Block height',
     'tx': 'Serialized transaction (hexadecimal)',
     'key': 'Variable name',
+    'db_backend': "Storage backend of the wallet file, 'json' or 'sqlite'",
     'pubkey': 'Public key',
     'message': 'Clear text message. Use quotes if it contains spaces.',
     'encrypted': 'Encrypted message',
@@ -1372,6 +1436,7 @@ command_options = {
     'change_addr': ("-c", "Change address. Default is a spare address, or the source address if it's not in the wallet"),
     'nbits':       (None, "Number of bits of entropy"),
     'seed_type':   (None, "The type of seed to create, e.g. 'standard' or 'segwit'"),
+    'db_backend':  (None, "Storage backend of the wallet file, 'json' or 'sqlite'. Storage encryption requires 'json'"),
     'language':    ("-L", "Default language for wordlist"),
     'passphrase':  (None, "Seed extension"),
     'privkey':     (None, "Private key. Set to '?' to get a prompt."),
@@ -1396,6 +1461,9 @@ command_options = {
     'fee_level':   (None, "Float between 0.0 and 1.0, representing fee slider position"),
     'from_height': (None, "Only show transactions that confirmed after given block height"),
     'to_height':   (None, "Only show transactions that confirmed before given block height"),
+    'limit':       (None, "Maximum number of transactions to return"),
+    'cursor':      (None, "Cursor of the page to return, as returned in next_cursor"),
+    'stream':      (None, "Stream results as newline-delimited JSON (JSON-RPC only)"),
     'iknowwhatimdoing': (None, "Acknowledge that I understand the full implications of what I am about to do"),
     'gossip':      (None, "Apply command to gossip node instead of wallet"),
     'connection_string':      (None, "Lightning network node ID or network address"),
@@ -1414,6 +1482,8 @@ arg_types = {
     'year': int,
     'from_height': int,
     'to_height': int,
+    'limit': int,
+    'stream': eval_bool,
     'tx': convert_raw_tx_to_hex,
     'pubkeys': json_loads,
     'jsontx': json_loads,
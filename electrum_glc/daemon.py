@@ -24,6 +24,7 @@
 # SOFTWARE.
 import asyncio
 import ast
+import inspect
 import os
 import time
 import traceback
@@ -47,7 +48,7 @@ from .util import log_exceptions, ignore_exceptions, randrange, OldTaskGroup
 from .util import EventListener, event_listener
 from .wallet import Wallet, Abstract_Wallet
 from .storage import WalletStorage
-from .wallet_db import WalletDB
+from .wallet_db import load_wallet_db
 from .commands import known_commands, Commands
 from .simple_config import SimpleConfig
 from .exchange_rate import FxThread
@@ -218,11 +219,10 @@ class AuthenticatedServer(Logger):
             except AuthenticationCredentialsInvalid:
                 return web.Response(text='Forbidden', status=403)
         try:
-            request = await request.text()
-            request = json.loads(request)
-            method = request['method']
-            _id = request['id']
-            params = request.get('params', [])  # type: Union[Sequence, Mapping]
+            data = json.loads(await request.text())
+            method = data['method']
+            _id = data['id']
+            params = data.get('params', [])  # type: Union[Sequence, Mapping]
             if method not in self._methods:
                 raise Exception(f"attempting to use unregistered method: {method}")
             f = self._methods[method]
@@ -235,9 +235,12 @@ class AuthenticatedServer(Logger):
         }
         try:
             if isinstance(params, dict):
-                response['result'] = await f(**params)
+                result = await f(**params)
             else:
-                response['result'] = await f(*params)
+                result = await f(*params)
+            if inspect.isasyncgen(result):
+                return await self.stream_ndjson(request, result)
+            response['result'] = result
         except BaseException as e:
             self.logger.exception("internal error while executing RPC")
             response['error'] = {
@@ -246,6 +249,22 @@ class AuthenticatedServer(Logger):
             }
         return web.json_response(response)
 
+    async def stream_ndjson(self, request, results) -> web.StreamResponse:
+        """Sends the items of an async generator as newline-delimited JSON.
+        An error while streaming is sent as a last line, {"error": ...}.
+        """
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        try:
+            async for item in results:
+                await response.write(json.dumps(item).encode('utf8') + b'\n')
+        except Exception as e:
+            self.logger.exception("internal error while streaming RPC result")
+            error = {'code': 1, 'message': str(e)}
+            await response.write(json.dumps({'error': error}).encode('utf8') + b'\n')
+        await response.write_eof()
+        return response
+
 
 class CommandsServer(AuthenticatedServer):
 
@@ -335,6 +354,8 @@ class CommandsServer(AuthenticatedServer):
         # fixme: not sure how to retrieve message in jsonrpcclient
         try:
             result = await func(*args, **kwargs)
+            if inspect.isasyncgen(result):
+                result = [item async for item in result]
         except Exception as e:
             result = {'error':str(e)}
         return result
@@ -477,7 +498,7 @@ class Daemon(Logger):
                 return
             storage.decrypt(password)
         # read data, pass it to db
-        db = WalletDB(storage.read(), manual_upgrades=manual_upgrades)
+        db = load_wallet_db(storage, manual_upgrades=manual_upgrades)
         if db.requires_split():
             return
         if db.requires_upgrade():
@@ -504,7 +525,7 @@ class Daemon(Logger):
     def delete_wallet(self, path: str) -> bool:
         self.stop_wallet(path)
         if os.path.exists(path):
-            os.unlink(path)
+            WalletStorage(path).delete()
             return True
         return False
 
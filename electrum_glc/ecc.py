@@ -26,7 +26,7 @@
 import base64
 import hashlib
 import functools
-from typing import Union, Tuple, Optional
+from typing import Union, Tuple, Optional, Sequence, List
 from ctypes import (
     byref, c_byte, c_int, c_uint, c_char_p, c_size_t, c_void_p, create_string_buffer,
     CFUNCTYPE, POINTER, cast
@@ -36,7 +36,7 @@ from .util import bfh, bh2u, assert_bytes, to_bytes, InvalidPassword, profiler,
 from .crypto import (sha256d, aes_encrypt_with_iv, aes_decrypt_with_iv, hmac_oneshot)
 from . import constants
 from .logging import get_logger
-from .ecc_fast import _libsecp256k1, SECP256K1_EC_UNCOMPRESSED
+from .ecc_fast import _libsecp256k1, SECP256K1_EC_UNCOMPRESSED, SECP256K1_EC_COMPRESSED
 
 _logger = get_logger(__name__)
 
@@ -289,6 +289,30 @@ class ECPubkey(object):
             return POINT_AT_INFINITY
         return ECPubkey._from_libsecp256k1_pubkey_ptr(pubkey_sum)
 
+    def tweak_add_many(self, tweaks: Sequence[bytes]) -> List[Optional[bytes]]:
+        """Returns the compressed public keys of self + t*G, for each 32-byte tweak t.
+        The result is None where t is not within the curve order or the sum is infinity.
+        Only parses self once, unlike adding ECPrivkey(t) to it repeatedly.
+        """
+        if self.is_at_infinity(): raise Exception('point is at infinity')
+        parent = self._to_libsecp256k1_pubkey_ptr().raw
+        pubkey = create_string_buffer(64)
+        pubkey_serialized = create_string_buffer(33)
+        pubkey_size = c_size_t()
+        results = []
+        for tweak in tweaks:
+            assert len(tweak) == 32, len(tweak)
+            pubkey.raw = parent
+            ret = _libsecp256k1.secp256k1_ec_pubkey_tweak_add(_libsecp256k1.ctx, pubkey, tweak)
+            if not ret:
+                results.append(None)
+                continue
+            pubkey_size.value = 33
+            _libsecp256k1.secp256k1_ec_pubkey_serialize(
+                _libsecp256k1.ctx, pubkey_serialized, byref(pubkey_size), pubkey, SECP256K1_EC_COMPRESSED)
+            results.append(pubkey_serialized.raw)
+        return results
+
     def __eq__(self, other) -> bool:
         if not isinstance(other, ECPubkey):
             return False
@@ -10,7 +10,7 @@ import asyncio
 from typing import TYPE_CHECKING, Optional, Union, Callable, Sequence
 
 from electrum_glc.storage import WalletStorage, StorageReadWriteError
-from electrum_glc.wallet_db import WalletDB
+from electrum_glc.wallet_db import load_wallet_db
 from electrum_glc.wallet import Wallet, InternalAddressCorruption, Abstract_Wallet
 
 from electrum_glc.plugin import run_hook
@@ -720,7 +720,7 @@ class ElectrumWindow(App, Logger, EventListener):
             wizard.run('new')
         else:
             assert storage.is_past_initial_decryption()
-            db = WalletDB(storage.read(), manual_upgrades=False)
+            db = load_wallet_db(storage, manual_upgrades=False)
             assert not db.requires_upgrade()
             self.on_wizard_success(storage, db, password)
 
@@ -1320,8 +1320,9 @@ class ElectrumWindow(App, Logger, EventListener):
             except InvalidPassword:
                 self.show_error("Invalid password")
                 return
+        storage = self.wallet.storage
         self.stop_wallet()
-        os.unlink(wallet_path)
+        storage.delete()
         self.show_error(_("Wallet removed: {}").format(basename))
         new_path = self.electrum_config.get_wallet_path(use_gui_last_wallet=True)
         self.load_wallet_by_name(new_path)
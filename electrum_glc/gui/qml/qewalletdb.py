@@ -4,7 +4,7 @@ from PyQt5.QtCore import pyqtProperty, pyqtSignal, pyqtSlot, QObject
 
 from electrum_glc.logging import get_logger
 from electrum_glc.storage import WalletStorage, StorageEncryptionVersion
-from electrum_glc.wallet_db import WalletDB
+from electrum_glc.wallet_db import load_wallet_db
 from electrum_glc.bip32 import normalize_bip32_derivation, xpub_type
 from electrum_glc.util import InvalidPassword
 from electrum_glc import keystore
@@ -152,7 +152,7 @@ class QEWalletDB(QObject):
 
     def load_db(self):
         # needs storage accessible
-        self._db = WalletDB(self._storage.read(), manual_upgrades=True)
+        self._db = load_wallet_db(self._storage, manual_upgrades=True)
         if self._db.requires_split():
             self._logger.warning('wallet requires split')
             self._requiresSplit = True
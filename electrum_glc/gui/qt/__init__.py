@@ -60,7 +60,7 @@ from electrum_glc.base_wizard import GoBack
 from electrum_glc.util import (UserCancelled, profiler, send_exception_to_crash_reporter,
                                WalletFileException, BitcoinException, get_new_wallet_name)
 from electrum_glc.wallet import Wallet, Abstract_Wallet
-from electrum_glc.wallet_db import WalletDB
+from electrum_glc.wallet_db import load_wallet_db
 from electrum_glc.logging import Logger
 from electrum_glc.gui import BaseElectrumGui
 
@@ -398,7 +398,7 @@ class ElectrumGui(BaseElectrumGui, Logger):
                 wizard.run('new')
                 storage, db = wizard.create_storage(path)
             else:
-                db = WalletDB(storage.read(), manual_upgrades=False)
+                db = load_wallet_db(storage, manual_upgrades=False)
                 wizard.run_upgrades(storage, db)
         except (UserCancelled, GoBack):
             return
@@ -371,7 +371,7 @@ class InstallWizard(QDialog, MessageBoxMixin, BaseWizard):
             file_list = db.split_accounts(path)
             msg = _('Your accounts have been moved to') + ':\n' + '\n'.join(file_list) + '\n\n'+ _('Do you want to delete the old file') + ':\n' + path
             if self.question(msg):
-                os.remove(path)
+                storage.delete()
                 self.show_warning(_('The file was removed'))
             # raise now, to avoid having the old storage opened
             raise UserCancelled()
@@ -385,11 +385,11 @@ class InstallWizard(QDialog, MessageBoxMixin, BaseWizard):
                     "Do you want to complete its creation now?").format(path)
             if not self.question(msg):
                 if self.question(_("Do you want to delete '{}'?").format(path)):
-                    os.remove(path)
+                    storage.delete()
                     self.show_warning(_('The file was removed'))
                 return
             self.show()
-            self.data = json.loads(storage.read())
+            self.data = json.loads(db.dump())
             self.run(action)
             for k, v in self.data.items():
                 db.put(k, v)
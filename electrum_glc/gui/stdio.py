@@ -8,7 +8,7 @@ from electrum_glc.gui import BaseElectrumGui
 from electrum_glc import util
 from electrum_glc import WalletStorage, Wallet
 from electrum_glc.wallet import Abstract_Wallet
-from electrum_glc.wallet_db import WalletDB
+from electrum_glc.wallet_db import load_wallet_db
 from electrum_glc.util import format_satoshis, EventListener, event_listener
 from electrum_glc.bitcoin import is_address, COIN
 from electrum_glc.transaction import PartialTxOutput
@@ -33,7 +33,7 @@ class ElectrumGui(BaseElectrumGui, EventListener):
             password = getpass.getpass('Password:', stream=None)
             storage.decrypt(password)
 
-        db = WalletDB(storage.read(), manual_upgrades=False)
+        db = load_wallet_db(storage, manual_upgrades=False)
 
         self.done = 0
         self.last_balance = ""
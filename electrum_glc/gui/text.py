@@ -17,7 +17,7 @@ from electrum_glc.util import EventListener, event_listener
 from electrum_glc.bitcoin import is_address, address_to_script, COIN
 from electrum_glc.transaction import PartialTxOutput
 from electrum_glc.wallet import Wallet, Abstract_Wallet
-from electrum_glc.wallet_db import WalletDB
+from electrum_glc.wallet_db import load_wallet_db
 from electrum_glc.storage import WalletStorage
 from electrum_glc.network import NetworkParameters, TxBroadcastError, BestEffortRequestFailed
 from electrum_glc.interface import ServerAddr
@@ -59,7 +59,7 @@ class ElectrumGui(BaseElectrumGui, EventListener):
         if storage.is_encrypted():
             password = getpass.getpass('Password:', stream=None)
             storage.decrypt(password)
-        db = WalletDB(storage.read(), manual_upgrades=False)
+        db = load_wallet_db(storage, manual_upgrades=False)
         self.wallet = Wallet(db, storage, config=config)  # type: Optional[Abstract_Wallet]
         self.wallet.start_network(self.network)
         self.contacts = self.wallet.contacts
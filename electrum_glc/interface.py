@@ -133,6 +133,9 @@ def assert_list_or_tuple(val: Any) -> None:
 
 class NotificationSession(RPCSession):
 
+    # number of timeouts of batch requests after which we assume the server does not support them
+    MAX_BATCH_TIMEOUTS = 3
+
     def __init__(self, *args, interface: 'Interface', **kwargs):
         super(NotificationSession, self).__init__(*args, **kwargs)
         self.subscriptions = defaultdict(list)
@@ -141,6 +144,9 @@ class NotificationSession(RPCSession):
         self._msg_counter = itertools.count(start=1)
         self.interface = interface
         self.cost_hard_limit = 0  # disable aiorpcx resource limits
+        self.batches_supported = True  # set to False if the server rejects batch requests
+        self._sent_batches = 0
+        self._batch_timeouts = 0  # of batches sent before the first successful one
 
     async def handle_request(self, request):
         self.maybe_log(f"--> {request}")
@@ -180,6 +186,51 @@ class NotificationSession(RPCSession):
             self.maybe_log(f"--> {response} (id: {msg_id})")
             return response
 
+    async def send_request_batch(self, requests: Sequence[Tuple[str, Sequence]], *, timeout=None) -> List[Any]:
+        """Sends (method, params) requests as one JSON-RPC batch.
+        Returns their results in the same order. Errors returned by the server
+        for single requests are returned (as CodeMessageError), not raised.
+        If the server does not support batches, the requests are sent one by one.
+        """
+        if not self.batches_supported or len(requests) == 1:
+            return await self._send_requests_separately(requests, timeout=timeout)
+        msg_id = next(self._msg_counter)
+        self.maybe_log(f"<-- batch {requests} (id: {msg_id})")
+        async def send_batch():
+            async with self.send_batch() as batch:
+                for method, params in requests:
+                    batch.add_request(method, params)
+            return batch.results
+        try:
+            results = await asyncio.wait_for(send_batch(), timeout)
+        except CodeMessageError as e:
+            self.interface.logger.info(f"server does not support batch requests: {e!r}. sending requests one by one")
+            self.batches_supported = False
+            return await self._send_requests_separately(requests, timeout=timeout)
+        except (TaskTimeout, asyncio.TimeoutError) as e:
+            # A server that rejects batches may reply with a single error, which aiorpcx cannot
+            # pair with the batch, so we only get a timeout. But the server might just be slow,
+            # so we only give up on batches after several timeouts, before any batch succeeded.
+            if self._sent_batches > 0:
+                raise RequestTimedOut(f'request timed out: batch (id: {msg_id})') from e
+            self._batch_timeouts += 1
+            if self._batch_timeouts >= self.MAX_BATCH_TIMEOUTS:
+                self.interface.logger.info("server does not seem to support batch requests. "
+                                           "sending requests one by one")
+                self.batches_supported = False
+            return await self._send_requests_separately(requests, timeout=timeout)
+        self._sent_batches += 1
+        self.maybe_log(f"--> {results} (id: {msg_id})")
+        return list(results)
+
+    async def _send_requests_separately(self, requests: Sequence[Tuple[str, Sequence]], *, timeout=None) -> List[Any]:
+        async def send_request(method, params):
+            try:
+                return await self.send_request(method, params, timeout=timeout)
+            except CodeMessageError as e:
+                return e
+        return await asyncio.gather(*[send_request(method, params) for method, params in requests])
+
     def set_default_timeout(self, timeout):
         self.sent_request_timeout = timeout
         self.max_send_delay = timeout
@@ -196,6 +247,32 @@ class NotificationSession(RPCSession):
             self.cache[key] = result
         await queue.put(params + [result])
 
+    async def subscribe_batch(self, method: str, params_list: Sequence[List], queue: asyncio.Queue) -> List[Any]:
+        """Like subscribe, for several subscriptions, sent as one batch.
+        Returns the error of each subscription that failed, or None.
+        """
+        keys = [self.get_hashable_key_for_rpc_call(method, params) for params in params_list]
+        for key in keys:
+            self.subscriptions[key].append(queue)
+        cached = [key in self.cache for key in keys]
+        to_request = [(method, params) for is_cached, params in zip(cached, params_list) if not is_cached]
+        results = await self.send_request_batch(to_request) if to_request else []
+        results = iter(results)
+        errors = []
+        for key, params, is_cached in zip(keys, params_list, cached):
+            if is_cached:
+                result = self.cache[key]
+            else:
+                result = next(results)
+                if isinstance(result, Exception):
+                    self.subscriptions[key].remove(queue)
+                    errors.append(result)
+                    continue
+                self.cache[key] = result
+            errors.append(None)
+            await queue.put(params + [result])
+        return errors
+
     def unsubscribe(self, queue):
         """Unsubscribe a callback to free object references to enable GC."""
         # note: we can't unsubscribe from the server, so we keep receiving
@@ -623,6 +700,16 @@ class Interface(Logger):
         if can_return_early and index in self._requested_chunks:
             return
         self.logger.info(f"requesting chunk from height {height}")
+        res = await self._fetch_chunk(index, tip)
+        # the PoW check does not depend on our chain, so it can run in the worker pool
+        # while other chunks are being processed. prev-hash linkage is checked in connect_chunk.
+        pow_hashes = await self.blockchain.compute_pow_hashes(bfh(res['hex']))
+        conn = self.blockchain.connect_chunk(index, res['hex'], pow_hashes=pow_hashes)
+        if not conn:
+            return conn, 0
+        return conn, res['count']
+
+    async def _fetch_chunk(self, index: int, tip=None) -> dict:
         size = 2016
         if tip is not None:
             size = min(size, tip - index * 2016 + 1)
@@ -645,10 +732,51 @@ class Interface(Logger):
             raise RequestCorrupted(f"server uses too low 'max' count for block.headers: {res['max']} < 2016")
         if res['count'] != size:
             raise RequestCorrupted(f"expected {size} headers but only got {res['count']}")
-        conn = self.blockchain.connect_chunk(index, res['hex'])
-        if not conn:
-            return conn, 0
-        return conn, res['count']
+        return res
+
+    def get_request_batch_size(self) -> int:
+        """Max number of requests sent in one JSON-RPC batch."""
+        return max(1, int(self.network.config.get('network_request_batch_size', 50)))
+
+    def _get_num_chunk_requests_in_flight(self) -> int:
+        return max(1, int(self.network.config.get('header_chunk_requests_in_flight', 4)))
+
+    async def request_chunks_pipelined(self, height: int, tip: int) -> Tuple[bool, int]:
+        """Catches up from height to tip, keeping several chunk requests in flight.
+        Chunks are verified and connected in order as they arrive,
+        and the headers files are only fsynced at the end.
+        Returns whether all chunks could be connected, and the next height to sync from.
+        """
+        num_in_flight = self._get_num_chunk_requests_in_flight()
+        indices = iter(range(height // 2016, tip // 2016 + 1))
+        self.logger.info(f"requesting chunks from height {height} to {tip}, {num_in_flight} at a time")
+
+        async def fetch_chunk_and_pow_hashes(index):
+            res = await self._fetch_chunk(index, tip)
+            pow_hashes = await self.blockchain.compute_pow_hashes(bfh(res['hex']))
+            return res, pow_hashes
+
+        async with OldTaskGroup() as group:
+            pending = []  # type: List[Tuple[int, asyncio.Task]]
+            try:
+                for index in itertools.islice(indices, num_in_flight):
+                    pending.append((index, await group.spawn(fetch_chunk_and_pow_hashes(index))))
+                while pending:
+                    index, task = pending.pop(0)
+                    res, pow_hashes = await task
+                    if not self.blockchain.connect_chunk(index, res['hex'], pow_hashes=pow_hashes, fsync=False):
+                        return False, height
+                    height = index * 2016 + res['count']
+                    util.trigger_callback('network_updated')
+                    for index in itertools.islice(indices, 1):
+                        pending.append((index, await group.spawn(fetch_chunk_and_pow_hashes(index))))
+            finally:
+                await group.cancel_remaining()
+                with blockchain.blockchains_lock:
+                    chains = list(blockchain.blockchains.values())
+                for chain in chains:
+                    chain.fsync()
+        return True, height
 
     def is_main_server(self) -> bool:
         return (self.network.interface == self or
@@ -777,7 +905,18 @@ class Interface(Logger):
         last = None
         while last is None or height <= next_height:
             prev_last, prev_height = last, height
-            if next_height > height + 10:
+            if next_height > height + 10 and self._get_num_chunk_requests_in_flight() > 1:
+                could_connect, new_height = await self.request_chunks_pipelined(height, next_height)
+                if not could_connect and new_height == height:
+                    if height <= constants.net.max_checkpoint():
+                        raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
+                    last, height = await self.step(height)
+                else:
+                    # if we made progress before a bad chunk, the next iteration retries from there
+                    assert new_height <= next_height+1, (new_height, self.tip)
+                    height = new_height
+                    last = 'catchup'
+            elif next_height > height + 10:
                 could_connect, num_headers = await self.request_chunk(height, next_height)
                 if not could_connect:
                     if height <= constants.net.max_checkpoint():
@@ -953,7 +1092,27 @@ class Interface(Logger):
             raise Exception(f"{repr(tx_height)} is not a block height")
         # do request
         res = await self.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
-        # check response
+        self._check_merkle_response(res)
+        return res
+
+    async def get_merkle_for_transactions(self, txs: Sequence[Tuple[str, int]]) -> List[Union[dict, Exception]]:
+        """Like get_merkle_for_transaction, for (tx_hash, tx_height) items, sent as one batch.
+        The result of a request the server returned an error for is that error.
+        """
+        for tx_hash, tx_height in txs:
+            if not is_hash256_str(tx_hash):
+                raise Exception(f"{repr(tx_hash)} is not a txid")
+            if not is_non_negative_integer(tx_height):
+                raise Exception(f"{repr(tx_height)} is not a block height")
+        results = await self.session.send_request_batch(
+            [('blockchain.transaction.get_merkle', [tx_hash, tx_height]) for tx_hash, tx_height in txs])
+        for res in results:
+            if not isinstance(res, Exception):
+                self._check_merkle_response(res)
+        return results
+
+    @classmethod
+    def _check_merkle_response(cls, res) -> None:
         block_height = assert_dict_contains_field(res, field_name='block_height')
         merkle = assert_dict_contains_field(res, field_name='merkle')
         pos = assert_dict_contains_field(res, field_name='pos')
@@ -963,13 +1122,30 @@ class Interface(Logger):
         assert_list_or_tuple(merkle)
         for item in merkle:
             assert_hash256_str(item)
-        return res
 
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
         raw = await self.session.send_request('blockchain.transaction.get', [tx_hash], timeout=timeout)
-        # validate response
+        self._check_raw_tx(tx_hash, raw)
+        return raw
+
+    async def get_transactions(self, tx_hashes: Sequence[str]) -> List[Union[str, Exception]]:
+        """Like get_transaction, for several txs, sent as one batch.
+        The result of a request the server returned an error for is that error.
+        """
+        for tx_hash in tx_hashes:
+            if not is_hash256_str(tx_hash):
+                raise Exception(f"{repr(tx_hash)} is not a txid")
+        results = await self.session.send_request_batch(
+            [('blockchain.transaction.get', [tx_hash]) for tx_hash in tx_hashes])
+        for tx_hash, raw in zip(tx_hashes, results):
+            if not isinstance(raw, Exception):
+                self._check_raw_tx(tx_hash, raw)
+        return results
+
+    @classmethod
+    def _check_raw_tx(cls, tx_hash: str, raw) -> None:
         if not is_hex_str(raw):
             raise RequestCorrupted(f"received garbage (non-hex) as tx data (txid {tx_hash}): {raw!r}")
         tx = Transaction(raw)
@@ -979,14 +1155,37 @@ class Interface(Logger):
             raise RequestCorrupted(f"cannot deserialize received transaction (txid {tx_hash})") from e
         if tx.txid() != tx_hash:
             raise RequestCorrupted(f"received tx does not match expected txid {tx_hash} (got {tx.txid()})")
-        return raw
 
     async def get_history_for_scripthash(self, sh: str) -> List[dict]:
         if not is_hash256_str(sh):
             raise Exception(f"{repr(sh)} is not a scripthash")
         # do request
         res = await self.session.send_request('blockchain.scripthash.get_history', [sh])
-        # check response
+        self._check_history_response(sh, res)
+        return res
+
+    async def get_histories_for_scripthashes(self, shs: Sequence[str]) -> List[List[dict]]:
+        """Like get_history_for_scripthash, for several scripthashes,
+        sent as concurrent batches. Raises the first error the server returned.
+        """
+        for sh in shs:
+            if not is_hash256_str(sh):
+                raise Exception(f"{repr(sh)} is not a scripthash")
+        batch_size = self.get_request_batch_size()
+        batches = [shs[i:i+batch_size] for i in range(0, len(shs), batch_size)]
+        async with OldTaskGroup() as group:
+            tasks = [await group.spawn(self.session.send_request_batch(
+                         [('blockchain.scripthash.get_history', [sh]) for sh in batch]))
+                     for batch in batches]
+        results = list(itertools.chain.from_iterable(t.result() for t in tasks))
+        for sh, res in zip(shs, results):
+            if isinstance(res, Exception):
+                raise res
+            self._check_history_response(sh, res)
+        return results
+
+    @classmethod
+    def _check_history_response(cls, sh: str, res) -> None:
         assert_list_or_tuple(res)
         prev_height = 1
         for tx_item in res:
@@ -1009,7 +1208,6 @@ class Interface(Logger):
             # a recently mined tx could be included in both last block and mempool?
             # Still, it's simplest to just disregard the response.
             raise RequestCorrupted(f"server history has non-unique txids for sh={sh}")
-        return res
 
     async def listunspent_for_scripthash(self, sh: str) -> List[dict]:
         if not is_hash256_str(sh):
@@ -25,12 +25,17 @@
 import threading
 import copy
 import json
+from typing import Sequence
 
 from . import util
 from .logging import Logger
 
 JsonDBJsonEncoder = util.MyEncoder
 
+# above this number of pending changes, we give up journaling and
+# rewrite the whole file on the next write
+MAX_PENDING_CHANGES = 100_000
+
 def modifier(func):
     def wrapper(self, *args, **kwargs):
         with self.lock:
@@ -74,29 +79,33 @@ class StoredDict(dict):
         self.db = db
         self.lock = self.db.lock if self.db else threading.RLock()
         self.path = path
-        # recursively convert dicts to StoredDict
+        # recursively convert dicts to StoredDict.
+        # the caller journals the whole value, not its items
+        self._journal = False
         for k, v in list(data.items()):
             self.__setitem__(k, v)
+        self._journal = True
 
-    @locked
-    def __setitem__(self, key, v):
-        is_new = key not in self
-        # early return to prevent unnecessary disk writes
-        if not is_new and self[key] == v:
-            return
+    def _set_parent(self, db, path):
+        self.db = db
+        self.path = path
+        for k, v in dict.items(self):
+            if isinstance(v, StoredDict):
+                v._set_parent(db, path + [k])
+
+    def _convert(self, key, v, *, stored_dict_class=None):
+        if stored_dict_class is None:
+            stored_dict_class = StoredDict
         # recursively set db and path
         if isinstance(v, StoredDict):
-            v.db = self.db
-            v.path = self.path + [key]
-            for k, vv in v.items():
-                v[k] = vv
+            v._set_parent(self.db, self.path + [key])
         # recursively convert dict to StoredDict.
         # _convert_dict is called breadth-first
         elif isinstance(v, dict):
             if self.db:
                 v = self.db._convert_dict(self.path, key, v)
             if not self.db or self.db._should_convert_to_stored_dict(key):
-                v = StoredDict(v, self.db, self.path + [key])
+                v = stored_dict_class(v, self.db, self.path + [key])
         # convert_value is called depth-first
         if isinstance(v, dict) or isinstance(v, str) or isinstance(v, int):
             if self.db:
@@ -104,28 +113,185 @@ class StoredDict(dict):
         # set parent of StoredObject
         if isinstance(v, StoredObject):
             v.set_db(self.db)
+        return v
+
+    def _add_patch(self, op, key, *value):
+        if self.db and self._journal:
+            self.db.add_patch(op, self.path + [key], *value)
+
+    @locked
+    def __setitem__(self, key, v):
+        is_new = key not in self
+        # early return to prevent unnecessary disk writes.
+        # note: a list or dict might have been changed in place, and assigned back
+        if (not is_new and not isinstance(v, (list, dict))
+                and self[key] is not v and self[key] == v):
+            return
+        v = self._convert(key, v)
         # set item
         dict.__setitem__(self, key, v)
-        if self.db:
-            self.db.set_modified(True)
+        self._add_patch('set', key, v)
 
     @locked
     def __delitem__(self, key):
         dict.__delitem__(self, key)
-        if self.db:
-            self.db.set_modified(True)
+        self._add_patch('del', key)
 
     @locked
     def pop(self, key, v=_RaiseKeyError):
         if v is _RaiseKeyError:
             r = dict.pop(self, key)
+        elif key in self:
+            r = dict.pop(self, key)
         else:
-            r = dict.pop(self, key, v)
-        if self.db:
-            self.db.set_modified(True)
+            return v
+        self._add_patch('del', key)
         return r
 
+    @locked
+    def clear(self):
+        dict.clear(self)
+        if self.db and self._journal:
+            self.db.add_patch('clear', self.path)
+
+    @locked
+    def append_to_list(self, key, value):
+        """Appends value to the list stored under key.
+        Use this instead of mutating the list in place, so that the change is journaled.
+        """
+        dict.__getitem__(self, key).append(value)
+        self._add_patch('append', key, value)
+
 
+class LazyStoredDict(StoredDict):
+    """A StoredDict that keeps the raw json of its dict items, and converts
+    each of them the first time it is accessed. Children become LazyStoredDicts
+    themselves, so that loading a wallet file only converts what is used.
+    """
+
+    def __init__(self, data, db, path):
+        self.db = db
+        self.lock = self.db.lock if self.db else threading.RLock()
+        self.path = path
+        self._journal = True
+        self._converted_all = False
+        # dicts are converted on access. other values are cheap to convert
+        for k, v in data.items():
+            if type(v) is str or type(v) is int:
+                if self.db:
+                    v = self.db._convert_value(self.path, k, v)
+            elif isinstance(v, StoredObject):
+                v.set_db(self.db)
+            dict.__setitem__(self, k, v)
+
+    def _convert_item(self, key):
+        with self.lock:
+            v = dict.__getitem__(self, key)
+            # note: a plain dict is either raw json, or a value
+            #       that is not meant to be converted (which is a no-op)
+            if type(v) is dict:
+                v = self._convert(key, v, stored_dict_class=LazyStoredDict)
+                dict.__setitem__(self, key, v)
+            return v
+
+    def _convert_all(self):
+        if self._converted_all:
+            return
+        with self.lock:
+            for key, v in list(dict.items(self)):
+                if type(v) is dict:
+                    self._convert_item(key)
+            self._converted_all = True
+
+    def __getitem__(self, key):
+        v = dict.__getitem__(self, key)
+        if type(v) is dict:
+            v = self._convert_item(key)
+        return v
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    @locked
+    def pop(self, key, v=_RaiseKeyError):
+        if key in self:
+            self._convert_item(key)
+        return StoredDict.pop(self, key, v)
+
+    @locked
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __iter__(self):
+        # note: overriding this makes dict(self) and {**self} go through
+        #       keys() and __getitem__, instead of copying the raw values
+        return dict.__iter__(self)
+
+    def items(self):
+        self._convert_all()
+        return dict.items(self)
+
+    def values(self):
+        self._convert_all()
+        return dict.values(self)
+
+    def copy(self):
+        self._convert_all()
+        return dict.copy(self)
+
+    def __eq__(self, other):
+        self._convert_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+def peek(d: dict, key, default=None):
+    """Returns d[key], or default, without converting a lazily loaded value.
+    Only for reading: the result may be raw json, and changes to it are not saved.
+    """
+    return dict.get(d, key, default)
+
+
+def _json_key(key) -> str:
+    # keys of json objects are strings. convert like json.dumps would
+    if isinstance(key, str):
+        return key
+    return json.loads(json.dumps({key: None}, cls=JsonDBJsonEncoder)).popitem()[0]
+
+
+def apply_patches(data: dict, patches: Sequence[list]) -> int:
+    """Replays journaled changes onto a json snapshot, in place.
+    Returns the number of patches that could not be applied.
+    """
+    num_skipped = 0
+    for patch in patches:
+        op, path, value = patch[0], patch[1], patch[2:]
+        try:
+            d = data
+            for k in path[:-1] if op != 'clear' else path:
+                d = d[k]
+            if op == 'set':
+                d[path[-1]] = value[0]
+            elif op == 'del':
+                d.pop(path[-1], None)
+            elif op == 'clear':
+                d.clear()
+            elif op == 'append':
+                d[path[-1]].append(value[0])
+            else:
+                raise ValueError(f"unknown op: {op!r}")
+        except (KeyError, TypeError, AttributeError, IndexError):
+            # the patch modified a dict that has since been detached from the db
+            num_skipped += 1
+    return num_skipped
 
 
 class JsonDB(Logger):
@@ -135,14 +301,38 @@ class JsonDB(Logger):
         self.lock = threading.RLock()
         self.data = data
         self._modified = False
+        # journal of changes made since the last write, as serialized patches
+        self._pending_changes = []
+        self._needs_full_write = False
 
     def set_modified(self, b):
         with self.lock:
             self._modified = b
+            if b:
+                # we do not know what has changed
+                self._needs_full_write = True
+                self._pending_changes = []
 
     def modified(self):
         return self._modified
 
+    def add_patch(self, op: str, path: Sequence, *value) -> None:
+        """Records a change made to a StoredDict, so that it can be
+        appended to the wallet file instead of rewriting it.
+        """
+        with self.lock:
+            self._modified = True
+            if self._needs_full_write:
+                return
+            if len(self._pending_changes) >= MAX_PENDING_CHANGES:
+                self.set_modified(True)
+                return
+            patch = [op, [_json_key(k) for k in path], *value]
+            self._pending_changes.append(json.dumps(patch, cls=JsonDBJsonEncoder))
+
+    def needs_full_write(self) -> bool:
+        return self._needs_full_write or not isinstance(self.data, StoredDict)
+
     @locked
     def get(self, key, default=None):
         v = self.data.get(key)
@@ -159,7 +349,8 @@ class JsonDB(Logger):
             self.logger.info(f"json error: cannot save {repr(key)} ({repr(value)})")
             return False
         if value is not None:
-            if self.data.get(key) != value:
+            # note: a list or dict might have been changed in place, and put back
+            if isinstance(value, (list, dict)) or self.data.get(key) != value:
                 self.data[key] = copy.deepcopy(value)
                 return True
         elif key in self.data:
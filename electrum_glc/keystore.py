@@ -54,6 +54,9 @@ if TYPE_CHECKING:
     from .plugin import Device
 
 
+DERIVED_PUBKEYS_CACHE_SIZE = 10_000  # per keystore class, see derive_pubkey
+
+
 class CannotDerivePubkey(Exception): pass
 
 
@@ -410,6 +413,12 @@ class MasterPublicKeyMixin(ABC):
         """
         pass
 
+    def derive_pubkeys_range(self, for_change: int, start: int, stop: int) -> List[bytes]:
+        """Returns the pubkeys at the given paths, for n in range(start, stop).
+        May raise CannotDerivePubkey.
+        """
+        return [self.derive_pubkey(for_change, n) for n in range(start, stop)]
+
     def get_pubkey_derivation(
             self,
             pubkey: bytes,
@@ -471,9 +480,8 @@ class Xpub(MasterPublicKeyMixin):
 
     def __init__(self, *, derivation_prefix: str = None, root_fingerprint: str = None):
         self.xpub = None
-        self.xpub_receive = None
-        self.xpub_change = None
         self._xpub_bip32_node = None  # type: Optional[BIP32Node]
+        self._branch_bip32_nodes = {}  # type: Dict[int, BIP32Node]  # for_change -> node
 
         # "key origin" info (subclass should persist these):
         self._derivation_prefix = derivation_prefix  # type: Optional[str]
@@ -489,6 +497,14 @@ class Xpub(MasterPublicKeyMixin):
             self._xpub_bip32_node = BIP32Node.from_xkey(self.xpub)
         return self._xpub_bip32_node
 
+    def get_bip32_node_for_branch(self, for_change: int) -> BIP32Node:
+        """Returns the node of the receiving (0) or change (1) branch below our xpub."""
+        node = self._branch_bip32_nodes.get(for_change)
+        if node is None:
+            node = self.get_bip32_node_for_xpub().subkey_at_public_derivation((for_change,))
+            self._branch_bip32_nodes[for_change] = node
+        return node
+
     def get_derivation_prefix(self) -> Optional[str]:
         return self._derivation_prefix
 
@@ -559,20 +575,16 @@ class Xpub(MasterPublicKeyMixin):
             self._derivation_prefix = derivation_prefix
         self.is_requesting_to_be_rewritten_to_wallet_file = True
 
-    @lru_cache(maxsize=None)
+    @lru_cache(maxsize=DERIVED_PUBKEYS_CACHE_SIZE)
     def derive_pubkey(self, for_change: int, n: int) -> bytes:
+        return self.derive_pubkeys_range(for_change, n, n + 1)[0]
+
+    def derive_pubkeys_range(self, for_change: int, start: int, stop: int) -> List[bytes]:
         for_change = int(for_change)
         if for_change not in (0, 1):
             raise CannotDerivePubkey("forbidden path")
-        xpub = self.xpub_change if for_change else self.xpub_receive
-        if xpub is None:
-            rootnode = self.get_bip32_node_for_xpub()
-            xpub = rootnode.subkey_at_public_derivation((for_change,)).to_xpub()
-            if for_change:
-                self.xpub_change = xpub
-            else:
-                self.xpub_receive = xpub
-        return self.get_pubkey_from_xpub(xpub, (n,))
+        node = self.get_bip32_node_for_branch(for_change)
+        return bip32.CKD_pub_range(node.eckey.get_public_key_bytes(compressed=True), node.chaincode, start, stop)
 
     @classmethod
     def get_pubkey_from_xpub(self, xpub: str, sequence) -> bytes:
@@ -743,7 +755,7 @@ class Old_KeyStore(MasterPublicKeyMixin, Deterministic_KeyStore):
         public_key = master_public_key + z*ecc.GENERATOR
         return public_key.get_public_key_bytes(compressed=False)
 
-    @lru_cache(maxsize=None)
+    @lru_cache(maxsize=DERIVED_PUBKEYS_CACHE_SIZE)
     def derive_pubkey(self, for_change, n) -> bytes:
         for_change = int(for_change)
         if for_change not in (0, 1):
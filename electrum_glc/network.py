@@ -337,6 +337,8 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self._connecting_ifaces = set()
         self.interfaces = {}  # these are the ifaces in "initialised and usable" state
         self._closing_ifaces = set()
+        # a connected server, other than the main one, that jobs can pre-subscribe on
+        self._standby_server = None  # type: Optional[ServerAddr]
 
         self.auto_connect = self.config.get('auto_connect', True)
         self.proxy = None
@@ -646,13 +648,39 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.num_server = NUM_TARGET_CONNECTED_SERVERS if not oneserver else 0
 
     async def _switch_to_random_interface(self):
-        '''Switch to a random connected server other than the current one'''
+        '''Switch to a random connected server other than the current one.
+        The standby server is preferred, if any.'''
         servers = self.get_interfaces()    # Those in connected state
         if self.default_server in servers:
             servers.remove(self.default_server)
-        if servers:
+        if self._standby_server in servers:
+            await self.switch_to_interface(self._standby_server)
+        elif servers:
             await self.switch_to_interface(random.choice(servers))
 
+    def _is_usable_as_standby(self, interface: Optional[Interface]) -> bool:
+        return (interface is not None
+                and self.interface is not None
+                and interface != self.interface
+                and interface.is_connected_and_ready()
+                and interface.blockchain == self.interface.blockchain)
+
+    def get_standby_interface(self) -> Optional[Interface]:
+        """Returns a connected interface other than the main one, on the same chain,
+        on which jobs can pre-subscribe, so that failing over to it is fast.
+        We stick to the same one for as long as possible.
+        Returns None unless the 'network_standby_subscriptions' option is set.
+        """
+        if not self.config.get('network_standby_subscriptions', False):
+            return None
+        with self.interfaces_lock:
+            interface = self.interfaces.get(self._standby_server)
+            if not self._is_usable_as_standby(interface):
+                candidates = [i for i in self.interfaces.values() if self._is_usable_as_standby(i)]
+                interface = random.choice(candidates) if candidates else None
+                self._standby_server = interface.server if interface else None
+        return interface
+
     async def switch_lagging_interface(self):
         """If auto_connect and lagging, switch interface (only within fork)."""
         if self.auto_connect and await self._server_is_lagging():
@@ -1110,6 +1138,11 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
     async def get_history_for_scripthash(self, sh: str) -> List[dict]:
         return await self.interface.get_history_for_scripthash(sh)
 
+    @best_effort_reliable
+    @catch_server_exceptions
+    async def get_histories_for_scripthashes(self, shs: Sequence[str]) -> List[List[dict]]:
+        return await self.interface.get_histories_for_scripthashes(shs)
+
     @best_effort_reliable
     @catch_server_exceptions
     async def listunspent_for_scripthash(self, sh: str) -> List[dict]:
@@ -1252,7 +1285,10 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.interfaces = {}
         self._connecting_ifaces.clear()
         self._closing_ifaces.clear()
-        if not full_shutdown:
+        if full_shutdown:
+            blockchain.shutdown_pow_executor()
+            blockchain.close_headers_files()
+        else:
             util.trigger_callback('network_updated')
 
     async def _ensure_there_is_a_main_interface(self):
@@ -1292,6 +1328,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             await maybe_start_new_interfaces()
             await maintain_healthy_spread_of_connected_servers()
             await maintain_main_interface()
+            blockchain.flush_stale_write_buffers()
             await asyncio.sleep(0.1)
 
     @classmethod
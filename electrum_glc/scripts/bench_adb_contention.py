@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Benchmark of lock contention in the address synchronizer: a flood of incoming
+# transactions is added to a wallet with many coins, while other threads keep
+# asking for the balance of the wallet, as the getbalance RPC does.
+# Reports the throughput of the writer and the latency of the readers.
+#
+# usage: bench_adb_contention.py [num_coins] [num_incoming_txs] [num_readers]
+
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from electrum_glc import bitcoin
+from electrum_glc.crypto import sha256d
+from electrum_glc.simple_config import SimpleConfig
+from electrum_glc.transaction import Transaction
+from electrum_glc.util import bh2u, print_msg, create_and_start_event_loop
+from electrum_glc.wallet import restore_wallet_from_text
+
+XPUB = 'zpub6nydoME6CFdJtMpzHW5BNoPz6i6XbeT9qfz72wsRqGdgGEYeivso6xjfw8cGcCyHwF7BNW4LDuHF35XrZsovBLWMF4qXSjmhTXYiHbWqGLt'
+NUM_ADDRESSES = 1000
+
+
+def make_raw_tx(prevouts, outputs) -> str:
+    raw_tx = '02000000' + bitcoin.var_int(len(prevouts))
+    for prevout_hash, prevout_n in prevouts:
+        raw_tx += bh2u(bytes.fromhex(prevout_hash)[::-1]) + prevout_n.to_bytes(4, 'little').hex() + '00' + 'ffffffff'
+    raw_tx += bitcoin.var_int(len(outputs))
+    for addr, value in outputs:
+        script = bitcoin.address_to_script(addr)
+        raw_tx += value.to_bytes(8, 'little').hex() + bitcoin.var_int(len(script) // 2) + script
+    return raw_tx + '00000000'
+
+
+def add_tx(wallet, raw_tx: str, height: int) -> str:
+    txid = bh2u(sha256d(bytes.fromhex(raw_tx))[::-1])
+    wallet.adb.receive_tx_callback(txid, Transaction(raw_tx), height)
+    return txid
+
+
+def make_wallet(config: SimpleConfig, num_coins: int):
+    wallet = restore_wallet_from_text(XPUB, path=None, config=config)['wallet']
+    wallet.create_new_addresses(False, NUM_ADDRESSES - wallet.db.num_receiving_addresses())
+    addresses = wallet.get_receiving_addresses()
+    # mined coins, received from a tx we do not care about
+    coins = []
+    for i in range(num_coins):
+        raw_tx = make_raw_tx([('11' * 32, i)], [(addresses[i % len(addresses)], 100_000)])
+        coins.append((add_tx(wallet, raw_tx, 100 + i // 100), 0))
+    return wallet, coins
+
+
+def run(wallet, coins, num_txs: int, num_readers: int):
+    addresses = wallet.get_receiving_addresses()
+    # each incoming tx spends one of our coins and pays to one of our addresses
+    raw_txs = [make_raw_tx([coins[i]], [(addresses[(i + 1) % len(addresses)], 90_000)])
+               for i in range(num_txs)]
+    writer_done = threading.Event()
+    latencies = []
+
+    def writer():
+        for raw_tx in raw_txs:
+            add_tx(wallet, raw_tx, 0)
+        writer_done.set()
+
+    def reader():
+        while not writer_done.is_set():
+            t0 = time.perf_counter()
+            wallet.get_balance()
+            latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=reader) for i in range(num_readers)]
+    for t in threads:
+        t.start()
+    t0 = time.perf_counter()
+    writer()
+    dt = time.perf_counter() - t0
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return dt, latencies
+
+
+def main():
+    num_coins = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    num_txs = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    num_readers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    electrum_path = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': electrum_path})
+        wallet, coins = make_wallet(config, num_coins)
+        print_msg(f"{num_coins} coins, {num_txs} incoming txs, {num_readers} getbalance threads")
+        dt, latencies = run(wallet, coins, num_txs, num_readers)
+        print_msg(f"writer: {num_txs / dt:.0f} tx/s")
+        if latencies:
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+            print_msg(f"getbalance: {len(latencies)} calls, p50 {percentile(0.5):.2f} ms, "
+                      f"p99 {percentile(0.99):.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+    finally:
+        shutil.rmtree(electrum_path)
+
+
+if __name__ == '__main__':
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        main()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
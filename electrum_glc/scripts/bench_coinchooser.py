@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+#
+# Benchmark of the coin choosers on a wallet with many coins, spread over
+# many addresses, with values from dust-ish amounts up to 1 coin.
+# For a few payment amounts, reports the time taken by make_tx, and the
+# number of inputs, change outputs and the fee of the resulting tx.
+#
+# usage: bench_coinchooser.py [num_coins] [num_addresses] [feerate]
+
+import random
+import sys
+import time
+
+from electrum_glc import bitcoin, coinchooser
+from electrum_glc.address_synchronizer import AddressSynchronizer
+from electrum_glc.bitcoin import COIN
+from electrum_glc.crypto import sha256
+from electrum_glc.transaction import PartialTxOutput
+from electrum_glc.util import print_msg
+
+DUST_THRESHOLD = 546
+AMOUNTS = [10_000, 1_234_567, COIN // 2, 7 * COIN]
+
+
+def make_coins(num_coins: int, num_addresses: int):
+    rnd = random.Random(42)
+    addresses = [bitcoin.hash_to_segwit_addr(sha256(i.to_bytes(4, 'little'))[:20], witver=0)
+                 for i in range(num_addresses)]
+    coins = []
+    for i in range(num_coins):
+        value = int(10 ** rnd.uniform(4, 8))
+        height = rnd.choice([100 + i, 100 + i, 100 + i, 0])
+        prevout_str = f"{sha256(i.to_bytes(4, 'big')).hex()}:{i % 4}"
+        coins.append(AddressSynchronizer._make_txo(
+            addresses[rnd.randrange(num_addresses)], prevout_str, value, False, height))
+    return coins, addresses
+
+
+def main():
+    num_coins = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    num_addresses = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    feerate = int(sys.argv[3]) if len(sys.argv) > 3 else 10  # sat/vbyte
+    coins, addresses = make_coins(num_coins, num_addresses)
+    print_msg(f"{num_coins} coins, {num_addresses} addresses, "
+              f"{sum(c.value_sats() for c in coins) / COIN:.2f} coins total, {feerate} sat/vbyte")
+
+    def fee_estimator(size):
+        return int(round(size * feerate))
+
+    for name, chooser_class in sorted(coinchooser.COIN_CHOOSERS.items()):
+        coin_chooser = chooser_class(enable_output_value_rounding=False)
+        for amount in AMOUNTS:
+            outputs = [PartialTxOutput.from_address_and_value(addresses[0], amount)]
+            t0 = time.perf_counter()
+            tx = coin_chooser.make_tx(coins=coins, inputs=[], outputs=outputs, change_addrs=addresses[1:2],
+                                      fee_estimator_vb=fee_estimator, dust_threshold=DUST_THRESHOLD)
+            dt = time.perf_counter() - t0
+            print_msg(f"{name:<15} {amount:>11} sat: {dt:>7.3f} s  {len(tx.inputs()):>4} inputs, "
+                      f"{len(tx.outputs()) - 1} change, fee {tx.get_fee():>6} sat")
+
+
+if __name__ == '__main__':
+    main()
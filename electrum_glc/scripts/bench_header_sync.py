@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+#
+# Benchmark of header catch-up (time-to-tip) against a mock regtest server.
+# Compares syncing one chunk at a time with the pipelined catch-up mode.
+#
+# usage: bench_header_sync.py [num_headers] [latency_ms]
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import shutil
+
+from electrum_glc import constants, blockchain, util
+from electrum_glc.crypto import sha256
+from electrum_glc.interface import Interface, ServerAddr
+from electrum_glc.simple_config import SimpleConfig
+from electrum_glc.util import bh2u, bfh, make_dir, create_and_start_event_loop, print_msg
+
+# regtest genesis block
+GENESIS_HEADER = "010000000000000000000000000000000000000000000000000000000000000000000000d9ced4ed1130f7b7faad9be25323ffafa33232a17c3edf6cfd97bee6bafbdd97dae5494dffff7f2000000000"
+
+
+def make_regtest_headers(num_headers: int) -> bytes:
+    raw_headers = [bfh(GENESIS_HEADER)]
+    prev_hash = constants.net.GENESIS
+    for height in range(1, num_headers):
+        header = {
+            'version': 0x20000000,
+            'prev_block_hash': prev_hash,
+            'merkle_root': bh2u(sha256(str(height))),
+            'timestamp': 1296688602 + 150 * height,
+            'bits': 0x207fffff,
+            'nonce': height,
+        }
+        raw_headers.append(bfh(blockchain.serialize_header(header)))
+        prev_hash = blockchain.hash_header(header)
+    return b''.join(raw_headers)
+
+
+class MockServerSession:
+
+    def __init__(self, raw_headers: bytes, latency: float):
+        self.raw_headers = raw_headers
+        self.latency = latency
+
+    async def send_request(self, method, params, timeout=None):
+        start_height, count = params
+        await asyncio.sleep(self.latency)
+        size = blockchain.HEADER_SIZE
+        data = self.raw_headers[start_height * size:(start_height + count) * size]
+        return {'count': len(data) // size, 'hex': bh2u(data), 'max': 2016}
+
+
+class MockTaskGroup:
+    async def spawn(self, x):
+        x.close()  # we do not run the interface, only sync_until
+
+
+class MockNetwork:
+    taskgroup = MockTaskGroup()
+
+    def __init__(self, config):
+        self.config = config
+        self.asyncio_loop = util.get_asyncio_loop()
+
+
+async def time_to_tip(raw_headers: bytes, latency: float, chunk_requests_in_flight: int) -> float:
+    electrum_path = tempfile.mkdtemp()
+    try:
+        config = SimpleConfig({'electrum_path': electrum_path,
+                               'header_chunk_requests_in_flight': chunk_requests_in_flight})
+        make_dir(os.path.join(util.get_headers_dir(config), 'forks'))
+        blockchain.blockchains = {}
+        chain = blockchain.Blockchain(config=config, forkpoint=0, parent=None,
+                                      forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain.path(), 'w+').close()
+        chain.update_size()
+        blockchain.blockchains[constants.net.GENESIS] = chain
+        interface = Interface(network=MockNetwork(config), server=ServerAddr.from_str('mock-server:50000:t'), proxy=None)
+        interface.blockchain = chain
+        interface.session = MockServerSession(raw_headers, latency)
+        interface.tip = len(raw_headers) // blockchain.HEADER_SIZE - 1
+        t0 = time.monotonic()
+        await interface.sync_until(0)
+        dt = time.monotonic() - t0
+        assert chain.height() == interface.tip
+        return dt
+    finally:
+        shutil.rmtree(electrum_path)
+
+
+def main():
+    num_headers = int(sys.argv[1]) if len(sys.argv) > 1 else 20 * 2016
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 100) / 1000
+    constants.set_regtest()
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        raw_headers = make_regtest_headers(num_headers)
+        print_msg(f"{num_headers} headers, {latency * 1000:.0f} ms server latency")
+        for in_flight in (1, 2, 4, 8):
+            fut = asyncio.run_coroutine_threadsafe(time_to_tip(raw_headers, latency, in_flight), loop)
+            dt = fut.result()
+            print_msg(f"{in_flight} chunk requests in flight: {dt:.2f} s to tip, {num_headers / dt:.0f} headers/s")
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Micro-benchmarks of transaction (de)serialization, on the real-world
+# transactions found in the unit tests.
+#
+# usage: bench_transaction_serialization.py [num_rounds]
+
+import os
+import re
+import sys
+import time
+
+from electrum_glc.transaction import Transaction, PartialTransaction
+from electrum_glc.util import print_msg
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests')
+
+
+def load_corpus():
+    raw_txs = set()
+    for filename in ('test_transaction.py', 'test_wallet_vertical.py'):
+        with open(os.path.join(TESTS_DIR, filename), 'r', encoding='utf-8') as f:
+            source = f.read()
+        for raw_tx in re.findall(r"['\"]((?:01|02)000000[0-9a-f]{100,})['\"]", source):
+            try:
+                tx = Transaction(raw_tx)
+                if tx.txid() is not None and tx.serialize() == raw_tx:
+                    raw_txs.add(raw_tx)
+            except Exception:
+                pass  # not a complete network tx
+    return sorted(raw_txs)
+
+
+def bench(name: str, func, raw_txs, num_rounds: int):
+    items = [func.prepare(raw_tx) for raw_tx in raw_txs] if hasattr(func, 'prepare') else raw_txs
+    t0 = time.perf_counter()
+    for i in range(num_rounds):
+        for item in items:
+            func(item)
+    dt = time.perf_counter() - t0
+    n = num_rounds * len(raw_txs)
+    print_msg(f"{name:<28} {n / dt:>10.0f} tx/s  ({dt / n * 1e6:.1f} us/tx)")
+
+
+def deserialize_hex(raw_tx: str):
+    Transaction(raw_tx).deserialize()
+
+
+def deserialize_bytes(raw_tx: bytes):
+    Transaction(raw_tx).deserialize()
+deserialize_bytes.prepare = bytes.fromhex
+
+
+def txid(raw_tx: str):
+    Transaction(raw_tx).txid()
+
+
+def serialize(tx: Transaction):
+    tx.serialize_to_network()
+serialize.prepare = lambda raw_tx: Transaction(raw_tx)
+
+
+def serialize_partial(tx: PartialTransaction):
+    tx.serialize_to_network(include_sigs=False)
+serialize_partial.prepare = lambda raw_tx: PartialTransaction.from_tx(Transaction(raw_tx))
+
+
+def main():
+    num_rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    raw_txs = load_corpus()
+    print_msg(f"{len(raw_txs)} transactions, {sum(len(raw_tx) // 2 for raw_tx in raw_txs)} bytes, {num_rounds} rounds")
+    bench('deserialize (hex)', deserialize_hex, raw_txs, num_rounds)
+    bench('deserialize (bytes)', deserialize_bytes, raw_txs, num_rounds)
+    bench('deserialize + txid', txid, raw_txs, num_rounds)
+    bench('serialize', serialize, raw_txs, num_rounds)
+    bench('serialize (unsigned)', serialize_partial, raw_txs, num_rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Memory benchmark of the transaction classes, on a synthetic wallet history:
+# one deserialized Transaction per tx, as kept by the wallet db, and one
+# PartialTxInput per output, as created by get_addr_outputs.
+# Reports the resident set size used by the txs and by the txos.
+#
+# usage: bench_tx_memory.py [num_txs]
+
+import gc
+import os
+import resource
+import sys
+
+from electrum_glc import bitcoin
+from electrum_glc.address_synchronizer import AddressSynchronizer
+from electrum_glc.transaction import Transaction
+from electrum_glc.util import print_msg
+
+NUM_INPUTS = 2
+NUM_OUTPUTS = 2
+
+
+def get_rss() -> int:
+    """Returns the resident set size of this process, in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # peak rss only; ru_maxrss is in KiB on linux, but bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def make_raw_tx(i: int) -> bytes:
+    raw_tx = bytearray((2).to_bytes(4, 'little'))
+    raw_tx += bitcoin.var_int_bytes(NUM_INPUTS)
+    for j in range(NUM_INPUTS):
+        prevout_hash = (i * NUM_INPUTS + j).to_bytes(32, 'little')
+        raw_tx += prevout_hash + j.to_bytes(4, 'little')
+        raw_tx += bitcoin.var_int_bytes(107) + bytes(107)  # p2pkh scriptSig
+        raw_tx += b'\xfd\xff\xff\xff'
+    raw_tx += bitcoin.var_int_bytes(NUM_OUTPUTS)
+    for j in range(NUM_OUTPUTS):
+        script = bytes.fromhex('76a914') + i.to_bytes(20, 'little') + bytes.fromhex('88ac')
+        raw_tx += (100_000 + j).to_bytes(8, 'little') + bitcoin.var_int_bytes(len(script)) + script
+    raw_tx += (0).to_bytes(4, 'little')
+    return bytes(raw_tx)
+
+
+def main():
+    num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    raw_txs = [make_raw_tx(i) for i in range(num_txs)]
+    gc.collect()
+    rss0 = get_rss()
+
+    txs = {}
+    for raw_tx in raw_txs:
+        tx = Transaction(raw_tx)
+        txs[tx.txid()] = tx
+    gc.collect()
+    rss1 = get_rss()
+
+    txos = {}
+    for txid, tx in txs.items():
+        for out_idx, txout in enumerate(tx.outputs()):
+            prevout_str = f"{txid}:{out_idx}"
+            utxo = AddressSynchronizer._make_txo(txout.address, prevout_str, txout.value, False, 100)
+            txos[utxo.prevout] = utxo
+    gc.collect()
+    rss2 = get_rss()
+
+    num_txos = len(txos)
+    print_msg(f"{num_txs} txs ({NUM_INPUTS} inputs, {NUM_OUTPUTS} outputs), {num_txos} txos")
+    print_msg(f"txs:  {(rss1 - rss0) / 2**20:.1f} MiB  ({(rss1 - rss0) / num_txs:.0f} bytes/tx)")
+    print_msg(f"txos: {(rss2 - rss1) / 2**20:.1f} MiB  ({(rss2 - rss1) / num_txos:.0f} bytes/txo)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#
+# Benchmark of signing transactions with many inputs, e.g. consolidations.
+# The inputs are spread over a few keys, as if they were coins received
+# on a few addresses of the wallet.
+#
+# usage: bench_tx_signing.py [num_inputs] [num_keys] [script_type]
+
+import sys
+import time
+
+from electrum_glc import bitcoin, ecc
+from electrum_glc.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_glc.util import print_msg
+
+
+def make_tx(num_inputs: int, keys, script_type: str) -> PartialTransaction:
+    inputs = []
+    for i in range(num_inputs):
+        pubkey = keys[i % len(keys)].get_public_key_bytes(compressed=True)
+        txin = PartialTxInput(prevout=TxOutpoint(txid=i.to_bytes(32, 'little'), out_idx=i % 3))
+        txin.script_type = script_type
+        txin.pubkeys = [pubkey]
+        txin.num_sig = 1
+        txin._trusted_address = bitcoin.pubkey_to_address(script_type, pubkey.hex())
+        txin._trusted_value_sats = 100_000
+        inputs.append(txin)
+    outputs = [PartialTxOutput.from_address_and_value(inputs[0].address, num_inputs * 90_000)]
+    return PartialTransaction.from_io(inputs, outputs, locktime=0)
+
+
+def main():
+    num_inputs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_keys = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    script_type = sys.argv[3] if len(sys.argv) > 3 else 'p2wpkh'
+    keys = [ecc.ECPrivkey((i + 1).to_bytes(32, 'big')) for i in range(num_keys)]
+    keypairs = {k.get_public_key_hex(compressed=True): (k.get_secret_bytes(), True) for k in keys}
+    print_msg(f"{num_inputs} {script_type} inputs, {num_keys} keys")
+    tx = make_tx(num_inputs, keys, script_type)
+    t0 = time.perf_counter()
+    tx.sign(keypairs)
+    dt = time.perf_counter() - t0
+    assert tx.is_complete()
+    print_msg(f"sign: {dt:.2f} s  ({dt / num_inputs * 1e6:.0f} us/input)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+# Benchmark of opening a large wallet: time-to-first-balance and peak RSS,
+# on a synthetic watching-only wallet with many transactions.
+# Compares lazy loading of the wallet file with converting all of it upfront.
+#
+# usage: bench_wallet_load.py [num_txs]
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from electrum_glc import bitcoin, json_db, wallet_db
+from electrum_glc.crypto import sha256d
+from electrum_glc.simple_config import SimpleConfig
+from electrum_glc.storage import WalletStorage
+from electrum_glc.util import bh2u, print_msg, create_and_start_event_loop
+from electrum_glc.wallet import Wallet, restore_wallet_from_text
+
+XPUB = 'zpub6nydoME6CFdJtMpzHW5BNoPz6i6XbeT9qfz72wsRqGdgGEYeivso6xjfw8cGcCyHwF7BNW4LDuHF35XrZsovBLWMF4qXSjmhTXYiHbWqGLt'
+NUM_ADDRESSES = 1000
+
+
+def make_raw_tx(prevout_hash: str, script: str, value: int) -> str:
+    return ('02000000'
+            + '01' + bh2u(bytes.fromhex(prevout_hash)[::-1]) + '00000000' + '00' + 'ffffffff'
+            + '01' + value.to_bytes(8, 'little').hex() + bitcoin.var_int(len(script) // 2) + script
+            + '00000000')
+
+
+def make_wallet(path: str, config: SimpleConfig, num_txs: int) -> None:
+    wallet = restore_wallet_from_text(XPUB, path=path, config=config)['wallet']
+    for i in range(NUM_ADDRESSES - wallet.db.num_receiving_addresses()):
+        wallet.create_new_address(False)
+    wallet.save_db(compact=True)
+    addresses = wallet.get_receiving_addresses()
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    txi, txo, transactions, spent_outpoints = {}, {}, {}, {}
+    verified_tx, prevouts_by_scripthash = {}, {}
+    addr_history = {addr: [] for addr in addresses}
+    # a chain of transactions, each spending the output of the previous one
+    prev_txid, prev_addr, value = '00' * 32, None, 10 ** 12
+    for i in range(num_txs):
+        addr = addresses[i % len(addresses)]
+        script = bitcoin.address_to_script(addr)
+        value -= 1000
+        raw_tx = make_raw_tx(prev_txid, script, value)
+        txid = bh2u(sha256d(bytes.fromhex(raw_tx))[::-1])
+        height = 100_000 + i
+        transactions[txid] = raw_tx
+        txo[txid] = {addr: {'0': [value, False]}}
+        prevouts_by_scripthash.setdefault(bitcoin.script_to_scripthash(script), []).append([f'{txid}:0', value])
+        if prev_addr is not None:
+            txi[txid] = {prev_addr: {f'{prev_txid}:0': value + 1000}}
+            spent_outpoints[prev_txid] = {'0': txid}
+            addr_history[prev_addr].append([txid, height])
+        addr_history[addr].append([txid, height])
+        verified_tx[txid] = [height, 1600000000 + i, 1, '00' * 32]
+        prev_txid, prev_addr = txid, addr
+    data.update({
+        'txi': txi, 'txo': txo, 'transactions': transactions, 'spent_outpoints': spent_outpoints,
+        'addr_history': addr_history, 'verified_tx3': verified_tx,
+        'prevouts_by_scripthash': prevouts_by_scripthash, 'stored_height': 100_000 + num_txs,
+    })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+
+
+def measure(path: str, lazy: bool) -> None:
+    if not lazy:
+        # emulate converting the whole file upfront
+        wallet_db.LazyStoredDict = json_db.StoredDict
+    config = SimpleConfig({'electrum_path': os.path.dirname(path)})
+    t0 = time.monotonic()
+    storage = WalletStorage(path)
+    db = wallet_db.WalletDB(storage.read(), manual_upgrades=False)
+    wallet = Wallet(db, storage, config=config)
+    balance = wallet.get_balance()
+    dt = time.monotonic() - t0
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024  # MiB on linux
+    print_msg(json.dumps({'time': dt, 'peak_rss': peak_rss, 'balance': balance}))
+
+
+def main():
+    num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    user_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(user_dir, 'wallet')
+        config = SimpleConfig({'electrum_path': user_dir})
+        make_wallet(path, config, num_txs)
+        print_msg(f"{num_txs} transactions, wallet file: {os.path.getsize(path) // 2**20} MiB")
+        for lazy in (False, True):
+            out = subprocess.check_output([sys.executable, __file__, '--measure', path, str(int(lazy))])
+            r = json.loads(out.splitlines()[-1])
+            print_msg(f"{'lazy' if lazy else 'eager'} loading: {r['time']:.2f} s to first balance, "
+                      f"peak RSS {r['peak_rss']} MiB, balance {r['balance']}")
+    finally:
+        shutil.rmtree(user_dir)
+
+
+if __name__ == '__main__':
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == '--measure':
+            measure(sys.argv[2], bool(int(sys.argv[3])))
+        else:
+            main()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# Benchmark of restoring a wallet with many used addresses (time to discover
+# all of them) against a mock server. Block size 1 emulates rolling the gap
+# limit forward one address at a time, as synchronize() does.
+#
+# usage: bench_wallet_restore.py [num_used_addresses] [latency_ms]
+
+import asyncio
+import shutil
+import sys
+import tempfile
+import time
+
+from electrum_glc import bitcoin, util
+from electrum_glc.interface import Interface, ServerAddr
+from electrum_glc.simple_config import SimpleConfig
+from electrum_glc.util import create_and_start_event_loop, print_msg
+from electrum_glc.wallet import restore_wallet_from_text
+
+XPUB = 'zpub6nydoME6CFdJtMpzHW5BNoPz6i6XbeT9qfz72wsRqGdgGEYeivso6xjfw8cGcCyHwF7BNW4LDuHF35XrZsovBLWMF4qXSjmhTXYiHbWqGLt'
+
+
+class MockServerSession:
+
+    def __init__(self, used_scripthashes, latency: float):
+        self.used_scripthashes = used_scripthashes
+        self.latency = latency
+        self.num_requests = 0
+
+    async def send_request_batch(self, requests, timeout=None):
+        await asyncio.sleep(self.latency)
+        self.num_requests += len(requests)
+        return [[{'tx_hash': sh, 'height': 100}] if sh in self.used_scripthashes else []
+                for method, (sh,) in requests]
+
+
+class MockTaskGroup:
+    async def spawn(self, x):
+        x.close()  # we do not run the interface
+
+
+class MockNetwork:
+    taskgroup = MockTaskGroup()
+
+    def __init__(self, config):
+        self.config = config
+        self.asyncio_loop = util.get_asyncio_loop()
+        self.interface = None
+
+    async def get_histories_for_scripthashes(self, shs):
+        return await self.interface.get_histories_for_scripthashes(shs)
+
+
+def get_used_scripthashes(config: SimpleConfig, num_used: int) -> set:
+    wallet = restore_wallet_from_text(XPUB, path=None, config=config)['wallet']
+    # every other receiving address is used, the last one at index 2 * (num_used - 1)
+    return {bitcoin.address_to_scripthash(wallet.derive_address(0, 2 * n)) for n in range(num_used)}
+
+
+async def time_to_restore(config: SimpleConfig, used_scripthashes: set, latency: float):
+    network = MockNetwork(config)
+    network.interface = Interface(network=network, server=ServerAddr.from_str('mock-server:50000:t'), proxy=None)
+    network.interface.session = MockServerSession(used_scripthashes, latency)
+    wallet = restore_wallet_from_text(XPUB, path=None, config=config)['wallet']
+    wallet.network = network
+    t0 = time.monotonic()
+    await wallet.discover_addresses()
+    dt = time.monotonic() - t0
+    assert wallet.db.num_receiving_addresses() == 2 * len(used_scripthashes) - 1 + wallet.gap_limit
+    return dt, network.interface.session.num_requests
+
+
+def main():
+    num_used = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 100) / 1000
+    electrum_path = tempfile.mkdtemp()
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        config = SimpleConfig({'electrum_path': electrum_path})
+        used_scripthashes = get_used_scripthashes(config, num_used)
+        print_msg(f"{num_used} used addresses, {latency * 1000:.0f} ms server latency")
+        for block_size in (1, 20, 50, 200):
+            config.set_key('address_discovery_block_size', block_size)
+            fut = asyncio.run_coroutine_threadsafe(time_to_restore(config, used_scripthashes, latency), loop)
+            dt, num_requests = fut.result()
+            print_msg(f"block size {block_size}: {dt:.2f} s to discover, {num_requests} history requests")
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+        shutil.rmtree(electrum_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -30,7 +30,7 @@ from functools import partial
 
 from electrum_glc.wallet import Wallet, Abstract_Wallet
 from electrum_glc.storage import WalletStorage
-from electrum_glc.wallet_db import WalletDB
+from electrum_glc.wallet_db import load_wallet_db
 from electrum_glc.simple_config import SimpleConfig
 from electrum_glc.util import InvalidPassword
 
@@ -84,7 +84,7 @@ if __name__ == '__main__':
         test_password = partial(test_password_for_storage_encryption, storage)
         print(f"wallet found: with storage encryption.")
     else:
-        db = WalletDB(storage.read(), manual_upgrades=True)
+        db = load_wallet_db(storage, manual_upgrades=True)
         wallet = Wallet(db, storage, config=config)
         if not wallet.has_password():
             print("wallet found but it is not encrypted.")
@@ -18,6 +18,33 @@
 
 import hashlib
 import hmac
+from typing import Callable, List, Optional, Sequence
+
+HAS_SCRYPT_MODULE = False
+try:
+    import scrypt as scrypt_module
+except ImportError:
+    pass
+else:
+    HAS_SCRYPT_MODULE = True
+
+HAS_HASHLIB_SCRYPT = hasattr(hashlib, 'scrypt')
+
+HAS_NUMPY = False
+try:
+    import numpy
+except ImportError:
+    pass
+else:
+    HAS_NUMPY = True
+
+
+HEADER_SIZE = 80  # bytes
+HASH_SIZE = 32  # bytes
+# headers hashed together by the numpy backend. the scratchpad takes 128 KiB per header,
+# so this bounds memory usage to 64 MiB regardless of how many headers are passed in.
+NUMPY_BATCH_SIZE = 512
+
 
 def scrypt_1024_1_1_80(header):
     if not isinstance(header, bytes) or len(header) != 80:
@@ -244,6 +271,151 @@ def _xor_salsa8_2(X):
     ]
 
 
+def _scrypt_1024_1_1_80_scrypt_module(header: bytes) -> bytes:
+    return scrypt_module.hash(header, header, N=1024, r=1, p=1, buflen=HASH_SIZE)
+
+
+def _scrypt_1024_1_1_80_hashlib(header: bytes) -> bytes:
+    return hashlib.scrypt(header, salt=header, n=1024, r=1, p=1, dklen=HASH_SIZE)
+
+
+# the Salsa20 state as four diagonals, so that the four quarter-rounds of a
+# column round are independent rows of the same array (as in SIMD implementations)
+_DIAG_A = [0, 5, 10, 15]
+_DIAG_B = [4, 9, 14, 3]
+_DIAG_C = [8, 13, 2, 7]
+_DIAG_D = [12, 1, 6, 11]
+
+
+def _salsa20_8_numpy(B, Bx) -> None:
+    """B = salsa20/8(B ^ Bx), in place.
+    B and Bx are (16, N) uint32 arrays; column n holds the state of the n-th header.
+    """
+    B ^= Bx
+    a, b, c, d = B[_DIAG_A], B[_DIAG_B], B[_DIAG_C], B[_DIAG_D]
+    t = numpy.empty_like(a)
+    u = numpy.empty_like(a)
+
+    def quarter(x, y, z, rot):
+        # x ^= rotl32(y + z, rot)
+        numpy.add(y, z, out=t)
+        numpy.left_shift(t, numpy.uint32(rot), out=u)
+        numpy.right_shift(t, numpy.uint32(32 - rot), out=t)
+        numpy.bitwise_or(u, t, out=u)
+        x ^= u
+
+    for _ in range(4):
+        # column round
+        quarter(b, a, d, 7)
+        quarter(c, b, a, 9)
+        quarter(d, c, b, 13)
+        quarter(a, d, c, 18)
+        # row round: same as a column round after rotating the diagonals
+        b = numpy.roll(b, 1, axis=0)
+        c = numpy.roll(c, 2, axis=0)
+        d = numpy.roll(d, -1, axis=0)
+        quarter(d, a, b, 7)
+        quarter(c, d, a, 9)
+        quarter(b, c, d, 13)
+        quarter(a, b, c, 18)
+        b = numpy.roll(b, -1, axis=0)
+        c = numpy.roll(c, -2, axis=0)
+        d = numpy.roll(d, 1, axis=0)
+    B[_DIAG_A] += a
+    B[_DIAG_B] += b
+    B[_DIAG_C] += c
+    B[_DIAG_D] += d
+
+
+def _xor_salsa8_2_numpy(X) -> None:
+    _salsa20_8_numpy(X[:16], X[16:])
+    _salsa20_8_numpy(X[16:], X[:16])
+
+
+def _scrypt_1024_1_1_80_batch_numpy(headers: Sequence[bytes]) -> List[bytes]:
+    """Lane-parallel scrypt: runs the Salsa20/8 rounds of all headers at once
+    over a (32, N) uint32 array, so the Python overhead is paid per batch.
+    """
+    n = len(headers)
+    B = b''.join(hashlib.pbkdf2_hmac('sha256', h, h, 1, 128) for h in headers)
+    # X[j, n] is the j-th little-endian word of the n-th header's state
+    X = numpy.frombuffer(B, dtype='<u4').reshape(n, 32).T.astype(numpy.uint32)
+    V = numpy.empty((1024, n, 32), dtype=numpy.uint32)
+    for i in range(1024):
+        V[i] = X.T
+        _xor_salsa8_2_numpy(X)
+    lanes = numpy.arange(n)
+    for i in range(1024):
+        k = X[16] & 1023
+        X ^= V[k, lanes].T
+        _xor_salsa8_2_numpy(X)
+    B = X.T.astype('<u4').tobytes()
+    return [hashlib.pbkdf2_hmac('sha256', h, B[i*128:(i+1)*128], 1, HASH_SIZE)
+            for i, h in enumerate(headers)]
+
+
+def _make_batch_function(f: Callable[[bytes], bytes]) -> Callable[[Sequence[bytes]], List[bytes]]:
+    return lambda headers: [f(h) for h in headers]
+
+
+# backend name -> function hashing a list of 80 byte headers
+# in order of preference
+_BATCH_BACKENDS = {}
+if HAS_SCRYPT_MODULE:
+    _BATCH_BACKENDS['scrypt'] = _make_batch_function(_scrypt_1024_1_1_80_scrypt_module)
+if HAS_HASHLIB_SCRYPT:
+    _BATCH_BACKENDS['hashlib'] = _make_batch_function(_scrypt_1024_1_1_80_hashlib)
+if HAS_NUMPY:
+    _BATCH_BACKENDS['numpy'] = _scrypt_1024_1_1_80_batch_numpy
+_BATCH_BACKENDS['python'] = _make_batch_function(scrypt_1024_1_1_80)
+
+
+def get_available_backends() -> Sequence[str]:
+    return list(_BATCH_BACKENDS)
+
+
+def get_default_backend() -> str:
+    return next(iter(_BATCH_BACKENDS))
+
+
+def has_fast_backend() -> bool:
+    return get_default_backend() != 'python'
+
+
+def scrypt_1024_1_1_80_fast(header: bytes) -> bytes:
+    """Hashes a single header with the fastest available backend."""
+    if HAS_SCRYPT_MODULE:
+        return _scrypt_1024_1_1_80_scrypt_module(header)
+    if HAS_HASHLIB_SCRYPT:
+        return _scrypt_1024_1_1_80_hashlib(header)
+    # the numpy backend only pays off for many headers
+    return scrypt_1024_1_1_80(header)
+
+
+def scrypt_1024_1_1_80_batch(headers: bytes, *, backend: Optional[str] = None) -> bytes:
+    """Hashes the concatenation of 80 byte headers.
+    Returns the concatenation of the 32 byte PoW hashes, in the same order.
+    """
+    if not isinstance(headers, (bytes, bytearray, memoryview)):
+        raise ValueError('headers must be bytes')
+    headers = bytes(headers)
+    if len(headers) % HEADER_SIZE != 0:
+        raise ValueError('headers must be a multiple of 80 bytes')
+    if backend is None:
+        backend = get_default_backend()
+    try:
+        f = _BATCH_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f'scrypt backend not available: {backend!r}') from None
+    num = len(headers) // HEADER_SIZE
+    batch_size = NUMPY_BATCH_SIZE if backend == 'numpy' else max(num, 1)
+    result = []
+    for start in range(0, num, batch_size):
+        end = min(start + batch_size, num)
+        batch = [headers[i*HEADER_SIZE:(i+1)*HEADER_SIZE] for i in range(start, end)]
+        result.extend(f(batch))
+    return b''.join(result)
+
 
 if __name__ == '__main__':
     from binascii import unhexlify
@@ -265,3 +437,18 @@ if __name__ == '__main__':
     dt = (default_timer() - t0) / len(vectors)
     print("%.1f ms/hash" % (dt*1000))
     print("%.2f hash/s" % (1.0 / dt))
+
+    # batched verification of a header chunk, with every available backend
+    import os
+    import sys
+    num_headers = int(sys.argv[1]) if len(sys.argv) > 1 else 2016
+    headers = os.urandom(HEADER_SIZE * num_headers)
+    batch_vectors = b''.join(unhexlify(header) for header, _ in vectors)
+    batch_hashes = b''.join(unhexlify(hash) for _, hash in vectors)
+    for backend in get_available_backends():
+        assert scrypt_1024_1_1_80_batch(batch_vectors, backend=backend) == batch_hashes, backend
+        n = num_headers if backend != 'python' else min(num_headers, 20)
+        t0 = default_timer()
+        scrypt_1024_1_1_80_batch(headers[:HEADER_SIZE * n], backend=backend)
+        dt = default_timer() - t0
+        print("%-8s %10.1f headers/s" % (backend, n / dt))
@@ -27,14 +27,19 @@ import threading
 import stat
 import hashlib
 import base64
+import json
 import zlib
+import codecs
 from enum import IntEnum
+from typing import Sequence, Tuple, Iterator, BinaryIO
 
 from . import ecc
+from .crypto import aes_encrypt_with_iv, aes_decrypt_with_iv, hmac_oneshot
 from .util import (profiler, InvalidPassword, WalletFileException, bfh, standardize_path,
                    test_read_write_permissions, os_chmod)
 
 from .wallet_db import WalletDB
+from .wallet_sqlite_db import is_sqlite_file
 from .logging import Logger
 
 
@@ -53,6 +58,25 @@ class StorageEncryptionVersion(IntEnum):
 class StorageReadWriteError(Exception): pass
 
 
+# magic bytes of the chunked format of encrypted wallet files
+STREAM_ENCRYPTION_MAGICS = {
+    b'BIS1': StorageEncryptionVersion.USER_PASSWORD,
+    b'BIS2': StorageEncryptionVersion.XPUB_PASSWORD,
+}
+# size of the compressed plaintext in each chunk
+STREAM_CHUNK_SIZE = 2 ** 20
+
+
+JOURNAL_VERSION = 1
+
+
+def get_journal_path(path: str) -> str:
+    """Changes to a wallet file are appended to this file,
+    until they are folded into the wallet file itself.
+    """
+    return path + '.journal'
+
+
 # TODO: Rename to Storage
 class WalletStorage(Logger):
 
@@ -63,28 +87,132 @@ class WalletStorage(Logger):
         self.logger.info(f"wallet path {self.path}")
         self.pubkey = None
         self.decrypted = ''
+        self._journal_path = get_journal_path(self.path)
+        self._journal = []  # serialized changes, not in the wallet file yet
+        self._journal_size = None  # None if there is no valid journal
+        self._snapshot_hash = None
+        self._is_sqlite = False
+        self._is_stream_encrypted = False
+        # the last password-derived key, with a salted hash of the password
+        self._password_key_salt = os.urandom(32)
+        self._password_key = None
         try:
             test_read_write_permissions(self.path)
         except IOError as e:
             raise StorageReadWriteError(e) from e
         if self.file_exists():
+            with open(self.path, "rb") as f:
+                magic = f.read(4)
+        if self.file_exists() and is_sqlite_file(self.path):
+            # the file is read by SqliteWalletDB
+            self._is_sqlite = True
+            self.raw = ''
+            self._encryption_version = StorageEncryptionVersion.PLAINTEXT
+        elif self.file_exists() and magic in STREAM_ENCRYPTION_MAGICS:
+            # the file is read when it is decrypted
+            self._is_stream_encrypted = True
+            self.raw = ''
+            self._encryption_version = STREAM_ENCRYPTION_MAGICS[magic]
+        elif self.file_exists():
             with open(self.path, "r", encoding='utf-8') as f:
                 self.raw = f.read()
             self._encryption_version = self._init_encryption_version()
+            if not self.is_encrypted():
+                self._read_journal()
         else:
             self.raw = ''
             self._encryption_version = StorageEncryptionVersion.PLAINTEXT
+        self._snapshot_size = len(self.raw)
+
+    @staticmethod
+    def _get_snapshot_hash(s: str) -> str:
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+    def _get_journal_header(self) -> bytes:
+        header = {'version': JOURNAL_VERSION, 'snapshot': self._snapshot_hash}
+        return json.dumps(header).encode('utf-8') + b'\n'
+
+    def _read_journal(self) -> None:
+        self._snapshot_hash = self._get_snapshot_hash(self.raw)
+        try:
+            with open(self._journal_path, "rb") as f:
+                journal = f.read()
+        except FileNotFoundError:
+            return
+        header = self._get_journal_header()
+        if not journal.startswith(header):
+            # the journal belongs to an older snapshot, whose changes are already in the wallet file
+            self.logger.info("ignoring stale journal")
+            return
+        # ignore a partially written last line
+        end = journal.rfind(b'\n') + 1
+        self._journal = journal[len(header):end].decode('utf-8').splitlines()
+        self._journal_size = end
+
+    def has_journal(self) -> bool:
+        return self._journal_size is not None
+
+    def is_sqlite(self) -> bool:
+        """Return if the wallet file is an sqlite database, see SqliteWalletDB."""
+        return self._is_sqlite
+
+    def set_file_is_sqlite(self) -> None:
+        """Called by SqliteWalletDB once it has written the wallet file."""
+        self._file_exists = True
+        self._is_sqlite = True
 
     def read(self):
-        return self.decrypted if self.is_encrypted() else self.raw
+        assert not self.is_sqlite()
+        if self.is_encrypted():
+            return self.decrypted
+        if self._journal:
+            # see WalletDB.load_data
+            return self.raw + ''.join(',\n' + line for line in self._journal)
+        return self.raw
+
+    def can_append_to_journal(self) -> bool:
+        # note: the journal is not encrypted
+        return self.file_exists() and not self.is_encrypted() and not self.is_sqlite()
+
+    def journal_needs_compaction(self) -> bool:
+        return self.has_journal() and self._journal_size > self._snapshot_size
+
+    def append_to_journal(self, changes: Sequence[str]) -> None:
+        """Appends serialized changes to the journal of the wallet file."""
+        assert self.can_append_to_journal()
+        data = b''.join(line.encode('utf-8') + b'\n' for line in changes)
+        if not self.has_journal():
+            mode = os.stat(self.path).st_mode
+            data = self._get_journal_header() + data
+            with open(self._journal_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os_chmod(self._journal_path, mode)
+            self._journal_size = len(data)
+        else:
+            with open(self._journal_path, "r+b") as f:
+                f.seek(self._journal_size)
+                f.truncate()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_size += len(data)
+        self._journal = []
 
     def write(self, data: str) -> None:
-        s = self.encrypt_before_writing(data)
         temp_path = "%s.tmp.%s" % (self.path, os.getpid())
-        with open(temp_path, "w", encoding='utf-8') as f:
-            f.write(s)
-            f.flush()
-            os.fsync(f.fileno())
+        if self.pubkey:
+            with open(temp_path, "wb") as f:
+                size = self._write_encrypted(f, data)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with open(temp_path, "w", encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            size = len(data)
 
         try:
             mode = os.stat(self.path).st_mode
@@ -97,8 +225,30 @@ class WalletStorage(Logger):
         os.replace(temp_path, self.path)
         os_chmod(self.path, mode)
         self._file_exists = True
+        self._is_sqlite = False
+        self._is_stream_encrypted = bool(self.pubkey)
+        # the new snapshot contains all journaled changes
+        self._snapshot_hash = None if self.pubkey else self._get_snapshot_hash(data)
+        self._snapshot_size = size
+        self._journal = []
+        self._journal_size = None
+        try:
+            os.unlink(self._journal_path)
+        except FileNotFoundError:
+            pass
         self.logger.info(f"saved {self.path}")
 
+    def delete(self) -> None:
+        """Deletes the wallet file, and its journal."""
+        for path in (self.path, self._journal_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._file_exists = False
+        self._journal = []
+        self._journal_size = None
+
     def file_exists(self) -> bool:
         return self._file_exists
 
@@ -152,6 +302,13 @@ class WalletStorage(Logger):
         ec_key = ecc.ECPrivkey.from_arbitrary_size_secret(secret)
         return ec_key
 
+    def _get_eckey_from_password_cached(self, password) -> ecc.ECPrivkey:
+        """Same as get_eckey_from_password, without running PBKDF2 again for the last password."""
+        pw_hash = hmac_oneshot(self._password_key_salt, (password or '').encode('utf-8'), hashlib.sha256)
+        if self._password_key is None or self._password_key[0] != pw_hash:
+            self._password_key = pw_hash, self.get_eckey_from_password(password)
+        return self._password_key[1]
+
     def _get_encryption_magic(self):
         v = self._encryption_version
         if v == StorageEncryptionVersion.USER_PASSWORD:
@@ -161,12 +318,118 @@ class WalletStorage(Logger):
         else:
             raise WalletFileException('no encryption magic for version: %s' % v)
 
+    def _get_stream_encryption_magic(self) -> bytes:
+        for magic, v in STREAM_ENCRYPTION_MAGICS.items():
+            if v == self._encryption_version:
+                return magic
+        raise WalletFileException('no encryption magic for version: %s' % self._encryption_version)
+
+    @staticmethod
+    def _get_stream_keys(ecdh_point: ecc.ECPubkey) -> Tuple[bytes, bytes, bytes]:
+        # same key derivation as ECIES, see ECPubkey.encrypt_message
+        key = hashlib.sha512(ecdh_point.get_public_key_bytes(compressed=True)).digest()
+        return key[0:16], key[16:32], key[32:]
+
+    @staticmethod
+    def _get_chunk_mac(key_m: bytes, header: bytes, index: int, prefix: bytes, ciphertext: bytes) -> bytes:
+        # the mac covers the position of the chunk, so that chunks cannot be reordered or dropped
+        return hmac_oneshot(key_m, header + index.to_bytes(8, 'big') + prefix + ciphertext, hashlib.sha256)
+
+    @staticmethod
+    def _get_chunk_iv(iv: bytes, index: int) -> bytes:
+        return hashlib.sha256(iv + index.to_bytes(8, 'big')).digest()[0:16]
+
+    @staticmethod
+    def _compress_in_chunks(plaintext: str) -> Iterator[bytes]:
+        """Yields the compressed plaintext in chunks of STREAM_CHUNK_SIZE bytes (the last one may be smaller)."""
+        compressor = zlib.compressobj(level=zlib.Z_BEST_SPEED)
+        pending = b''
+        for i in range(0, len(plaintext), STREAM_CHUNK_SIZE):
+            pending += compressor.compress(plaintext[i:i + STREAM_CHUNK_SIZE].encode('utf-8'))
+            while len(pending) >= STREAM_CHUNK_SIZE:
+                yield pending[:STREAM_CHUNK_SIZE]
+                pending = pending[STREAM_CHUNK_SIZE:]
+        pending += compressor.flush()
+        while True:
+            yield pending[:STREAM_CHUNK_SIZE]
+            pending = pending[STREAM_CHUNK_SIZE:]
+            if not pending:
+                break
+
+    def _write_encrypted(self, f: BinaryIO, plaintext: str) -> int:
+        """Writes plaintext to f, compressed and encrypted to self.pubkey.
+        Returns the number of bytes written.
+
+        Format: magic, ephemeral pubkey, then a sequence of chunks.
+        Each chunk is: is_last (1 byte), length of ciphertext (4 bytes),
+        ciphertext (AES-128-CBC), hmac-sha256.
+        """
+        ephemeral = ecc.ECPrivkey.generate_random_key()
+        public_key = ecc.ECPubkey(bfh(self.pubkey))
+        iv, key_e, key_m = self._get_stream_keys(public_key * ephemeral.secret_scalar)
+        header = self._get_stream_encryption_magic() + ephemeral.get_public_key_bytes(compressed=True)
+        f.write(header)
+        size = len(header)
+        chunks = self._compress_in_chunks(plaintext)
+        data = next(chunks)
+        index = 0
+        while data is not None:
+            next_data = next(chunks, None)
+            ciphertext = aes_encrypt_with_iv(key_e, self._get_chunk_iv(iv, index), data)
+            prefix = bytes([next_data is None]) + len(ciphertext).to_bytes(4, 'big')
+            mac = self._get_chunk_mac(key_m, header, index, prefix, ciphertext)
+            f.write(prefix)
+            f.write(ciphertext)
+            f.write(mac)
+            size += len(prefix) + len(ciphertext) + len(mac)
+            data = next_data
+            index += 1
+        return size
+
+    def _read_encrypted(self, ec_key: ecc.ECPrivkey) -> str:
+        """Reads and decrypts the wallet file, see _write_encrypted.
+        Raises an InvalidPassword exception on invalid password.
+        """
+        with open(self.path, "rb") as f:
+            header = f.read(37)
+            if len(header) != 37 or header[0:4] != self._get_stream_encryption_magic():
+                raise WalletFileException('invalid ciphertext: invalid magic bytes')
+            try:
+                ephemeral_pubkey = ecc.ECPubkey(header[4:])
+            except ecc.InvalidECPointException as e:
+                raise WalletFileException('invalid ciphertext: invalid ephemeral pubkey') from e
+            iv, key_e, key_m = self._get_stream_keys(ephemeral_pubkey * ec_key.secret_scalar)
+            decompressor = zlib.decompressobj()
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            parts = []
+            index = 0
+            is_last = False
+            while not is_last:
+                prefix = f.read(5)
+                ciphertext = f.read(int.from_bytes(prefix[1:5], 'big')) if len(prefix) == 5 else b''
+                mac = f.read(32)
+                if len(mac) != 32:
+                    raise WalletFileException('invalid ciphertext: truncated file')
+                if mac != self._get_chunk_mac(key_m, header, index, prefix, ciphertext):
+                    if index == 0:
+                        raise InvalidPassword()
+                    raise WalletFileException('invalid ciphertext: invalid mac')
+                data = aes_decrypt_with_iv(key_e, self._get_chunk_iv(iv, index), ciphertext)
+                parts.append(decoder.decode(decompressor.decompress(data)))
+                is_last = bool(prefix[0])
+                index += 1
+            parts.append(decoder.decode(decompressor.flush(), final=True))
+        return ''.join(parts)
+
     def decrypt(self, password) -> None:
         """Raises an InvalidPassword exception on invalid password"""
         if self.is_past_initial_decryption():
             return
-        ec_key = self.get_eckey_from_password(password)
-        if self.raw:
+        ec_key = self._get_eckey_from_password_cached(password)
+        if self._is_stream_encrypted:
+            s = self._read_encrypted(ec_key)
+        elif self.raw:
+            # files written by older versions
             enc_magic = self._get_encryption_magic()
             s = zlib.decompress(ec_key.decrypt_message(self.raw, enc_magic))
             s = s.decode('utf8')
@@ -175,17 +438,6 @@ class WalletStorage(Logger):
         self.pubkey = ec_key.get_public_key_hex()
         self.decrypted = s
 
-    def encrypt_before_writing(self, plaintext: str) -> str:
-        s = plaintext
-        if self.pubkey:
-            s = bytes(s, 'utf8')
-            c = zlib.compress(s, level=zlib.Z_BEST_SPEED)
-            enc_magic = self._get_encryption_magic()
-            public_key = ecc.ECPubkey(bfh(self.pubkey))
-            s = public_key.encrypt_message(c, enc_magic)
-            s = s.decode('utf8')
-        return s
-
     def check_password(self, password) -> None:
         """Raises an InvalidPassword exception on invalid password"""
         if not self.is_encrypted():
@@ -193,7 +445,7 @@ class WalletStorage(Logger):
         if not self.is_past_initial_decryption():
             self.decrypt(password)  # this sets self.pubkey
         assert self.pubkey is not None
-        if self.pubkey != self.get_eckey_from_password(password).get_public_key_hex():
+        if self.pubkey != self._get_eckey_from_password_cached(password).get_public_key_hex():
             raise InvalidPassword()
 
     def set_password(self, password, enc_version=None):
@@ -203,7 +455,9 @@ class WalletStorage(Logger):
         if enc_version is None:
             enc_version = self._encryption_version
         if password and enc_version != StorageEncryptionVersion.PLAINTEXT:
-            ec_key = self.get_eckey_from_password(password)
+            if self.is_sqlite():
+                raise WalletFileException("Storage encryption is not supported for sqlite wallets")
+            ec_key = self._get_eckey_from_password_cached(password)
             self.pubkey = ec_key.get_public_key_hex()
             self._encryption_version = enc_version
         else:
@@ -42,6 +42,9 @@ if TYPE_CHECKING:
     from .address_synchronizer import AddressSynchronizer
 
 
+STANDBY_SUBSCRIPTIONS_INTERVAL = 10  # seconds
+
+
 class SynchronizerFailure(Exception): pass
 
 
@@ -97,24 +100,36 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         """Handle the change of the status of an address."""
         raise NotImplementedError()  # implemented by subclasses
 
+    def _get_scripthash(self, addr: str) -> str:
+        return address_to_scripthash(addr)
+
     async def send_subscriptions(self):
-        async def subscribe_to_address(addr):
-            h = address_to_scripthash(addr)
-            self.scripthash_to_address[h] = addr
-            self._requests_sent += 1
-            try:
-                async with self._network_request_semaphore:
-                    await self.session.subscribe('blockchain.scripthash.subscribe', [h], self.status_queue)
-            except RPCError as e:
+        async def subscribe_to_addresses(addrs):
+            params_list = []
+            for addr in addrs:
+                h = self._get_scripthash(addr)
+                self.scripthash_to_address[h] = addr
+                params_list.append([h])
+            self._requests_sent += len(addrs)
+            async with self._network_request_semaphore:
+                errors = await self.session.subscribe_batch('blockchain.scripthash.subscribe', params_list, self.status_queue)
+            for e in errors:
+                if e is None:
+                    continue
                 if e.message == 'history too large':  # no unique error code
                     raise GracefulDisconnect(e, log_level=logging.ERROR) from e
-                raise
-            self._requests_answered += 1
-            self.requested_addrs.remove(addr)
+                raise e
+            self._requests_answered += len(addrs)
+            for addr in addrs:
+                self.requested_addrs.remove(addr)
 
         while True:
-            addr = await self.add_queue.get()
-            await self.taskgroup.spawn(subscribe_to_address, addr)
+            # subscribe to the addresses that are already queued together, in one batch
+            addrs = [await self.add_queue.get()]
+            batch_size = self.interface.get_request_batch_size()
+            while len(addrs) < batch_size and not self.add_queue.empty():
+                addrs.append(self.add_queue.get_nowait())
+            await self.taskgroup.spawn(subscribe_to_addresses, addrs)
 
     async def handle_status(self):
         while True:
@@ -144,19 +159,23 @@ class Synchronizer(SynchronizerBase):
         self.requested_tx = {}
         self.requested_histories = set()
         self._stale_histories = dict()  # type: Dict[str, asyncio.Task]
+        # addresses resubscribed after a server switch, that do not make us "not up to date"
+        self._warm_addrs = set()  # type: Set[str]
 
     def diagnostic_name(self):
         return self.adb.diagnostic_name()
 
     def is_up_to_date(self):
-        return (not self.requested_addrs
+        return (self.requested_addrs <= self._warm_addrs
                 and not self.requested_histories
                 and not self.requested_tx
                 and not self._stale_histories)
 
+    def _get_scripthash(self, addr: str) -> str:
+        return self.adb.db.get_addr_scripthash(addr)
+
     async def _on_address_status(self, addr, status):
-        history = self.adb.db.get_addr_history(addr)
-        if history_status(history) == status:
+        if self.adb.db.get_addr_history_status(addr) == status:
             return
         # No point in requesting history twice for the same announced status.
         # However if we got announced a new status, we should request history again:
@@ -165,7 +184,7 @@ class Synchronizer(SynchronizerBase):
         # request address history
         self.requested_histories.add((addr, status))
         self._stale_histories.pop(addr, asyncio.Future()).cancel()
-        h = address_to_scripthash(addr)
+        h = self._get_scripthash(addr)
         self._requests_sent += 1
         async with self._network_request_semaphore:
             result = await self.interface.get_history_for_scripthash(h)
@@ -209,24 +228,31 @@ class Synchronizer(SynchronizerBase):
             self.requested_tx[tx_hash] = tx_height
 
         if not transaction_hashes: return
+        batch_size = self.interface.get_request_batch_size()
         async with OldTaskGroup() as group:
-            for tx_hash in transaction_hashes:
-                await group.spawn(self._get_transaction(tx_hash, allow_server_not_finding_tx=allow_server_not_finding_tx))
+            for i in range(0, len(transaction_hashes), batch_size):
+                batch = transaction_hashes[i:i+batch_size]
+                await group.spawn(self._get_transactions(batch, allow_server_not_finding_tx=allow_server_not_finding_tx))
 
-    async def _get_transaction(self, tx_hash, *, allow_server_not_finding_tx=False):
-        self._requests_sent += 1
+    async def _get_transactions(self, tx_hashes, *, allow_server_not_finding_tx=False):
+        self._requests_sent += len(tx_hashes)
         try:
             async with self._network_request_semaphore:
-                raw_tx = await self.interface.get_transaction(tx_hash)
-        except RPCError as e:
-            # most likely, "No such mempool or blockchain transaction"
-            if allow_server_not_finding_tx:
-                self.requested_tx.pop(tx_hash)
-                return
-            else:
-                raise
+                raw_txs = await self.interface.get_transactions(tx_hashes)
         finally:
-            self._requests_answered += 1
+            self._requests_answered += len(tx_hashes)
+        for tx_hash, raw_tx in zip(tx_hashes, raw_txs):
+            if isinstance(raw_tx, RPCError):
+                # most likely, "No such mempool or blockchain transaction"
+                if allow_server_not_finding_tx:
+                    self.requested_tx.pop(tx_hash)
+                    continue
+                raise raw_tx
+            elif isinstance(raw_tx, Exception):
+                raise raw_tx
+            self._receive_transaction(tx_hash, raw_tx)
+
+    def _receive_transaction(self, tx_hash, raw_tx):
         tx = Transaction(raw_tx)
         if tx_hash != tx.txid():
             raise SynchronizerFailure(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
@@ -234,17 +260,60 @@ class Synchronizer(SynchronizerBase):
         self.adb.receive_tx_callback(tx_hash, tx, tx_height)
         self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}")
 
+    async def _maintain_standby_subscriptions(self):
+        """Subscribes to our addresses on the standby interface of the network too, if any.
+        The session caches the statuses and keeps them updated, so if we switch to that
+        server, the subscriptions are answered without a round trip.
+        """
+        standby = None
+        subscribed = set()  # type: Set[str]
+        while True:
+            await asyncio.sleep(STANDBY_SUBSCRIPTIONS_INTERVAL)
+            interface = self.network.get_standby_interface()
+            if interface is None:
+                continue
+            if interface != standby:
+                standby, subscribed = interface, set()
+            addrs = [addr for addr in self.adb.get_addresses() if addr not in subscribed]
+            if not addrs:
+                continue
+            queue = asyncio.Queue()  # results are only kept in the session cache
+            batch_size = interface.get_request_batch_size()
+            try:
+                for i in range(0, len(addrs), batch_size):
+                    batch = addrs[i:i+batch_size]
+                    params_list = [[self._get_scripthash(addr)] for addr in batch]
+                    async with self._network_request_semaphore:
+                        await interface.session.subscribe_batch('blockchain.scripthash.subscribe', params_list, queue)
+                    subscribed.update(batch)
+            except Exception as e:
+                self.logger.info(f"failed to subscribe on standby interface {interface.server}: {e!r}")
+                standby = None
+            finally:
+                if interface.session:
+                    interface.session.unsubscribe(queue)
+
     async def main(self):
-        self.adb.set_up_to_date(False)
-        # request missing txns, if any
-        for addr in random_shuffled_copy(self.adb.db.get_history()):
-            history = self.adb.db.get_addr_history(addr)
-            # Old electrum servers returned ['*'] when all history for the address
-            # was pruned. This no longer happens but may remain in old wallets.
-            if history == ['*']: continue
-            await self._request_missing_txs(history, allow_server_not_finding_tx=True)
+        addresses = random_shuffled_copy(self.adb.get_addresses())
+        if self.adb.is_up_to_date():
+            # We were restarted after switching servers, and were up to date with the
+            # previous one. The stored statuses are compared with the ones the new server
+            # returns for the subscriptions, and only addresses whose status changed get
+            # their history requested. Until then, we stay up to date.
+            self.logger.info(f"server switch: resubscribing to {len(addresses)} addresses")
+            self._warm_addrs = set(addresses)
+        else:
+            self.adb.set_up_to_date(False)
+            # request missing txns, if any
+            for addr in random_shuffled_copy(self.adb.db.get_history()):
+                history = self.adb.db.get_addr_history(addr)
+                # Old electrum servers returned ['*'] when all history for the address
+                # was pruned. This no longer happens but may remain in old wallets.
+                if history == ['*']: continue
+                await self._request_missing_txs(history, allow_server_not_finding_tx=True)
+        await self.taskgroup.spawn(self._maintain_standby_subscriptions())
         # add addresses to bootstrap
-        for addr in random_shuffled_copy(self.adb.get_addresses()):
+        for addr in addresses:
             await self._add_address(addr)
         # main loop
         while True:
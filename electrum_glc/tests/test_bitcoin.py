@@ -8,7 +8,8 @@ from electrum_glc.bitcoin import (public_key_to_p2pkh, address_from_private_key,
                                   is_b58_address, address_to_scripthash, is_minikey,
                                   is_compressed_privkey, EncodeBase58Check, DecodeBase58Check,
                                   script_num_to_hex, push_script, add_number_to_script, int_to_hex,
-                                  opcodes, base_encode, base_decode, BitcoinException)
+                                  opcodes, base_encode, base_decode, BitcoinException,
+                                  hash160_to_p2pkh, hash160_to_p2sh, hash160_to_b58_address, hash_to_segwit_addr)
 from electrum_glc import bip32
 from electrum_glc import segwit_addr
 from electrum_glc.segwit_addr import DecodedBech32
@@ -538,6 +539,20 @@ class Test_bitcoin(ElectrumTestCase):
         self.assertEqual(address_to_script('MBmyiC29MUQSfPC2gKtdrazbSWHvGqJCnU'), 'a9142a84cf00d47f699ee7bbc1dea5ec1bdecb4ac15487')
         self.assertEqual(address_to_script('MWBtJBTgiEWYQ7m17wFktku2dvSFZXqhWZ'), 'a914f47c8954e421031ad04ecd8e7752c9479206b9d387')
 
+    def test_address_to_script_for_current_net(self):
+        h = bytes(range(20))
+        self.assertEqual('76a914' + h.hex() + '88ac', address_to_script(hash160_to_p2pkh(h)))
+        self.assertEqual('a914' + h.hex() + '87', address_to_script(hash160_to_p2sh(h)))
+        self.assertEqual('0014' + h.hex(), address_to_script(hash_to_segwit_addr(h, witver=0)))
+        self.assertEqual('5120' + 2 * h[:16].hex(), address_to_script(hash_to_segwit_addr(2 * h[:16], witver=1)))
+        # invalid addresses are rejected, whether they look like bech32 or base58
+        segwit_addr = hash_to_segwit_addr(h, witver=0)
+        for addr in ('', 'not an address', segwit_addr[:-1] + ('q' if segwit_addr[-1] != 'q' else 'p'),
+                     hash160_to_p2pkh(h)[:-1], hash160_to_b58_address(h, 255)):
+            self.assertFalse(is_address(addr))
+            with self.assertRaises(BitcoinException):
+                address_to_script(addr)
+
     def test_address_to_payload(self):
         # bech32 P2WPKH
         self.assertEqual(
@@ -753,6 +768,15 @@ class Test_xprv_xpub(ElectrumTestCase):
         self.assertEqual("xpub6BJA1jSqiukeaesWfxe6sNK9CCGaujFFSJLomWHprUL9DePQ4JDkM5d88n49sMGJxrhpjazuXYWdMf17C9T5XnxkopaeS7jGk1GyyVziaMt", xpub)
         self.assertEqual("xprv9xJocDuwtYCMNAo3Zw76WENQeAS6WGXQ55RCy7tDJ8oALr4FWkuVoHJeHVAcAqiZLE7Je3vZJHxspZdFHfnBEjHqU5hG1Jaj32dVoS6XLT1", xprv)
 
+    def test_ckd_pub_range(self):
+        node = BIP32Node.from_xkey(self.xprv_xpub[0]['xpub'])
+        pubkey = node.eckey.get_public_key_bytes(compressed=True)
+        pubkeys = bip32.CKD_pub_range(pubkey, node.chaincode, 5, 25)
+        self.assertEqual([bip32.CKD_pub(pubkey, node.chaincode, n)[0] for n in range(5, 25)], pubkeys)
+        self.assertEqual([], bip32.CKD_pub_range(pubkey, node.chaincode, 5, 5))
+        with self.assertRaises(Exception):
+            bip32.CKD_pub_range(pubkey, node.chaincode, 0, bip32.BIP32_PRIME + 1)
+
     def test_xpub_from_xprv(self):
         """We can derive the xpub key from a xprv."""
         for xprv_details in self.xprv_xpub:
@@ -1,11 +1,15 @@
+import asyncio
+import json
 import shutil
 import tempfile
 import os
+import sys
+from unittest import mock
 
-from electrum_glc import constants, blockchain
+from electrum_glc import constants, blockchain, scrypt
 from electrum_glc.simple_config import SimpleConfig
-from electrum_glc.blockchain import Blockchain, deserialize_header, hash_header
-from electrum_glc.util import bh2u, bfh, make_dir
+from electrum_glc.blockchain import Blockchain, deserialize_header, hash_header, serialize_header
+from electrum_glc.util import bh2u, bfh, make_dir, get_asyncio_loop
 
 from . import ElectrumTestCase
 
@@ -66,6 +70,11 @@ class TestBlockchain(ElectrumTestCase):
         self.assertTrue(chain.can_connect(header))
         chain.save_header(header)
 
+    def _headers_file_size(self, chain: Blockchain) -> int:
+        # appended headers are buffered in memory until flushed
+        chain.fsync()
+        return os.stat(chain.path()).st_size
+
     def test_get_height_of_last_common_block_with_chain(self):
         blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
             config=self.config, forkpoint=0, parent=None,
@@ -168,6 +177,80 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual(chain_z, chain_l.parent)
         self.assertEqual(None,    chain_z.parent)
 
+    def test_header_store_consistent_after_swapping(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEFOPQR':
+            self._append_header(chain_u, self.HEADERS[name])
+        # fill the hash index and the map
+        for height, name in enumerate('ABCDEFOPQR'):
+            self.assertEqual(hash_header(self.HEADERS[name]), chain_u.get_hash(height))
+            self.assertEqual(self.HEADERS[name], chain_u.read_header(height))
+
+        chain_l = chain_u.fork(self.HEADERS['G'])
+        for name in 'HIJK':
+            self._append_header(chain_l, self.HEADERS[name])
+        # chain_l became stronger, so the files were swapped
+        self.assertEqual(None, chain_l.parent)
+        self.assertEqual(chain_l, chain_u.parent)
+        for height, name in enumerate('ABCDEFGHIJK'):
+            self.assertEqual(hash_header(self.HEADERS[name]), chain_l.get_hash(height))
+            self.assertEqual(self.HEADERS[name], chain_l.read_header(height))
+        for height, name in enumerate('ABCDEFOPQR'):
+            self.assertEqual(hash_header(self.HEADERS[name]), chain_u.get_hash(height))
+        with self.assertRaises(blockchain.MissingHeader):
+            chain_u.get_hash(10)
+
+    def test_write_buffer(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        with mock.patch.object(blockchain, 'WRITE_BUFFER_MAX_HEADERS', 4):
+            for name in 'ABC':
+                self._append_header(chain_u, self.HEADERS[name])
+            # buffered, but readable
+            self.assertEqual(0, os.stat(chain_u.path()).st_size)
+            self.assertEqual(2, chain_u.height())
+            self.assertEqual(self.HEADERS['C'], chain_u.read_header(2))
+            self.assertEqual(hash_header(self.HEADERS['B']), chain_u.get_hash(1))
+            # size threshold reached
+            self._append_header(chain_u, self.HEADERS['D'])
+            self.assertEqual(4 * 80, os.stat(chain_u.path()).st_size)
+            self._append_header(chain_u, self.HEADERS['E'])
+            self.assertEqual(4 * 80, os.stat(chain_u.path()).st_size)
+            # flushed at shutdown
+            blockchain.close_headers_files()
+            self.assertEqual(5 * 80, os.stat(chain_u.path()).st_size)
+            self.assertEqual(self.HEADERS['E'], chain_u.read_header(4))
+
+    def test_write_buffer_age(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        self._append_header(chain_u, self.HEADERS['A'])
+        blockchain.flush_stale_write_buffers()
+        self.assertEqual(0, os.stat(chain_u.path()).st_size)
+        with mock.patch.object(blockchain, 'WRITE_BUFFER_MAX_AGE', 0):
+            blockchain.flush_stale_write_buffers()
+        self.assertEqual(80, os.stat(chain_u.path()).st_size)
+
+    def test_partially_written_header_is_truncated(self):
+        path = os.path.join(self.data_dir, 'blockchain_headers')
+        with open(path, 'wb') as f:
+            f.write(bfh(serialize_header(self.HEADERS['A'])))
+            f.write(bfh(serialize_header(self.HEADERS['B'])))
+            f.write(bfh(serialize_header(self.HEADERS['C']))[:33])
+        chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        self.assertEqual(1, chain_u.height())
+        self.assertEqual(2 * 80, os.stat(path).st_size)
+        self.assertTrue(chain_u.can_connect(self.HEADERS['C']))
+
     def test_forking_and_swapping(self):
         blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
             config=self.config, forkpoint=0, parent=None,
@@ -198,13 +281,13 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual(constants.net.GENESIS, chain_u._forkpoint_hash)
         self.assertEqual(None, chain_u._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "blockchain_headers"), chain_u.path())
-        self.assertEqual(10 * 80, os.stat(chain_u.path()).st_size)
+        self.assertEqual(10 * 80, self._headers_file_size(chain_u))
         self.assertEqual(6, chain_l.forkpoint)
         self.assertEqual(chain_u, chain_l.parent)
         self.assertEqual(hash_header(self.HEADERS['G']), chain_l._forkpoint_hash)
         self.assertEqual(hash_header(self.HEADERS['F']), chain_l._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "forks", "fork2_6_90791a08906278ce5c9581e0f8e54b729c54049f77d7397ae6a4d41229e2cb9a_836df46c91b3b9763f20d0066b48cba088b87b7481a0e17dc6b4cc6fbe6f975b"), chain_l.path())
-        self.assertEqual(4 * 80, os.stat(chain_l.path()).st_size)
+        self.assertEqual(4 * 80, self._headers_file_size(chain_l))
 
         self._append_header(chain_l, self.HEADERS['K'])
 
@@ -216,13 +299,13 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual(hash_header(self.HEADERS['O']), chain_u._forkpoint_hash)
         self.assertEqual(hash_header(self.HEADERS['F']), chain_u._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "forks", "fork2_6_90791a08906278ce5c9581e0f8e54b729c54049f77d7397ae6a4d41229e2cb9a_a05a28a6464817d8b020a3016897b9a52239c1e7757fec9c32121854f1a0cc18"), chain_u.path())
-        self.assertEqual(4 * 80, os.stat(chain_u.path()).st_size)
+        self.assertEqual(4 * 80, self._headers_file_size(chain_u))
         self.assertEqual(0, chain_l.forkpoint)
         self.assertEqual(None, chain_l.parent)
         self.assertEqual(constants.net.GENESIS, chain_l._forkpoint_hash)
         self.assertEqual(None, chain_l._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "blockchain_headers"), chain_l.path())
-        self.assertEqual(11 * 80, os.stat(chain_l.path()).st_size)
+        self.assertEqual(11 * 80, self._headers_file_size(chain_l))
         for b in (chain_u, chain_l):
             self.assertTrue(all([b.can_connect(b.read_header(i), False) for i in range(b.height())]))
 
@@ -245,19 +328,19 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual(constants.net.GENESIS, chain_z._forkpoint_hash)
         self.assertEqual(None, chain_z._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "blockchain_headers"), chain_z.path())
-        self.assertEqual(14 * 80, os.stat(chain_z.path()).st_size)
+        self.assertEqual(14 * 80, self._headers_file_size(chain_z))
         self.assertEqual(9, chain_l.forkpoint)
         self.assertEqual(chain_z, chain_l.parent)
         self.assertEqual(hash_header(self.HEADERS['J']), chain_l._forkpoint_hash)
         self.assertEqual(hash_header(self.HEADERS['I']), chain_l._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "forks", "fork2_9_9673e915a8b3372bce7d577136b2208e6da927caf2324cd238b46eb9f64fa6bf_59c49e1a21bd292585b92c93927ea65369fa6a0bc9b60c8f7c17c1ed9d53e0b9"), chain_l.path())
-        self.assertEqual(3 * 80, os.stat(chain_l.path()).st_size)
+        self.assertEqual(3 * 80, self._headers_file_size(chain_l))
         self.assertEqual(6, chain_u.forkpoint)
         self.assertEqual(chain_z, chain_u.parent)
         self.assertEqual(hash_header(self.HEADERS['O']), chain_u._forkpoint_hash)
         self.assertEqual(hash_header(self.HEADERS['F']), chain_u._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "forks", "fork2_6_90791a08906278ce5c9581e0f8e54b729c54049f77d7397ae6a4d41229e2cb9a_a05a28a6464817d8b020a3016897b9a52239c1e7757fec9c32121854f1a0cc18"), chain_u.path())
-        self.assertEqual(7 * 80, os.stat(chain_u.path()).st_size)
+        self.assertEqual(7 * 80, self._headers_file_size(chain_u))
         for b in (chain_u, chain_l, chain_z):
             self.assertTrue(all([b.can_connect(b.read_header(i), False) for i in range(b.height())]))
 
@@ -312,19 +395,19 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual(constants.net.GENESIS, chain_z._forkpoint_hash)
         self.assertEqual(None, chain_z._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "blockchain_headers"), chain_z.path())
-        self.assertEqual(12 * 80, os.stat(chain_z.path()).st_size)
+        self.assertEqual(12 * 80, self._headers_file_size(chain_z))
         self.assertEqual(9, chain_l.forkpoint)
         self.assertEqual(chain_z, chain_l.parent)
         self.assertEqual(hash_header(self.HEADERS['J']), chain_l._forkpoint_hash)
         self.assertEqual(hash_header(self.HEADERS['I']), chain_l._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "forks", "fork2_9_9673e915a8b3372bce7d577136b2208e6da927caf2324cd238b46eb9f64fa6bf_59c49e1a21bd292585b92c93927ea65369fa6a0bc9b60c8f7c17c1ed9d53e0b9"), chain_l.path())
-        self.assertEqual(2 * 80, os.stat(chain_l.path()).st_size)
+        self.assertEqual(2 * 80, self._headers_file_size(chain_l))
         self.assertEqual(6, chain_u.forkpoint)
         self.assertEqual(chain_z, chain_u.parent)
         self.assertEqual(hash_header(self.HEADERS['O']), chain_u._forkpoint_hash)
         self.assertEqual(hash_header(self.HEADERS['F']), chain_u._prev_hash)
         self.assertEqual(os.path.join(self.data_dir, "forks", "fork2_6_90791a08906278ce5c9581e0f8e54b729c54049f77d7397ae6a4d41229e2cb9a_a05a28a6464817d8b020a3016897b9a52239c1e7757fec9c32121854f1a0cc18"), chain_u.path())
-        self.assertEqual(5 * 80, os.stat(chain_u.path()).st_size)
+        self.assertEqual(5 * 80, self._headers_file_size(chain_u))
 
         self.assertEqual(constants.net.GENESIS, chain_z.get_hash(0))
         self.assertEqual(hash_header(self.HEADERS['F']), chain_z.get_hash(5))
@@ -426,6 +509,114 @@ class TestBlockchain(ElectrumTestCase):
             Blockchain.bits_to_target(0xff123456)
 
 
+class TestChainworkCache(ElectrumTestCase):
+
+    NUM_HEADERS = 3 * 2016 + 10
+
+    def setUp(self):
+        super().setUp()
+        make_dir(os.path.join(self.electrum_path, 'forks'))
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self._clear_caches()
+        # a mainnet chain without valid PoW; good enough for chainwork computations.
+        # like on Goldcoin mainnet, the bits change with every block, and do not
+        # match the targets computed by get_target.
+        raw_headers = []
+        prev_hash = '00' * 32
+        for height in range(self.NUM_HEADERS):
+            header = {'version': 1, 'prev_block_hash': prev_hash, 'merkle_root': '11' * 32,
+                      'timestamp': 1368576000 + 120 * height, 'bits': 0x1e0ffff0 - (height % 7) * 0x100,
+                      'nonce': height}
+            raw_headers.append(bfh(serialize_header(header)))
+            prev_hash = hash_header(header)
+        self.raw_headers = b''.join(raw_headers)
+        with open(os.path.join(self.electrum_path, 'blockchain_headers'), 'wb') as f:
+            f.write(self.raw_headers)
+        blockchain.blockchains = {}
+        self.chain = blockchain.blockchains[constants.net.GENESIS] = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+
+    def tearDown(self):
+        self._clear_caches()
+        super().tearDown()
+
+    def _clear_caches(self):
+        for block_hash in list(blockchain._CHAINWORK_CACHE):
+            if block_hash != '00' * 32:
+                del blockchain._CHAINWORK_CACHE[block_hash]
+        blockchain._TARGET_CACHE.clear()
+        blockchain._RETARGET_HEIGHTS.clear()
+
+    def test_save_and_load(self):
+        chainwork = self.chain.get_chainwork()
+        targets = [self.chain.get_target(index) for index in range(3)]
+        blockchain.save_chainwork_cache(self.config, force=True)
+        self.assertTrue(os.path.exists(blockchain._get_chainwork_cache_path(self.config)))
+        self._clear_caches()
+        blockchain.load_chainwork_cache(self.config)
+        for index in range(3):
+            last_hash = self.chain.get_hash(index * 2016 + 2015)
+            self.assertEqual(targets[index], blockchain._TARGET_CACHE[last_hash])
+            self.assertIn(last_hash, blockchain._CHAINWORK_CACHE)
+        self.assertEqual(chainwork, self.chain.get_chainwork())
+        self.assertEqual(targets, [self.chain.get_target(index) for index in range(3)])
+
+    def test_entries_not_matching_headers_are_ignored(self):
+        self.chain.get_chainwork()
+        blockchain.save_chainwork_cache(self.config, force=True)
+        self._clear_caches()
+        # the headers from the second retarget period on are replaced
+        self.chain.write(self.raw_headers[2016 * 80: 2017 * 80][:-4] + bytes(4), 2016 * 80)
+        blockchain.load_chainwork_cache(self.config)
+        self.assertEqual({self.chain.get_hash(2015)}, set(blockchain._RETARGET_HEIGHTS))
+
+    def test_targets_are_kept_if_bits_differ(self):
+        targets = [self.chain.get_target(index) for index in range(3)]
+        next_bits = [self.chain.read_header(index * 2016 + 2016)['bits'] for index in range(3)]
+        self.assertNotEqual(targets, [Blockchain.bits_to_target(bits) for bits in next_bits])
+        blockchain.save_chainwork_cache(self.config, force=True)
+        self._clear_caches()
+        blockchain._chainwork_cache_dirty = False
+        blockchain.load_chainwork_cache(self.config)
+        self.assertEqual(targets, [blockchain._TARGET_CACHE[self.chain.get_hash(index * 2016 + 2015)]
+                                   for index in range(3)])
+        # loading does not make us rewrite the file
+        self.assertFalse(blockchain._chainwork_cache_dirty)
+
+    def test_targets_not_matching_headers_are_ignored(self):
+        chainwork = self.chain.get_chainwork()
+        targets = [self.chain.get_target(index) for index in range(3)]
+        blockchain.save_chainwork_cache(self.config, force=True)
+        path = blockchain._get_chainwork_cache_path(self.config)
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        self.assertEqual([3, 3, 3], [len(entry) for entry in entries])
+        entries[1][2] = targets[1] // 2
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        self._clear_caches()
+        blockchain.load_chainwork_cache(self.config)
+        self.assertEqual(targets[0], blockchain._TARGET_CACHE[self.chain.get_hash(2015)])
+        # the chainwork is recomputed at load time. the bad target is recomputed from the headers
+        self.assertEqual(targets[1], blockchain._TARGET_CACHE[self.chain.get_hash(2 * 2016 - 1)])
+        self.assertIn(self.chain.get_hash(3 * 2016 - 1), blockchain._CHAINWORK_CACHE)
+        self.assertEqual(chainwork, self.chain.get_chainwork())
+        self.assertEqual(targets, [self.chain.get_target(index) for index in range(3)])
+        # the file is rewritten without the bad target
+        self.assertTrue(blockchain._chainwork_cache_dirty)
+
+    def test_cache_is_extended_in_save_chunk(self):
+        self.chain.write(self.raw_headers[:2016 * 80], 0)
+        self.assertEqual(2015, self.chain.height())
+        self.chain.save_chunk(1, self.raw_headers[2016 * 80: 2 * 2016 * 80])
+        self.assertIn(self.chain.get_hash(2015), blockchain._CHAINWORK_CACHE)
+        self.assertNotIn(self.chain.get_hash(2 * 2016 - 1), blockchain._CHAINWORK_CACHE)
+        # first header of the next retarget period
+        self.chain.save_header(deserialize_header(self.raw_headers[2 * 2016 * 80: (2 * 2016 + 1) * 80], 2 * 2016))
+        self.assertIn(self.chain.get_hash(2 * 2016 - 1), blockchain._CHAINWORK_CACHE)
+
+
 class TestVerifyHeader(ElectrumTestCase):
 
     # Data for Litecoin block header #100.
@@ -458,3 +649,80 @@ class TestVerifyHeader(ElectrumTestCase):
         with self.assertRaises(Exception):
             self.header["nonce"] = 42
             Blockchain.verify_header(self.header, self.prev_hash, self.target)
+
+    def test_valid_header_with_precomputed_pow_hash(self):
+        pow_hash = blockchain.pow_hash_header(self.header)
+        Blockchain.verify_header(self.header, self.prev_hash, self.target, pow_hash=pow_hash)
+
+    def test_insufficient_precomputed_pow_hash(self):
+        with self.assertRaises(Exception):
+            Blockchain.verify_header(self.header, self.prev_hash, self.target, pow_hash="ff" * 32)
+
+
+class TestScrypt(ElectrumTestCase):
+
+    vectors = [
+        ("00"*80, "161d0876f3b93b1048cda1bdeaa7332ee210f7131b42013cb43913a6553a4b69"),
+        ("ff"*80, "5253069c14ecedf978745486375ee37415e977f55cdbedac31ebee8bf33dd127"),
+        ("010000000000000000000000000000000000000000000000000000000000000000000000d9ced4ed1130f7b7faad9be25323ffafa33232a17c3edf6cfd97bee6bafbdd97b9aa8e4ef0ff0f1ecd513f7c", "001e67b013726fd7382e9acb69165b4b6316227fb3156b5b414ba6340c050000"),
+    ]
+
+    def test_single_header(self):
+        for header, pow_hash in self.vectors:
+            self.assertEqual(pow_hash, bh2u(scrypt.scrypt_1024_1_1_80_fast(bfh(header))))
+
+    def test_batch_all_backends(self):
+        headers = b''.join(bfh(header) for header, _ in self.vectors)
+        expected = ''.join(pow_hash for _, pow_hash in self.vectors)
+        for backend in scrypt.get_available_backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(expected, bh2u(scrypt.scrypt_1024_1_1_80_batch(headers, backend=backend)))
+
+    def test_batch_empty(self):
+        self.assertEqual(b'', scrypt.scrypt_1024_1_1_80_batch(b''))
+
+    def test_batch_invalid_length(self):
+        with self.assertRaises(ValueError):
+            scrypt.scrypt_1024_1_1_80_batch(bytes(81))
+        with self.assertRaises(ValueError):
+            scrypt.scrypt_1024_1_1_80_batch(bytes(80), backend='nonexistent')
+
+
+class TestParallelPowVerification(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        blockchain.shutdown_pow_executor()
+
+    def tearDown(self):
+        blockchain.shutdown_pow_executor()
+        super().tearDown()
+
+    def _make_chain(self, num_workers: int) -> Blockchain:
+        config = SimpleConfig({'electrum_path': self.electrum_path,
+                               'header_verification_workers': num_workers})
+        return Blockchain(config=config, forkpoint=0, parent=None,
+                          forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+
+    def test_num_verification_workers(self):
+        config = SimpleConfig({'electrum_path': self.electrum_path, 'header_verification_workers': 3})
+        self.assertEqual(3, blockchain.get_num_verification_workers(config))
+        config = SimpleConfig({'electrum_path': self.electrum_path})
+        with mock.patch.object(sys, 'frozen', True, create=True):
+            self.assertEqual(0, blockchain.get_num_verification_workers(config))
+        self.assertIsNone(blockchain.get_pow_executor(1))
+        self.assertIsNone(blockchain.get_pow_executor(0))
+
+    def test_executor_is_reused(self):
+        executor = blockchain.get_pow_executor(2)
+        self.assertIs(executor, blockchain.get_pow_executor(2))
+        self.assertIsNot(executor, blockchain.get_pow_executor(3))
+
+    def test_compute_pow_hashes(self):
+        data = b''.join(bfh(header) for header, _ in TestScrypt.vectors)
+        expected = scrypt.scrypt_1024_1_1_80_batch(data)
+        for num_workers in (0, 2):
+            with self.subTest(num_workers=num_workers):
+                chain = self._make_chain(num_workers)
+                fut = asyncio.run_coroutine_threadsafe(chain.compute_pow_hashes(data), get_asyncio_loop())
+                self.assertEqual(expected, fut.result(timeout=60))
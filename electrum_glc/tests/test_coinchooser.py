@@ -1,4 +1,9 @@
-from electrum_glc.coinchooser import CoinChooserPrivacy
+from electrum_glc import bitcoin, coinchooser
+from electrum_glc.address_synchronizer import AddressSynchronizer
+from electrum_glc.coinchooser import CoinChooserPrivacy, CoinChooserBranchAndBound
+from electrum_glc.crypto import sha256
+from electrum_glc.simple_config import SimpleConfig
+from electrum_glc.transaction import PartialTxOutput
 from electrum_glc.util import NotEnoughFunds
 
 from . import ElectrumTestCase
@@ -18,3 +23,66 @@ class TestCoinChooser(ElectrumTestCase):
             coin_chooser.bucket_candidates_any([], sufficient_funds)
         with self.assertRaises(NotEnoughFunds):
             coin_chooser.bucket_candidates_prefer_confirmed([], sufficient_funds)
+
+    def test_subclass_without_selection_params(self):
+        # choose_buckets overrides from before the SelectionParams still work
+        class CoinChooserFirstCandidate(CoinChooserPrivacy):
+            def choose_buckets(self, buckets, sufficient_funds, penalty_func):
+                return penalty_func(self.bucket_candidates_prefer_confirmed(buckets, sufficient_funds)[0])
+
+        addr = bitcoin.hash_to_segwit_addr(sha256(b'')[:20], witver=0)
+        coins = [AddressSynchronizer._make_txo(addr, f"{'00' * 32}:0", 100_000, False, 10)]
+        outputs = [PartialTxOutput.from_address_and_value(addr, 50_000)]
+        coin_chooser = CoinChooserFirstCandidate(enable_output_value_rounding=False)
+        tx = coin_chooser.make_tx(coins=coins, inputs=[], outputs=outputs, change_addrs=[addr],
+                                  fee_estimator_vb=lambda size: size, dust_threshold=546)
+        self.assertEqual([100_000], [txin.value_sats() for txin in tx.inputs()])
+
+
+class TestCoinChooserBranchAndBound(ElectrumTestCase):
+
+    def _addr(self, i):
+        return bitcoin.hash_to_segwit_addr(sha256(bytes([i]))[:20], witver=0)
+
+    def _make_tx(self, coins, amount, feerate=0):
+        coins = [AddressSynchronizer._make_txo(self._addr(i), f"{bytes([i]).hex() * 32}:0", value, False, height)
+                 for i, (value, height) in enumerate(coins)]
+        outputs = [PartialTxOutput.from_address_and_value(self._addr(100), amount)]
+        coin_chooser = CoinChooserBranchAndBound(enable_output_value_rounding=False)
+        return coin_chooser.make_tx(coins=coins, inputs=[], outputs=outputs, change_addrs=[self._addr(101)],
+                                    fee_estimator_vb=lambda size: int(round(size * feerate)),
+                                    dust_threshold=546)
+
+    def test_changeless_solution(self):
+        tx = self._make_tx([(100_000, 10), (200_000, 10), (300_000, 10), (500_000, 10), (1_000_000, 10)], 700_000)
+        self.assertEqual([200_000, 500_000], sorted(txin.value_sats() for txin in tx.inputs()))
+        self.assertEqual(1, len(tx.outputs()))
+
+    def test_changeless_solution_pays_fee(self):
+        tx = self._make_tx([(100_000, 10), (201_000, 10), (300_000, 10), (500_000, 10)],
+                           700_000, feerate=5)
+        self.assertEqual([201_000, 500_000], sorted(txin.value_sats() for txin in tx.inputs()))
+        self.assertEqual(1, len(tx.outputs()))
+        self.assertLessEqual(tx.estimated_size() * 5, tx.get_fee())
+
+    def test_fewest_inputs_with_change(self):
+        tx = self._make_tx([(100_000, 10), (300_000, 10), (1_000_000, 10)], 350_000, feerate=1)
+        self.assertEqual([1_000_000], [txin.value_sats() for txin in tx.inputs()])
+        self.assertEqual(2, len(tx.outputs()))
+        self.assertEqual(tx.estimated_size(), tx.get_fee())
+
+    def test_prefers_confirmed_coins(self):
+        tx = self._make_tx([(700_000, 0), (1_000_000, 10)], 700_000)
+        self.assertEqual([1_000_000], [txin.value_sats() for txin in tx.inputs()])
+        tx = self._make_tx([(700_000, 0), (500_000, 10)], 700_000)
+        self.assertEqual([700_000], [txin.value_sats() for txin in tx.inputs()])
+
+    def test_not_enough_funds(self):
+        with self.assertRaises(NotEnoughFunds):
+            self._make_tx([(100_000, 10), (200_000, 0)], 300_000, feerate=1)
+
+    def test_get_coin_chooser(self):
+        config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.assertIsInstance(coinchooser.get_coin_chooser(config), CoinChooserPrivacy)
+        config.set_key('coin_chooser', 'BranchAndBound')
+        self.assertIsInstance(coinchooser.get_coin_chooser(config), CoinChooserBranchAndBound)
@@ -1,13 +1,15 @@
+import asyncio
 import unittest
 from unittest import mock
 from decimal import Decimal
 
 from electrum_glc.commands import Commands, eval_bool
-from electrum_glc import storage, wallet
+from electrum_glc import storage, wallet, util
 from electrum_glc.wallet import restore_wallet_from_text
 from electrum_glc.address_synchronizer import TX_HEIGHT_UNCONFIRMED
 from electrum_glc.simple_config import SimpleConfig
 from electrum_glc.transaction import Transaction, TxOutput, tx_from_any
+from electrum_glc.util import TxMinedInfo
 
 from . import TestCaseForTestnet, ElectrumTestCase
 from .test_wallet_vertical import WalletIntegrityHelper
@@ -310,3 +312,32 @@ class TestCommandsTestnet(TestCaseForTestnet):
 
         self.assertEqual("02000000000101b9723dfc69af058ef6613539a000d2cd098a2c8a74e802b6d8739db708ba8c9a0100000000fdffffff02a00f00000000000016001429e1fd187f0cac845946ae1b11dc136c536bfc0f84b2000000000000160014100611bcb3aee7aad176936cf4ed56ade03027aa0247304402203aa63539b673a3bd70a76482b17f35f8843974fab28f84143a00450789010bc40220779c2ce2d0217f973f1f6c9f718e19fc7ebd14dd8821a962f002437cda3082ec012102ee3f00141178006c78b0b458aab21588388335078c655459afe544211f15aee000000000",
                          cmds._run('bumpfee', (), tx=tx, new_fee_rate='1.6', from_coins="9a8cba08b79d73d8b602e8748a2c8a09cdd200a0393561f68e05af69fc3d72b9:1", wallet=wallet))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_onchain_history_pages(self, mock_save_db):
+        from .test_wallet_vertical import TestWalletHistory_DoubleSpend
+        wallet = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                          gap_limit=5,
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        txids = list(TestWalletHistory_DoubleSpend.transactions)[:2]
+        for txid in txids:
+            wallet.adb.add_transaction(Transaction(TestWalletHistory_DoubleSpend.transactions[txid]))
+        wallet.adb.add_verified_tx(txids[0], TxMinedInfo(height=1000, timestamp=1600000000, txpos=1, header_hash='00' * 32))
+        cmds = Commands(config=self.config)
+        history = cmds._run('onchain_history', (), wallet=wallet)
+        self.assertEqual(txids, [item['txid'] for item in history['transactions']])
+        # one tx per page
+        page1 = cmds._run('onchain_history', (), limit=1, wallet=wallet)
+        self.assertEqual(history['transactions'][:1], page1['transactions'])
+        page2 = cmds._run('onchain_history', (), limit=1, cursor=page1['next_cursor'], wallet=wallet)
+        self.assertEqual(history['transactions'][1:], page2['transactions'])
+        page3 = cmds._run('onchain_history', (), limit=1, cursor=page2['next_cursor'], wallet=wallet)
+        self.assertEqual({'transactions': [], 'next_cursor': None}, page3)
+        # streaming
+        async def read_stream():
+            return [item async for item in await cmds.onchain_history(stream=True, wallet=wallet)]
+        items = asyncio.run_coroutine_threadsafe(read_stream(), util.get_asyncio_loop()).result()
+        self.assertEqual(history['transactions'], items)
+        with self.assertRaises(Exception):
+            cmds._run('onchain_history', (), cursor='garbage', wallet=wallet)
@@ -1,13 +1,16 @@
 import asyncio
+import os
 import tempfile
 import unittest
 
+import aiorpcx
+
 from electrum_glc import constants
 from electrum_glc.simple_config import SimpleConfig
 from electrum_glc import blockchain
-from electrum_glc.interface import Interface, ServerAddr
+from electrum_glc.interface import Interface, ServerAddr, NotificationSession
 from electrum_glc.crypto import sha256
-from electrum_glc.util import bh2u
+from electrum_glc.util import bh2u, bfh, make_dir
 from electrum_glc import util
 
 from . import ElectrumTestCase
@@ -124,6 +127,209 @@ class TestNetwork(ElectrumTestCase):
         self.assertEqual(self.interface.q.qsize(), 0)
 
 
+# regtest genesis block
+GENESIS_HEADER = "010000000000000000000000000000000000000000000000000000000000000000000000d9ced4ed1130f7b7faad9be25323ffafa33232a17c3edf6cfd97bee6bafbdd97dae5494dffff7f2000000000"
+
+
+def make_regtest_headers(num_headers: int) -> bytes:
+    """Returns a chain of linked headers starting at the regtest genesis.
+    note: on regtest, PoW is not checked.
+    """
+    raw_headers = [bfh(GENESIS_HEADER)]
+    prev_hash = constants.net.GENESIS
+    for height in range(1, num_headers):
+        header = {
+            'version': 0x20000000,
+            'prev_block_hash': prev_hash,
+            'merkle_root': bh2u(sha256(str(height))),
+            'timestamp': 1296688602 + 150 * height,
+            'bits': 0x207fffff,
+            'nonce': height,
+        }
+        raw_headers.append(bfh(blockchain.serialize_header(header)))
+        prev_hash = blockchain.hash_header(header)
+    return b''.join(raw_headers)
+
+
+class MockServerSession:
+    """Serves blockchain.block.headers from a fixed chain, after some latency."""
+
+    def __init__(self, raw_headers: bytes, *, latency: float = 0):
+        self.raw_headers = raw_headers
+        self.latency = latency
+        self.num_in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_request(self, method, params, timeout=None):
+        assert method == 'blockchain.block.headers', method
+        start_height, count = params
+        self.num_in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.num_in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.num_in_flight -= 1
+        data = self.raw_headers[start_height * blockchain.HEADER_SIZE:(start_height + count) * blockchain.HEADER_SIZE]
+        return {'count': len(data) // blockchain.HEADER_SIZE, 'hex': bh2u(data), 'max': 2016}
+
+
+class TestHeaderCatchup(ElectrumTestCase):
+
+    NUM_HEADERS = 3 * 2016 + 100
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        constants.set_regtest()
+        cls.raw_headers = make_regtest_headers(cls.NUM_HEADERS)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        constants.set_mainnet()
+
+    def _sync(self, chunk_requests_in_flight: int) -> MockServerSession:
+        config = SimpleConfig({'electrum_path': self.electrum_path,
+                               'header_chunk_requests_in_flight': chunk_requests_in_flight})
+        make_dir(os.path.join(util.get_headers_dir(config), 'forks'))
+        interface = MockInterface(config)
+        blockchain.blockchains = {}
+        chain = blockchain.Blockchain(config=config, forkpoint=0, parent=None,
+                                      forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain.path(), 'w+').close()
+        chain.update_size()
+        blockchain.blockchains[constants.net.GENESIS] = chain
+        interface.blockchain = chain
+        interface.session = MockServerSession(self.raw_headers, latency=0.01)
+        interface.tip = self.NUM_HEADERS - 1
+        fut = asyncio.run_coroutine_threadsafe(interface.sync_until(0), util.get_asyncio_loop())
+        self.assertEqual(('catchup', self.NUM_HEADERS), fut.result())
+        self.assertEqual(self.NUM_HEADERS - 1, chain.height())
+        with open(chain.path(), 'rb') as f:
+            self.assertEqual(self.raw_headers, f.read())
+        self.assertFalse(chain._needs_fsync)
+        return interface.session
+
+    def test_catchup_one_chunk_at_a_time(self):
+        session = self._sync(1)
+        self.assertEqual(1, session.max_in_flight)
+
+    def test_catchup_pipelined(self):
+        session = self._sync(3)
+        self.assertEqual(3, session.max_in_flight)
+
+
+class EchoServerSession(aiorpcx.RPCSession):
+
+    async def handle_request(self, request):
+        if request.method != 'echo':
+            raise aiorpcx.RPCError(1, f"unknown method {request.method}")
+        return request.args[0]
+
+
+class RejectedBatch:
+
+    async def __aenter__(self):
+        raise aiorpcx.ProtocolError(aiorpcx.JSONRPC.INVALID_REQUEST, 'batches not supported')
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class SlowBatch:
+
+    async def __aenter__(self):
+        await asyncio.sleep(10)
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class TestRequestBatches(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.interface = MockInterface(self.config)
+        self.interface.network.debug = False
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, util.get_asyncio_loop()).result()
+
+    async def _send_request_batch(self, requests, *, reject_batches=False):
+        server = await aiorpcx.serve_rs(EchoServerSession, 'localhost', 0)
+        port = server.sockets[0].getsockname()[1]
+        session_factory = lambda *args, **kwargs: NotificationSession(*args, **kwargs, interface=self.interface)
+        try:
+            async with aiorpcx.connect_rs('localhost', port, session_factory=session_factory) as session:
+                if reject_batches:
+                    session.send_batch = RejectedBatch
+                results = await session.send_request_batch(requests)
+                return results, session.batches_supported
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    def test_send_request_batch(self):
+        requests = [('echo', [i]) for i in range(10)] + [('fail', [])]
+        results, batches_supported = self._run(self._send_request_batch(requests))
+        self.assertTrue(batches_supported)
+        self.assertEqual(list(range(10)), results[:10])
+        self.assertIsInstance(results[10], aiorpcx.RPCError)
+
+    def test_send_request_batch_falls_back_to_single_requests(self):
+        requests = [('echo', [i]) for i in range(10)] + [('fail', [])]
+        results, batches_supported = self._run(self._send_request_batch(requests, reject_batches=True))
+        self.assertFalse(batches_supported)
+        self.assertEqual(list(range(10)), results[:10])
+        self.assertIsInstance(results[10], aiorpcx.RPCError)
+
+    def test_send_request_batch_retries_batches_after_a_timeout(self):
+        requests = [('echo', [i]) for i in range(10)]
+
+        async def send_request_batches():
+            server = await aiorpcx.serve_rs(EchoServerSession, 'localhost', 0)
+            port = server.sockets[0].getsockname()[1]
+            session_factory = lambda *args, **kwargs: NotificationSession(*args, **kwargs, interface=self.interface)
+            try:
+                async with aiorpcx.connect_rs('localhost', port, session_factory=session_factory) as session:
+                    # the first batch is slow, e.g. a busy server
+                    session.send_batch = lambda: SlowBatch()
+                    results = [await session.send_request_batch(requests, timeout=0.2)]
+                    self.assertTrue(session.batches_supported)
+                    del session.send_batch
+                    results.append(await session.send_request_batch(requests, timeout=5))
+                    self.assertEqual(1, session._sent_batches)
+                    return results, session.batches_supported
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        results, batches_supported = self._run(send_request_batches())
+        self.assertTrue(batches_supported)
+        self.assertEqual([list(range(10))] * 2, results)
+
+    def test_send_request_batch_gives_up_after_several_timeouts(self):
+        requests = [('echo', [i]) for i in range(10)]
+
+        async def send_request_batches():
+            server = await aiorpcx.serve_rs(EchoServerSession, 'localhost', 0)
+            port = server.sockets[0].getsockname()[1]
+            session_factory = lambda *args, **kwargs: NotificationSession(*args, **kwargs, interface=self.interface)
+            try:
+                async with aiorpcx.connect_rs('localhost', port, session_factory=session_factory) as session:
+                    session.send_batch = lambda: SlowBatch()
+                    for i in range(NotificationSession.MAX_BATCH_TIMEOUTS):
+                        self.assertTrue(session.batches_supported)
+                        self.assertEqual(list(range(10)), await session.send_request_batch(requests, timeout=0.2))
+                    return session.batches_supported
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        self.assertFalse(self._run(send_request_batches()))
+
+
 if __name__=="__main__":
     constants.set_regtest()
     unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+
+from electrum_glc import util
+from electrum_glc.simple_config import SimpleConfig
+from electrum_glc.synchronizer import Synchronizer, history_status
+from electrum_glc.util import OldTaskGroup
+from electrum_glc.wallet import restore_wallet_from_text
+
+from . import TestCaseForTestnet
+
+
+class MockSession:
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.subscribed = []
+
+    async def subscribe_batch(self, method, params_list, queue):
+        for params in params_list:
+            self.subscribed.append(params[0])
+            await queue.put(params + [self.statuses.get(params[0])])
+        return [None] * len(params_list)
+
+    def unsubscribe(self, queue):
+        pass
+
+
+class MockInterface:
+
+    def __init__(self, session):
+        self.session = session
+        self.requested_histories = []
+        self.taskgroup = OldTaskGroup()
+
+    def get_request_batch_size(self):
+        return 50
+
+    async def get_history_for_scripthash(self, sh):
+        self.requested_histories.append(sh)
+        return []
+
+
+class MockNetwork:
+
+    def __init__(self, config):
+        self.asyncio_loop = util.get_asyncio_loop()
+        self.config = config
+        self.interface = None
+
+    def get_standby_interface(self):
+        return None
+
+
+class TestSynchronizer(TestCaseForTestnet):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.wallet = restore_wallet_from_text(
+            'vpub5VfkVzoT7qgd5gUKjxgGE2oMJU4zKSktusfLx2NaQCTfSeeSY3S723qXKUZZaJzaF6YaF8nwQgbMTWx54Ugkf4NZvSxdzicENHoLJh96EKg',
+            path=None, config=self.config)['wallet']
+        self.adb = self.wallet.adb
+        self.adb.network = MockNetwork(self.config)
+        self.addresses = self.adb.get_addresses()
+        # the wallet was synchronized with the previous server
+        self.stored_status = history_status([('00' * 32, 100)])
+        for addr in self.addresses:
+            self.adb.db.set_addr_history_status(addr, self.stored_status)
+        self.up_to_date_changes = []
+        set_up_to_date = self.adb.set_up_to_date
+        def record_set_up_to_date(up_to_date):
+            self.up_to_date_changes.append(up_to_date)
+            set_up_to_date(up_to_date)
+        self.adb.set_up_to_date = record_set_up_to_date
+
+    def _run_synchronizer(self, statuses):
+        async def run():
+            sync = Synchronizer(self.adb)
+            sync.interface = MockInterface(MockSession(statuses))
+            task = asyncio.ensure_future(sync._run_tasks(taskgroup=sync.taskgroup))
+            while len(sync.session.subscribed) < len(self.addresses) or not sync.is_up_to_date():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await sync.stop()
+            return sync.interface
+        return asyncio.run_coroutine_threadsafe(run(), util.get_asyncio_loop()).result(5)
+
+    def test_warm_restart_only_requests_changed_histories(self):
+        self.adb.set_up_to_date(True)
+        changed_addr = self.addresses[3]
+        statuses = {self.adb.db.get_addr_scripthash(addr): self.stored_status for addr in self.addresses}
+        statuses[self.adb.db.get_addr_scripthash(changed_addr)] = None
+        interface = self._run_synchronizer(statuses)
+        self.assertEqual([self.adb.db.get_addr_scripthash(changed_addr)], interface.requested_histories)
+        self.assertEqual([], self.adb.db.get_addr_history(changed_addr))
+        self.assertIsNone(self.adb.db.get_addr_history_status(changed_addr))
+        # the wallet stayed up to date while resubscribing
+        self.assertNotIn(False, self.up_to_date_changes)
+
+    def test_cold_start_is_not_up_to_date_until_subscribed(self):
+        statuses = {self.adb.db.get_addr_scripthash(addr): self.stored_status for addr in self.addresses}
+        interface = self._run_synchronizer(statuses)
+        self.assertEqual([], interface.requested_histories)
+        self.assertEqual(False, self.up_to_date_changes[0])
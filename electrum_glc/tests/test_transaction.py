@@ -1,4 +1,7 @@
+import concurrent.futures
+import copy
 from typing import NamedTuple, Union
+from unittest import mock
 
 from electrum_glc import transaction, bitcoin
 from electrum_glc.transaction import (convert_raw_tx_to_hex, tx_from_any, Transaction,
@@ -78,6 +81,40 @@ class TestBCDataStream(ElectrumTestCase):
         self.assertFalse(s.can_read_more())
 
 
+class TestBytesReader(ElectrumTestCase):
+
+    def test_compact_size(self):
+        s = transaction.BytesReader(bfh('0001fcfdfd00fdfffffe00000100feffffffffff0000000001000000ffffffffffffffffff'))
+        for v in [0, 1, 252, 253, 2**16-1, 2**16, 2**32-1, 2**32, 2**64-1]:
+            self.assertEqual(s.read_compact_size(), v)
+        self.assertFalse(s.can_read_more())
+        with self.assertRaises(transaction.SerializationError):
+            s.read_compact_size()
+        s = transaction.BytesReader(bfh('fdff'))
+        with self.assertRaises(transaction.SerializationError):
+            s.read_compact_size()
+
+    def test_bytes(self):
+        s = transaction.BytesReader(bytearray(b'foobar'))
+        self.assertEqual(s.read_bytes(3), b'foo')
+        start = s.cursor
+        with self.assertRaises(transaction.SerializationError):
+            s.read_bytes(4)
+        s.skip_bytes(2)
+        self.assertEqual(s.get_bytes_since(start), b'ba')
+        self.assertEqual(s.read_bytes(0), b'')
+        self.assertEqual(s.read_bytes(1), b'r')
+        self.assertFalse(s.can_read_more())
+
+    def test_numbers(self):
+        s = transaction.BytesReader(bfh('ffffffff' 'ffffffff' '00e1f50500000000' '0100'))
+        self.assertEqual(s.read_int32(), -1)
+        self.assertEqual(s.read_uint32(), 2**32-1)
+        self.assertEqual(s.read_int64(), 10**8)
+        with self.assertRaises(transaction.SerializationError):
+            s.read_uint32()
+
+
 class TestTransaction(ElectrumTestCase):
     def test_match_against_script_template(self):
         script = bfh(construct_script([opcodes.OP_5, bytes(29)]))
@@ -87,6 +124,20 @@ class TestTransaction(ElectrumTestCase):
         script = bfh(construct_script([opcodes.OP_0, bytes(50)]))
         self.assertFalse(match_script_against_template(script, SCRIPTPUBKEY_TEMPLATE_ANYSEGWIT))
 
+    def test_txins_and_txouts_have_no_dict(self):
+        tx = tx_from_any("cHNidP8BAFUBAAAAASpcmpT83pj1WBzQAWLGChOTbOt1OJ6mW/OGM7Qk60AxAAAAAAD/////AUBCDwAAAAAAGXapFCMKw3g0BzpCFG8R74QUrpKf6q/DiKwAAAAAAAAA")
+        txin, txout = tx.inputs()[0], tx.outputs()[0]
+        txin.spent_height = 100
+        txout.is_change = True
+        for obj in (txin, txout, txin.prevout, Transaction(signed_blob).inputs()[0], Transaction(signed_blob).outputs()[0]):
+            self.assertFalse(hasattr(obj, '__dict__'))
+        with self.assertRaises(AttributeError):
+            txin.some_attribute = 1
+        tx_copy = copy.deepcopy(tx)
+        self.assertEqual(100, tx_copy.inputs()[0].spent_height)
+        self.assertTrue(tx_copy.outputs()[0].is_change)
+        self.assertEqual(tx.serialize(), tx_copy.serialize())
+
     def test_tx_update_signatures(self):
         tx = tx_from_any("cHNidP8BAFUBAAAAASpcmpT83pj1WBzQAWLGChOTbOt1OJ6mW/OGM7Qk60AxAAAAAAD/////AUBCDwAAAAAAGXapFCMKw3g0BzpCFG8R74QUrpKf6q/DiKwAAAAAAAAA")
         tx.inputs()[0].script_type = 'p2pkh'
@@ -151,6 +202,17 @@ class TestTransaction(ElectrumTestCase):
         self.assertEqual(tx.estimated_weight(), 561)
         self.assertEqual(tx.estimated_size(), 141)
 
+    def test_txid_from_raw_matches_reserialized_txid(self):
+        for raw_tx in (signed_blob, v2_blob, signed_segwit_blob):
+            tx = transaction.Transaction(bfh(raw_tx))
+            txid, wtxid = tx.txid(), tx.wtxid()
+            tx.invalidate_ser_cache()
+            self.assertEqual(txid, tx.txid())
+            self.assertEqual(wtxid, tx.wtxid())
+            self.assertEqual(raw_tx, tx.serialize())
+        tx = transaction.Transaction(signed_segwit_blob)
+        self.assertNotEqual(tx.txid(), tx.wtxid())
+
     def test_version_field(self):
         tx = transaction.Transaction(v2_blob)
         self.assertEqual(tx.txid(), "b97f9180173ab141b61b9f944d841e60feec691d6daab4d4d932b24dd36606fe")
@@ -856,6 +918,64 @@ class TestTransaction(ElectrumTestCase):
 
 # txns from Bitcoin Core ends <---
 
+    def _make_tx_to_sign(self, keys) -> PartialTransaction:
+        pubkeys = [k.get_public_key_bytes(compressed=True) for k in keys]
+        inputs = []
+        for i in range(20):
+            txin = PartialTxInput(prevout=TxOutpoint(txid=bytes([i]) * 32, out_idx=i))
+            txin.script_type = 'p2wpkh'
+            txin.pubkeys = [pubkeys[i % len(pubkeys)]]
+            txin.num_sig = 1
+            txin._trusted_value_sats = 100_000
+            inputs.append(txin)
+        txin = PartialTxInput(prevout=TxOutpoint(txid=bytes([255]) * 32, out_idx=0))
+        txin.script_type = 'p2wsh'
+        txin.pubkeys = pubkeys
+        txin.num_sig = 2
+        txin._trusted_value_sats = 100_000
+        inputs.append(txin)
+        outputs = [PartialTxOutput(scriptpubkey=bfh('0014' + '11' * 20), value=2_000_000)]
+        return PartialTransaction.from_io(inputs, outputs, locktime=0, BIP69_sort=False)
+
+    def test_legacy_preimages_from_sighash_cache(self):
+        keys = [ECPrivkey(bytes([i]) * 32) for i in (1, 2)]
+        inputs = []
+        for i in range(5):
+            txin = PartialTxInput(prevout=TxOutpoint(txid=bytes([i]) * 32, out_idx=i))
+            txin.script_type = 'p2pkh'
+            txin.pubkeys = [keys[i % 2].get_public_key_bytes(compressed=True)]
+            txin.num_sig = 1
+            txin.nsequence = 0xffffffff - i
+            inputs.append(txin)
+        outputs = [PartialTxOutput(scriptpubkey=bfh('0014' + '11' * 20), value=300_000 + i) for i in range(300)]
+        tx = PartialTransaction.from_io(inputs, outputs, locktime=1234, BIP69_sort=False)
+        sighash_cache = transaction.SighashCache(tx)
+        for i, txin in enumerate(inputs):
+            txins = bitcoin.var_int(len(inputs)) + ''.join(
+                tx.serialize_input(other, tx.get_preimage_script(txin) if other is txin else '')
+                for other in inputs)
+            txouts = bitcoin.var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
+            preimage = bitcoin.int_to_hex(tx.version, 4) + txins + txouts + bitcoin.int_to_hex(1234, 4) + '01000000'
+            self.assertEqual(preimage, tx.serialize_preimage(i, sighash_cache=sighash_cache))
+            self.assertEqual(preimage, tx.serialize_preimage(i))
+
+    def test_sign_in_parallel(self):
+        keys = [ECPrivkey(bytes([i]) * 32) for i in (1, 2, 3)]
+        keypairs = {k.get_public_key_hex(compressed=True): (k.get_secret_bytes(), True) for k in keys}
+        tx1 = self._make_tx_to_sign(keys)
+        with mock.patch.object(transaction, '_get_signing_executor', return_value=None):
+            tx1.sign(keypairs)
+        self.assertTrue(tx1.is_complete())
+        # the multisig input only gets as many sigs as needed
+        self.assertEqual({k.get_public_key_bytes(compressed=True) for k in keys[0:2]},
+                         set(tx1.inputs()[-1].part_sigs))
+        tx2 = self._make_tx_to_sign(keys)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            with mock.patch.object(transaction, '_get_signing_executor', return_value=executor), \
+                    mock.patch.object(transaction, 'MIN_SIGS_FOR_PARALLEL_SIGNING', 2):
+                tx2.sign(keypairs)
+        self.assertEqual(tx1.serialize(), tx2.serialize())
+
 
 class TestTransactionTestnet(TestCaseForTestnet):
 
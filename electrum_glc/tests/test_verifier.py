@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
+import asyncio
 
 from electrum_glc.bitcoin import hash_encode
+from electrum_glc.blockchain import hash_header
+from electrum_glc.interface import GracefulDisconnect
+from electrum_glc.simple_config import SimpleConfig
 from electrum_glc.transaction import Transaction
 from electrum_glc.util import bfh
 from electrum_glc.verifier import SPV, InnerNodeOfSpvProofIsValidTx
@@ -48,3 +52,77 @@ class VerifierTestCase(TestCaseForTestnet):
         f_tx_hash = hash_encode(bfh(VALID_64_BYTE_TX[:64]))
         with self.assertRaises(InnerNodeOfSpvProofIsValidTx):
             SPV.hash_merkle_root(fake_mbranch, f_tx_hash, 6)
+
+
+class MockBlockchain:
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.num_reads = 0
+
+    def read_header(self, height):
+        self.num_reads += 1
+        return self.headers.get(height)
+
+
+class MockNetwork:
+
+    def __init__(self, asyncio_loop, config, chain):
+        self.asyncio_loop = asyncio_loop
+        self.config = config
+        self.interface = None
+        self.bhi_lock = asyncio.Lock()
+        self.chain = chain
+
+    def blockchain(self):
+        return self.chain
+
+
+class MockADB:
+
+    def __init__(self):
+        self.verified = []
+
+    def diagnostic_name(self):
+        return 'mock_adb'
+
+    def add_verified_txs(self, items):
+        self.verified.append(items)
+
+
+class TestSPVProofs(TestCaseForTestnet):
+
+    header = {'version': 0x20000000, 'prev_block_hash': '00' * 32, 'merkle_root': MERKLE_ROOT,
+              'timestamp': 1600000000, 'bits': 0x1d00ffff, 'nonce': 0, 'block_height': 1000}
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.chain = MockBlockchain({1000: self.header})
+        self.adb = MockADB()
+        self.spv = SPV(MockNetwork(self.asyncio_loop, self.config, self.chain), self.adb)
+        # the two txs at positions 2 and 3 of the same block
+        t_tx_hash = Transaction(VALID_64_BYTE_TX).txid()
+        self.proofs = [
+            (t_tx_hash, 1000, {'block_height': 1000, 'pos': 3, 'merkle': MERKLE_BRANCH}),
+            (MERKLE_BRANCH[0], 1000, {'block_height': 1000, 'pos': 2, 'merkle': [t_tx_hash, MERKLE_BRANCH[1]]}),
+        ]
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.spv.stop(), self.asyncio_loop).result()
+        super().tearDown()
+
+    def test_proofs_of_a_block_are_verified_together(self):
+        asyncio.run_coroutine_threadsafe(self.spv._verify_proofs(self.proofs), self.asyncio_loop).result()
+        self.assertEqual(1, self.chain.num_reads)
+        self.assertEqual(1, len(self.adb.verified))
+        self.assertEqual([tx_hash for tx_hash, _, _ in self.proofs], [tx_hash for tx_hash, _ in self.adb.verified[0]])
+        for tx_hash, tx_info in self.adb.verified[0]:
+            self.assertEqual(hash_header(self.header), tx_info.header_hash)
+            self.assertEqual(MERKLE_ROOT, self.spv.merkle_roots[tx_hash])
+
+    def test_invalid_proof_fails_the_batch(self):
+        self.proofs[1][2]['pos'] = 1
+        with self.assertRaises(GracefulDisconnect):
+            asyncio.run_coroutine_threadsafe(self.spv._verify_proofs(self.proofs), self.asyncio_loop).result()
+        self.assertEqual([], self.adb.verified)
@@ -7,15 +7,25 @@ from decimal import Decimal
 import time
 from io import StringIO
 import asyncio
+import zlib
+from unittest import mock
 
-from electrum_glc.storage import WalletStorage
+from electrum_glc import storage as storage_module
+from electrum_glc.storage import WalletStorage, StorageEncryptionVersion, get_journal_path
+from electrum_glc.transaction import TxOutpoint
 from electrum_glc.wallet_db import FINAL_SEED_VERSION
 from electrum_glc.wallet import (Abstract_Wallet, Standard_Wallet, create_new_wallet,
                                  restore_wallet_from_text, Imported_Wallet, Wallet)
+from electrum_glc.base_wizard import BaseWizard
+from electrum_glc.wizard import NewWalletWizard
 from electrum_glc.exchange_rate import ExchangeBase, FxThread
-from electrum_glc.util import TxMinedInfo, InvalidPassword
+from electrum_glc.util import TxMinedInfo, InvalidPassword, WalletFileException
+from electrum_glc.interface import NetworkException
 from electrum_glc.bitcoin import COIN
+from electrum_glc import bitcoin
+from electrum_glc import wallet_db
 from electrum_glc.wallet_db import WalletDB
+from electrum_glc.json_db import LazyStoredDict, peek
 from electrum_glc.simple_config import SimpleConfig
 from electrum_glc import util
 
@@ -86,6 +96,247 @@ class TestWalletStorage(WalletTestCase):
         for key, value in some_dict.items():
             self.assertEqual(d[key], value)
 
+
+class TestWalletStorageJournal(WalletTestCase):
+
+    def _load_db(self) -> WalletDB:
+        storage = WalletStorage(self.wallet_path)
+        return WalletDB(storage.read(), manual_upgrades=False)
+
+    def _create_db(self):
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB('', manual_upgrades=False)
+        db.put('labels', {'a': 'b'})
+        db.write(storage)
+        return storage, db
+
+    def test_changes_are_appended_to_journal(self):
+        storage, db = self._create_db()
+        with open(self.wallet_path, "r") as f:
+            snapshot = f.read()
+        db.get_dict('labels')['c'] = 'd'
+        db.get_dict('labels').pop('a')
+        db.add_txi_addr('ab' * 32, 'addr1', 'cd' * 32 + ':0', 1000)
+        db.add_prevout_by_scripthash('ef' * 32, prevout=TxOutpoint.from_str('cd' * 32 + ':0'), value=1000)
+        db.put('some_list', [1, 2])
+        db.write(storage)
+        # the wallet file itself was not rewritten
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(snapshot, f.read())
+        self.assertTrue(os.path.exists(get_journal_path(self.wallet_path)))
+        db2 = self._load_db()
+        self.assertEqual({'c': 'd'}, db2.get('labels'))
+        self.assertEqual({'addr1': {'cd' * 32 + ':0': 1000}}, db2.txi['ab' * 32])
+        self.assertEqual({(TxOutpoint.from_str('cd' * 32 + ':0'), 1000)}, db2.get_prevouts_by_scripthash('ef' * 32))
+        self.assertEqual(json.loads(db.dump()), json.loads(db2.dump()))
+        # appending to an existing journal
+        db.clear_history()
+        db.write(storage)
+        self.assertEqual(json.loads(db.dump()), json.loads(self._load_db().dump()))
+
+    def test_list_changed_in_place_and_assigned_back(self):
+        # e.g. HTLCManager.store_local_update_raw_msg
+        storage, db = self._create_db()
+        d = db.get_dict('unacked_updates')
+        d[0] = ['a']
+        db.write(storage)
+        l = d.get(0, [])
+        l.append('b')
+        d[0] = l
+        db.write(storage)
+        self.assertTrue(storage.has_journal())
+        self.assertEqual(['a', 'b'], self._load_db().get('unacked_updates')[0])
+        # same with put
+        db.put('some_list', ['a'])
+        l = db.get('some_list')
+        l.append('b')
+        db.put('some_list', l)
+        db.write(storage)
+        self.assertEqual(['a', 'b'], self._load_db().get('some_list'))
+
+    def test_delete_removes_journal(self):
+        storage, db = self._create_db()
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        self.assertTrue(os.path.exists(get_journal_path(self.wallet_path)))
+        storage.delete()
+        self.assertFalse(storage.file_exists())
+        self.assertFalse(os.path.exists(self.wallet_path))
+        self.assertFalse(os.path.exists(get_journal_path(self.wallet_path)))
+
+    def test_older_versions_refuse_journaled_wallets(self):
+        storage, db = self._create_db()
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        self.assertTrue(storage.has_journal())
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual(FINAL_SEED_VERSION, json.loads(f.read())['seed_version'])
+        # older versions would ignore the journal
+        with mock.patch.object(wallet_db, 'FINAL_SEED_VERSION', 50):
+            with self.assertRaises(WalletFileException):
+                self._load_db()
+
+    def test_compaction(self):
+        storage, db = self._create_db()
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        self.assertTrue(storage.has_journal())
+        db.write(storage, compact=True)
+        self.assertFalse(storage.has_journal())
+        self.assertFalse(os.path.exists(get_journal_path(self.wallet_path)))
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual('d', json.loads(f.read())['labels']['c'])
+        # compacting does not start a new journal
+        db.get_dict('labels')['c'] = 'e'
+        db.write(storage, compact=True)
+        self.assertFalse(os.path.exists(get_journal_path(self.wallet_path)))
+        with open(self.wallet_path, "r") as f:
+            self.assertEqual('e', json.loads(f.read())['labels']['c'])
+        # journal is compacted once it grows larger than the wallet file
+        for i in range(100):
+            db.get_dict('labels')[str(i)] = 'x' * 100
+            db.write(storage)
+        self.assertLess(os.path.getsize(get_journal_path(self.wallet_path)), os.path.getsize(self.wallet_path))
+        self.assertEqual(json.loads(db.dump()), json.loads(self._load_db().dump()))
+
+    def test_stale_journal_is_ignored(self):
+        storage, db = self._create_db()
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        with open(get_journal_path(self.wallet_path), "rb") as f:
+            journal = f.read()
+        db.get_dict('labels')['c'] = 'e'
+        db.write(storage, compact=True)
+        # e.g. we crashed after writing the wallet file, but before deleting the journal
+        with open(get_journal_path(self.wallet_path), "wb") as f:
+            f.write(journal)
+        self.assertEqual('e', self._load_db().get('labels')['c'])
+
+    def test_partially_written_change_is_ignored(self):
+        storage, db = self._create_db()
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        with open(get_journal_path(self.wallet_path), "ab") as f:
+            f.write(b'["set", ["labels", "c"], "e')
+        storage2 = WalletStorage(self.wallet_path)
+        db2 = WalletDB(storage2.read(), manual_upgrades=False)
+        self.assertEqual('d', db2.get('labels')['c'])
+        # the partial change is overwritten by the next append
+        db2.get_dict('labels')['f'] = 'g'
+        db2.write(storage2)
+        self.assertEqual({'a': 'b', 'c': 'd', 'f': 'g'}, self._load_db().get('labels'))
+
+    def test_no_journal_for_encrypted_storage(self):
+        storage, db = self._create_db()
+        storage.set_password('secret', StorageEncryptionVersion.USER_PASSWORD)
+        db.set_modified(True)
+        db.write(storage)
+        db.get_dict('labels')['c'] = 'd'
+        db.write(storage)
+        self.assertFalse(os.path.exists(get_journal_path(self.wallet_path)))
+        storage2 = WalletStorage(self.wallet_path)
+        storage2.decrypt('secret')
+        self.assertEqual('d', WalletDB(storage2.read(), manual_upgrades=False).get('labels')['c'])
+
+
+class TestWalletStorageEncryption(WalletTestCase):
+
+    def _write_encrypted(self, data: str, password='secret') -> None:
+        storage = WalletStorage(self.wallet_path)
+        storage.set_password(password, StorageEncryptionVersion.USER_PASSWORD)
+        storage.write(data)
+
+    def _read_encrypted(self, password='secret') -> str:
+        storage = WalletStorage(self.wallet_path)
+        self.assertTrue(storage.is_encrypted_with_user_pw())
+        storage.decrypt(password)
+        return storage.read()
+
+    def test_write_and_read_in_chunks(self):
+        data = json.dumps({'labels': {str(i): f"label ₿ {i}" for i in range(1000)}})
+        with mock.patch.object(storage_module, 'STREAM_CHUNK_SIZE', 64):
+            self._write_encrypted(data)
+            self.assertEqual(data, self._read_encrypted())
+        with open(self.wallet_path, "rb") as f:
+            self.assertEqual(b'BIS1', f.read(4))
+
+    def test_invalid_password(self):
+        self._write_encrypted('{}')
+        with self.assertRaises(InvalidPassword):
+            self._read_encrypted('wrong')
+
+    def test_truncated_file(self):
+        with mock.patch.object(storage_module, 'STREAM_CHUNK_SIZE', 64):
+            self._write_encrypted(os.urandom(1000).hex())
+        with open(self.wallet_path, "r+b") as f:
+            f.truncate(os.path.getsize(self.wallet_path) - 200)
+        with self.assertRaises(util.WalletFileException):
+            self._read_encrypted()
+
+    def test_read_file_written_by_older_versions(self):
+        ec_key = WalletStorage.get_eckey_from_password('secret')
+        encrypted = ec_key.encrypt_message(zlib.compress(b'{"a": "b"}'), b'BIE1')
+        with open(self.wallet_path, "wb") as f:
+            f.write(encrypted)
+        self.assertEqual('{"a": "b"}', self._read_encrypted())
+
+    def test_password_key_is_cached(self):
+        self._write_encrypted('{}')
+        storage = WalletStorage(self.wallet_path)
+        with mock.patch.object(WalletStorage, 'get_eckey_from_password',
+                               wraps=WalletStorage.get_eckey_from_password) as get_eckey:
+            storage.decrypt('secret')
+            storage.check_password('secret')
+            storage.check_password('secret')
+            self.assertEqual(1, get_eckey.call_count)
+            with self.assertRaises(InvalidPassword):
+                storage.check_password('wrong')
+            self.assertEqual(2, get_eckey.call_count)
+
+
+class TestLazyLoading(WalletTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db = WalletDB('', manual_upgrades=False)
+        db.add_txo_addr('ab' * 32, 'addr1', 0, 1000, False)
+        db.add_txi_addr('cd' * 32, 'addr1', 'ab' * 32 + ':0', 1000)
+        self.wallet_str = db.dump()
+
+    def test_items_are_converted_on_access(self):
+        db = WalletDB(self.wallet_str, manual_upgrades=False)
+        self.assertIsInstance(db.txo, LazyStoredDict)
+        self.assertIs(dict, type(peek(db.txo, 'ab' * 32)))
+        # reading through the db does not convert
+        self.assertEqual({0: (1000, False)}, db.get_txo_addr('ab' * 32, 'addr1'))
+        self.assertEqual(['addr1'], db.get_txi_addresses('cd' * 32))
+        self.assertIs(dict, type(peek(db.txo, 'ab' * 32)))
+        self.assertIsInstance(db.txo['ab' * 32], LazyStoredDict)
+        self.assertEqual(['ab' * 32, 'addr1'], db.txo['ab' * 32]['addr1'].path[1:])
+        self.assertEqual(json.loads(self.wallet_str), json.loads(db.dump()))
+
+    def test_copies_are_converted(self):
+        for copy_dict in (dict, lambda d: {**d}, lambda d: d.copy(), lambda d: dict(d.items())):
+            db = WalletDB(self.wallet_str, manual_upgrades=False)
+            d = copy_dict(db.txo)
+            self.assertIsInstance(d['ab' * 32], LazyStoredDict)
+            self.assertIs(d['ab' * 32], db.txo['ab' * 32])
+
+    def test_changes_to_lazily_loaded_items_are_saved(self):
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB(self.wallet_str, manual_upgrades=False)
+        db.set_modified(True)
+        db.write(storage)
+        db.add_txo_addr('ab' * 32, 'addr1', 1, 2000, False)
+        db.remove_txi('cd' * 32)
+        db.write(storage)
+        self.assertTrue(storage.has_journal())
+        db2 = WalletDB(WalletStorage(self.wallet_path).read(), manual_upgrades=False)
+        self.assertEqual({0: (1000, False), 1: (2000, False)}, db2.get_txo_addr('ab' * 32, 'addr1'))
+        self.assertEqual([], db2.get_txi_addresses('cd' * 32))
+        self.assertEqual(json.loads(db.dump()), json.loads(db2.dump()))
+
+
 class FakeExchange(ExchangeBase):
     def __init__(self, rate):
         super().__init__(lambda self: None, lambda self: None)
@@ -253,6 +504,63 @@ class TestCreateRestoreWallet(WalletTestCase):
         wallet.delete_address('ltc1qnp78h78vp92pwdwq5xvh8eprlga5q8gu7xl7hg')
         self.assertEqual(1, len(wallet.get_receiving_addresses()))
 
+    def test_discover_addresses(self):
+        text = 'zpub6nydoME6CFdJtMpzHW5BNoPz6i6XbeT9qfz72wsRqGdgGEYeivso6xjfw8cGcCyHwF7BNW4LDuHF35XrZsovBLWMF4qXSjmhTXYiHbWqGLt'
+        self.config.set_key('address_discovery_block_size', 7)
+        wallet = restore_wallet_from_text(text, path=self.wallet_path, gap_limit=20, config=self.config)['wallet']
+        self.assertTrue(wallet.db.get('needs_address_discovery'))
+        # index 60 is beyond the gap limit after index 22
+        used = {wallet.derive_address(0, n) for n in (0, 3, 22, 60)} | {wallet.derive_address(1, 5)}
+        used = {bitcoin.address_to_scripthash(addr) for addr in used}
+        requested = []
+
+        class FakeNetwork:
+            async def get_histories_for_scripthashes(self, shs):
+                requested.extend(shs)
+                return [[{'tx_hash': '00' * 32, 'height': 1}] if sh in used else [] for sh in shs]
+
+        wallet.network = FakeNetwork()
+        asyncio.run_coroutine_threadsafe(wallet.do_address_discovery(), self.asyncio_loop).result()
+        self.assertEqual(23 + 20, wallet.db.num_receiving_addresses())
+        self.assertEqual(6 + wallet.gap_limit_for_change, wallet.db.num_change_addresses())
+        self.assertEqual(len(requested), len(set(requested)))
+        self.assertIsNone(wallet.db.get('needs_address_discovery'))
+
+    def test_address_discovery_failure_falls_back_to_synchronize(self):
+        text = 'zpub6nydoME6CFdJtMpzHW5BNoPz6i6XbeT9qfz72wsRqGdgGEYeivso6xjfw8cGcCyHwF7BNW4LDuHF35XrZsovBLWMF4qXSjmhTXYiHbWqGLt'
+        wallet = restore_wallet_from_text(text, path=self.wallet_path, gap_limit=20, config=self.config)['wallet']
+
+        for exc in (AssertionError('interface not ready'), NetworkException('server went away')):
+            class FakeNetwork:
+                async def get_histories_for_scripthashes(self, shs):
+                    raise exc
+
+            wallet.network = FakeNetwork()
+            with mock.patch.object(wallet, 'synchronize', wraps=wallet.synchronize) as synchronize:
+                asyncio.run_coroutine_threadsafe(wallet.do_address_discovery(), self.asyncio_loop).result()
+            synchronize.assert_called_once_with()
+            self.assertEqual(20, wallet.db.num_receiving_addresses())
+            self.assertTrue(wallet.db.get('needs_address_discovery'))
+
+    def test_wizard_restore_needs_address_discovery(self):
+        text = 'zpub6nydoME6CFdJtMpzHW5BNoPz6i6XbeT9qfz72wsRqGdgGEYeivso6xjfw8cGcCyHwF7BNW4LDuHF35XrZsovBLWMF4qXSjmhTXYiHbWqGLt'
+        wizard = BaseWizard(self.config, plugins=None)
+        wizard.data['wallet_type'] = wizard.wallet_type = 'standard'
+        wizard.request_password = lambda run_next, **kwargs: run_next(None, False)
+        wizard.terminate = lambda **kwargs: None
+        wizard.on_restore_from_key(text)
+        storage, db = wizard.create_storage(self.wallet_path)
+        self.assertTrue(db.get('needs_address_discovery'))
+        wallet = Wallet(db, storage, config=self.config)
+        self.assertTrue(wallet.db.get('needs_address_discovery'))
+        # the wizard of the qml gui
+        path = self.wallet_path + '2'
+        NewWalletWizard(daemon=None).create_storage(path, {
+            'wallet_type': 'standard', 'keystore_type': 'masterkey', 'master_key': text,
+            'encrypt': False, 'password': None})
+        storage = WalletStorage(path)
+        self.assertTrue(WalletDB(storage.read(), manual_upgrades=False).get('needs_address_discovery'))
+
 
 class TestWalletPassword(WalletTestCase):
 
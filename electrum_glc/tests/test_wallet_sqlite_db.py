@@ -0,0 +1,161 @@
+import os
+import json
+from unittest import mock
+
+from electrum_glc import storage, wallet
+from electrum_glc.storage import WalletStorage
+from electrum_glc.transaction import Transaction
+from electrum_glc.util import TxMinedInfo, WalletFileException, InvalidPassword
+from electrum_glc.wallet import create_new_wallet, restore_wallet_from_text, Wallet
+from electrum_glc.wallet_db import load_wallet_db
+from electrum_glc.wallet_sqlite_db import SqliteWalletDB, convert_wallet_db
+from electrum_glc.simple_config import SimpleConfig
+from electrum_glc.base_wizard import BaseWizard
+from electrum_glc.bip32 import BIP32Node
+from electrum_glc.wizard import NewWalletWizard
+
+from . import TestCaseForTestnet
+from . import test_wallet_vertical as vertical
+
+
+class SqliteBackendMixin:
+    """Runs the tests of the mixed-in class with SqliteWalletDB."""
+
+    def setUp(self):
+        super().setUp()
+        patches = [
+            mock.patch.object(storage, 'WalletDB', SqliteWalletDB),
+            mock.patch.object(wallet, 'create_wallet_db', lambda **kwargs: SqliteWalletDB('', manual_upgrades=False)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+
+class TestWalletKeystoreAddressIntegrityForTestnetSqlite(SqliteBackendMixin, vertical.TestWalletKeystoreAddressIntegrityForTestnet): pass
+class TestWalletSendingSqlite(SqliteBackendMixin, vertical.TestWalletSending): pass
+class TestWalletOfflineSigningSqlite(SqliteBackendMixin, vertical.TestWalletOfflineSigning): pass
+class TestWalletHistory_SimpleRandomOrderSqlite(SqliteBackendMixin, vertical.TestWalletHistory_SimpleRandomOrder): pass
+class TestWalletHistory_EvilGapLimitSqlite(SqliteBackendMixin, vertical.TestWalletHistory_EvilGapLimit): pass
+class TestWalletHistory_DoubleSpendSqlite(SqliteBackendMixin, vertical.TestWalletHistory_DoubleSpend): pass
+class TestImportedWalletSqlite(SqliteBackendMixin, vertical.TestImportedWallet): pass
+
+
+class TestSqliteWalletFile(TestCaseForTestnet):
+
+    txid = "0e350564ee7ed4ffce24a998b538f7f3ebbab6fcb4bb331f8bb6b9d86d86fcd8"
+    address = "tltc1q7648a2pm2se425lvun0g3vlf4ahmflctw32u2c"
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.wallet_path = os.path.join(self.electrum_path, "somewallet")
+
+    def _create_wallet(self, db_backend):
+        w = restore_wallet_from_text(self.address, path=self.wallet_path, config=self.config,
+                                     db_backend=db_backend)['wallet']
+        w.adb.add_transaction(Transaction(vertical.TestImportedWallet.transactions[self.txid]))
+        w.db.add_verified_tx(self.txid, TxMinedInfo(height=1970, timestamp=1600000000, txpos=1, header_hash='00' * 32))
+        w.save_db()
+        return w
+
+    def _load_wallet(self):
+        s = WalletStorage(self.wallet_path)
+        return Wallet(load_wallet_db(s, manual_upgrades=False), s, config=self.config)
+
+    def _check_wallet(self, w):
+        self.assertEqual([self.address], w.get_addresses())
+        self.assertEqual([self.txid], list(w.db.list_transactions()))
+        self.assertEqual(1970, w.db.get_verified_tx(self.txid).height)
+        self.assertEqual((843361, 0, 0), w.get_balance())
+
+    def test_history_is_saved_to_file(self):
+        w = self._create_wallet('sqlite')
+        self.assertTrue(w.storage.is_sqlite())
+        w = self._load_wallet()
+        self.assertIsInstance(w.db, SqliteWalletDB)
+        self._check_wallet(w)
+        # the history is not stored as json
+        self.assertNotIn('txi', json.loads(w.db._read_meta()))
+        self.assertIn(self.txid, json.loads(w.db.dump())['transactions'])
+
+    def test_convert_wallet_db(self):
+        w = self._create_wallet('json')
+        s = w.storage
+        db = convert_wallet_db(s, w.db, to_sqlite=True)
+        self.assertIsInstance(db, SqliteWalletDB)
+        w = self._load_wallet()
+        self.assertIsInstance(w.db, SqliteWalletDB)
+        self._check_wallet(w)
+        db = convert_wallet_db(w.storage, w.db, to_sqlite=False)
+        self.assertNotIsInstance(db, SqliteWalletDB)
+        w = self._load_wallet()
+        self.assertFalse(w.storage.is_sqlite())
+        self.assertNotIsInstance(w.db, SqliteWalletDB)
+        self._check_wallet(w)
+
+    def test_storage_encryption_is_not_supported(self):
+        with self.assertRaises(WalletFileException):
+            restore_wallet_from_text(self.address, path=self.wallet_path, config=self.config,
+                                     password='secret', encrypt_file=True, db_backend='sqlite')
+        self.assertFalse(os.path.exists(self.wallet_path))
+
+    def test_password_protected_wallet(self):
+        w = create_new_wallet(path=self.wallet_path, config=self.config, password='secret',
+                              db_backend='sqlite')['wallet']
+        self.assertTrue(w.storage.is_sqlite())
+        self.assertFalse(w.storage.is_encrypted())
+        self.assertTrue(w.has_keystore_encryption())
+        w = restore_wallet_from_text(self.address, path=self.wallet_path + '2', config=self.config,
+                                     password='secret', db_backend='sqlite')['wallet']
+        self.assertFalse(w.storage.is_encrypted())
+        s = WalletStorage(self.wallet_path)
+        w = Wallet(load_wallet_db(s, manual_upgrades=False), s, config=self.config)
+        w.check_password('secret')
+        with self.assertRaises(InvalidPassword):
+            w.check_password('wrong')
+
+    def test_only_changed_meta_rows_are_written(self):
+        self._create_wallet('sqlite')
+        w = self._load_wallet()
+        conn = w.db.conn
+        conn.execute("UPDATE meta SET value=? WHERE key='addresses'", (json.dumps({'not': 'rewritten'}),))
+        conn.commit()
+        w.set_label(self.address, 'some label')
+        w.db.put('stored_height', 1234)
+        w.db.put('use_encryption', None)
+        w.save_db()
+        meta = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+        self.assertEqual({'not': 'rewritten'}, meta['addresses'])
+        self.assertEqual({self.address: 'some label'}, meta['labels'])
+        self.assertEqual(1234, meta['stored_height'])
+        self.assertNotIn('use_encryption', meta)
+        # unless we do not know what changed
+        w.db.set_modified(True)
+        w.save_db()
+        self.assertEqual(w.db.get('addresses'), json.loads(w.db._read_meta())['addresses'])
+
+    def test_wizards_use_db_backend_option(self):
+        self.config.set_key('wallet_db_backend', 'sqlite')
+        text = BIP32Node.from_rootseed(bytes(32), xtype='p2wpkh').to_xprv()
+        wizard = BaseWizard(self.config, plugins=None)
+        wizard.data['wallet_type'] = wizard.wallet_type = 'standard'
+        # the wallet file cannot be encrypted, so that is skipped
+        wizard.request_password = lambda run_next, **kwargs: run_next('secret', True)
+        wizard.terminate = lambda **kwargs: None
+        wizard.on_restore_from_key(text)
+        storage, db = wizard.create_storage(self.wallet_path)
+        self.assertIsInstance(db, SqliteWalletDB)
+        self.assertTrue(storage.is_sqlite())
+        self.assertFalse(storage.is_encrypted())
+        Wallet(db, storage, config=self.config).check_password('secret')
+        # the wizard of the qml gui
+        path = self.wallet_path + '2'
+        NewWalletWizard(daemon=mock.Mock(config=self.config)).create_storage(path, {
+            'wallet_type': 'standard', 'keystore_type': 'masterkey', 'master_key': text,
+            'encrypt': True, 'password': 'secret'})
+        storage = WalletStorage(path)
+        self.assertTrue(storage.is_sqlite())
+        self.assertFalse(storage.is_encrypted())
+        w = Wallet(load_wallet_db(storage, manual_upgrades=False), storage, config=self.config)
+        w.check_password('secret')
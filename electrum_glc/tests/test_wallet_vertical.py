@@ -4,7 +4,9 @@ import shutil
 import tempfile
 from typing import Sequence
 import asyncio
+import threading
 import copy
+import json
 
 from electrum_glc import storage, bitcoin, keystore, bip32, slip39, wallet
 from electrum_glc import Transaction
@@ -15,11 +17,12 @@ from electrum_glc.wallet import (sweep, Multisig_Wallet, Standard_Wallet, Import
                                  restore_wallet_from_text, Abstract_Wallet, BumpFeeStrategy)
 from electrum_glc.util import (
     bfh, bh2u, NotEnoughFunds, UnrelatedTransactionException,
-    UserFacingException)
+    UserFacingException, TxMinedInfo)
 from electrum_glc.transaction import (TxOutput, Transaction, PartialTransaction, PartialTxOutput,
                                       PartialTxInput, tx_from_any, TxOutpoint)
 from electrum_glc.mnemonic import seed_type
 from electrum_glc.network import Network
+from electrum_glc.synchronizer import history_status
 
 from . import TestCaseForTestnet
 from . import ElectrumTestCase
@@ -224,6 +227,10 @@ class TestWalletKeystoreAddressIntegrityForMainnet(ElectrumTestCase):
 
         self.assertEqual(w.get_receiving_addresses()[0], 'MC1qiM3LvsbB3WdgFf9q3tzK9fmLrX1SQs')
         self.assertEqual(w.get_change_addresses()[0], 'MRnKmWLg8T5jPEj8TktCyfWv4FPqyFBS3V')
+        # single pubkeys are served from the derive_pubkey cache
+        pubkey = w.get_public_key('MC1qiM3LvsbB3WdgFf9q3tzK9fmLrX1SQs')
+        with mock.patch.object(w.keystore, 'derive_pubkeys_range', side_effect=AssertionError):
+            self.assertEqual(pubkey, w.get_public_key('MC1qiM3LvsbB3WdgFf9q3tzK9fmLrX1SQs'))
 
     @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
     def test_bip39_seed_bip84_native_segwit(self, mock_save_db):
@@ -349,6 +356,7 @@ class TestWalletKeystoreAddressIntegrityForMainnet(ElectrumTestCase):
         ks = create_keystore_from_bip32seed(xtype='standard')
         self.assertEqual('033a05ec7ae9a9833b0696eb285a762f17379fa208b3dc28df1c501cf84fe415d0', ks.derive_pubkey(0, 0).hex())
         self.assertEqual('02bf27f41683d84183e4e930e66d64fc8af5508b4b5bf3c473c505e4dbddaeed80', ks.derive_pubkey(1, 0).hex())
+        self.assertEqual([ks.derive_pubkey(1, n) for n in range(3)], ks.derive_pubkeys_range(1, 0, 3))
 
         ks = create_keystore_from_bip32seed(xtype='standard')  # p2pkh
         w = WalletIntegrityHelper.create_standard_wallet(ks, config=self.config)
@@ -3340,6 +3348,183 @@ class TestWalletHistory_DoubleSpend(TestCaseForTestnet):
         w.adb.add_transaction(txC)
         self.assertEqual(999890, sum(w.get_balance()))
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_utxo_index_follows_history_changes(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+
+        def utxos_from_history():
+            return {txo.prevout.to_str(): txo.value_sats()
+                    for addr in w.get_addresses()
+                    for txo in w.adb.get_addr_outputs(addr).values()
+                    if txo.spent_height is None}
+
+        def utxos_from_index():
+            return {txo.prevout.to_str(): txo.value_sats()
+                    for txo in w.adb.get_utxos(w.get_addresses())}
+
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txB = Transaction(self.transactions["0e2182ead6660790290371516cb0b80afa8baebd30dad42b5e58a24ceea17f1c"])
+        w.adb.add_transaction(txB)
+        self.assertEqual({f"{txB.txid()}:1": 899800}, utxos_from_index())
+        # B arrives before its parent: the output of A is already spent when A is added
+        w.adb.add_transaction(txA)
+        self.assertEqual(utxos_from_history(), utxos_from_index())
+        self.assertNotIn(f"{txA.txid()}:1", utxos_from_index())
+        self.assertIn(f"{txB.txid()}:1", utxos_from_index())
+        # removing B makes the output of A unspent again
+        w.adb.remove_transaction(txB.txid())
+        self.assertEqual({f"{txA.txid()}:1": 1000000}, utxos_from_index())
+        self.assertEqual(utxos_from_history(), utxos_from_index())
+        self.assertEqual((0, 1000000, 0), w.get_balance())
+        # the index is rebuilt from the db on load
+        w.adb.add_transaction(txB)
+        expected = utxos_from_index()
+        w.adb.load_utxo_index()
+        self.assertEqual(expected, utxos_from_index())
+        self.assertEqual(utxos_from_history(), utxos_from_index())
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_readers_use_utxo_index_snapshots(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txB = Transaction(self.transactions["0e2182ead6660790290371516cb0b80afa8baebd30dad42b5e58a24ceea17f1c"])
+        w.adb.add_transaction(txA)
+        self.assertEqual((0, 1000000, 0), w.get_balance())
+        snapshot = w.adb._utxo_snapshot
+        # the changes of a write are published when it is done, in a new snapshot
+        with w.adb._writing_utxo_index():
+            w.adb.add_transaction(txB)
+            self.assertIs(snapshot, w.adb._utxo_snapshot)
+        self.assertIsNot(snapshot, w.adb._utxo_snapshot)
+        self.assertEqual({f"{txA.txid()}:1"}, set(snapshot.get_addr_utxos(txA.outputs()[1].address)))
+        self.assertEqual((0, 899800, 0), w.get_balance())
+        # readers are not blocked by a writer holding the locks
+        balances = []
+        with w.adb.lock, w.adb.transaction_lock:
+            thread = threading.Thread(target=lambda: balances.append(w.get_balance()))
+            thread.start()
+            thread.join(timeout=5)
+        self.assertEqual([(0, 899800, 0)], balances)
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_snapshots_keep_partial_balances_of_unchanged_shards(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txB = Transaction(self.transactions["0e2182ead6660790290371516cb0b80afa8baebd30dad42b5e58a24ceea17f1c"])
+        w.adb.add_transaction(txA)
+        self.assertEqual((0, 1000000, 0), w.get_balance())
+        old_snapshot = w.adb._utxo_snapshot
+        w.adb.add_transaction(txB)
+        snapshot = w.adb._utxo_snapshot
+        changed = {snapshot.get_shard_index(addr)
+                   for tx in (txA, txB) for addr in w.adb.db.get_txo_addresses(tx.txid())}
+        for i in range(len(snapshot.shard_balances)):
+            if i in changed:
+                self.assertEqual({}, snapshot.shard_balances[i])
+            else:
+                self.assertIs(old_snapshot.shard_balances[i], snapshot.shard_balances[i])
+        self.assertEqual((0, 899800, 0), w.get_balance())
+        # a tx getting mined only changes its height, and must invalidate the shards it touches
+        w.adb.add_unverified_or_unconfirmed_tx(txA.txid(), 1325000)
+        w.adb.add_unverified_or_unconfirmed_tx(txB.txid(), 1325000)
+        self.assertIsNot(snapshot, w.adb._utxo_snapshot)
+        self.assertEqual((899800, 0, 0), w.get_balance())
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_balance_is_computed_from_a_single_snapshot(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txB = Transaction(self.transactions["0e2182ead6660790290371516cb0b80afa8baebd30dad42b5e58a24ceea17f1c"])
+        w.adb.add_transaction(txA)
+        w.adb.add_transaction(txB)
+        addr = txB.outputs()[1].address
+        # heights changed by a write that is not done yet are not seen by readers
+        with w.adb._writing_utxo_index():
+            w.adb.add_unverified_or_unconfirmed_tx(txA.txid(), 1325000)
+            w.adb.add_unverified_or_unconfirmed_tx(txB.txid(), 1325000)
+            self.assertEqual((0, 899800, 0), w.adb.get_balance([addr]))
+        self.assertEqual((899800, 0, 0), w.adb.get_balance([addr]))
+        # new blocks do not touch the snapshot, cached balances are recomputed by the next reader
+        snapshot = w.adb._utxo_snapshot
+        with mock.patch.object(w.adb, '_compute_balance', wraps=w.adb._compute_balance) as compute_balance:
+            self.assertEqual((899800, 0, 0), w.adb.get_balance([addr]))
+            self.assertFalse(compute_balance.called)
+            w.db.put('stored_height', w.adb.get_local_height() + 1)
+            self.assertEqual((899800, 0, 0), w.adb.get_balance([addr]))
+            self.assertTrue(compute_balance.called)
+        self.assertIs(snapshot, w.adb._utxo_snapshot)
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_history_status_is_stored(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        addr = w.get_receiving_addresses()[0]
+        self.assertEqual(bitcoin.address_to_scripthash(addr), w.db.get_addr_scripthash(addr))
+        self.assertIsNone(w.db.get_addr_history_status(addr))
+        hist = [("a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625", 1000)]
+        w.adb.receive_history_callback(addr, hist, {})
+        self.assertEqual(history_status(hist), w.db.get_addr_history_status(addr))
+        self.assertEqual([], w.db.list_addrs_without_history_status())
+        # the status of a history stored without one is computed on load
+        data = json.loads(w.db.dump())
+        del data['addr_history_status']
+        db = type(w.db)(json.dumps(data), manual_upgrades=False)
+        self.assertEqual(sorted(w.get_addresses()), sorted(db.list_addrs_without_history_status()))
+        w = wallet.Wallet(db, None, config=self.config)
+        self.assertEqual([], w.db.list_addrs_without_history_status())
+        self.assertEqual(history_status(hist), w.db.get_addr_history_status(addr))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_history_is_updated_incrementally(self, mock_save_db):
+        w = restore_wallet_from_text("small rapid pattern language comic denial donate extend tide fever burden barrel",
+                                     path='if_this_exists_mocking_failed_648151893',
+                                     gap_limit=5,
+                                     config=self.config)['wallet']  # type: Abstract_Wallet
+        domain = w.get_addresses()
+
+        def history(**kwargs):
+            return [(item.txid, item.delta, item.balance) for item in w.adb.get_history(domain, **kwargs)]
+
+        def history_from_scratch():
+            w.adb._history_indexes.clear()
+            return history()
+
+        txA = Transaction(self.transactions["a3849040f82705151ba12a4389310b58a17b78025d81116a3338595bdefa1625"])
+        txB = Transaction(self.transactions["0e2182ead6660790290371516cb0b80afa8baebd30dad42b5e58a24ceea17f1c"])
+        w.adb.add_transaction(txB)
+        self.assertEqual([(txB.txid(), 899800, 899800)], history())
+        w.adb.add_transaction(txA)
+        w.adb.add_verified_tx(txA.txid(), TxMinedInfo(height=1000, timestamp=1600000000, txpos=1, header_hash='00' * 32))
+        expected = [(txA.txid(), 1000000, 1000000), (txB.txid(), -100200, 899800)]
+        self.assertEqual(expected, history())
+        self.assertEqual(expected, history_from_scratch())
+        # paged queries
+        self.assertEqual(expected[1:], history(limit=1, newest_first=True))
+        self.assertEqual(expected[:1], history(to_height=1001))
+        self.assertEqual(expected[1:], history(from_height=1001))
+        self.assertEqual([], history(from_height=1001, to_height=2000))
+        # B is mined in a later block, then reorged out
+        w.adb.add_verified_tx(txB.txid(), TxMinedInfo(height=1001, timestamp=1600000001, txpos=1, header_hash='00' * 32))
+        self.assertEqual(expected[1:], history(from_height=1001, to_height=2000))
+        w.adb.receive_history_callback(w.get_addresses()[0], [], {})
+        self.assertEqual(history_from_scratch(), history())
+        w.adb.remove_transaction(txB.txid())
+        self.assertEqual(expected[:1], history())
+
 
 class TestImportedWallet(TestCaseForTestnet):
     transactions = {
@@ -31,7 +31,10 @@ import struct
 import traceback
 import sys
 import io
+import os
 import base64
+import concurrent.futures
+import threading
 from typing import (Sequence, Union, NamedTuple, Tuple, Optional, Iterable,
                     Callable, List, Dict, Set, TYPE_CHECKING)
 from collections import defaultdict
@@ -42,11 +45,11 @@ import copy
 
 from . import ecc, bitcoin, constants, segwit_addr, bip32
 from .bip32 import BIP32Node
-from .util import profiler, to_bytes, bh2u, bfh, chunks, is_hex_str, parse_max_spend
+from .util import profiler, to_bytes, bh2u, bfh, chunks, parse_max_spend
 from .bitcoin import (TYPE_ADDRESS, TYPE_SCRIPT, hash_160,
                       hash160_to_p2sh, hash160_to_p2pkh, hash_to_segwit_addr,
-                      var_int, TOTAL_COIN_SUPPLY_LIMIT_IN_BTC, COIN,
-                      int_to_hex, push_script, b58_address_to_hash160,
+                      var_int_bytes, TOTAL_COIN_SUPPLY_LIMIT_IN_BTC, COIN,
+                      int_to_bytes, push_script, b58_address_to_hash160,
                       opcodes, add_number_to_script, base_decode, is_segwit_script_type,
                       base_encode, construct_witness, construct_script)
 from .crypto import sha256d
@@ -59,6 +62,20 @@ if TYPE_CHECKING:
 _logger = get_logger(__name__)
 DEBUG_PSBT_PARSING = False
 
+# Txs that need at least this many signatures are signed in a thread pool.
+# libsecp256k1 is called through ctypes, which releases the GIL.
+MIN_SIGS_FOR_PARALLEL_SIGNING = 16
+# persistent pool of signing threads, created on first use, see _get_signing_executor
+_signing_executor = None  # type: Optional[concurrent.futures.Executor]
+_signing_executor_lock = threading.Lock()
+
+# little-endian fixed-width integers, as used in the network serialization
+_UINT16 = struct.Struct('<H')
+_INT32 = struct.Struct('<i')
+_UINT32 = struct.Struct('<I')
+_INT64 = struct.Struct('<q')
+_UINT64 = struct.Struct('<Q')
+
 
 class SerializationError(Exception):
     """ Thrown when there's a problem deserializing or serializing """
@@ -104,6 +121,9 @@ class Sighash(IntEnum):
 
 
 class TxOutput:
+    # there can be millions of these, see e.g. AddressSynchronizer.get_addr_outputs,
+    # so they do not get a __dict__
+    __slots__ = ('scriptpubkey', 'value')
     scriptpubkey: bytes
     value: Union[int, str]
 
@@ -119,16 +139,16 @@ class TxOutput:
                    value=value)
 
     def serialize_to_network(self) -> bytes:
-        buf = int.to_bytes(self.value, 8, byteorder="little", signed=False)
         script = self.scriptpubkey
-        buf += bfh(var_int(len(script.hex()) // 2))
-        buf += script
-        return buf
+        return b''.join((
+            int.to_bytes(self.value, 8, byteorder="little", signed=False),
+            var_int_bytes(len(script)),
+            script,
+        ))
 
     @classmethod
     def from_network_bytes(cls, raw: bytes) -> 'TxOutput':
-        vds = BCDataStream()
-        vds.write(raw)
+        vds = BytesReader(raw)
         txout = parse_output(vds)
         if vds.can_read_more():
             raise SerializationError('extra junk at the end of TxOutput bytes')
@@ -183,6 +203,54 @@ class BIP143SharedTxDigestFields(NamedTuple):
     hashOutputs: str
 
 
+class SighashCache:
+    """Serialized parts of a tx that are shared by the sighash preimages of all its inputs.
+    Using the same cache for all inputs makes building their preimages linear
+    in the number of inputs, both for legacy and for BIP143 sighashes.
+    note: the cache becomes stale if the tx is modified.
+    """
+
+    def __init__(self, tx: 'Transaction'):
+        inputs = tx.inputs()
+        self._outpoints = [txin.prevout.serialize_to_network() for txin in inputs]
+        self._nsequences = [_UINT32.pack(txin.nsequence) for txin in inputs]
+        self._outputs = [o.serialize_to_network() for o in tx.outputs()]
+        self._bip143_shared_txdigest_fields = None  # type: Optional[BIP143SharedTxDigestFields]
+        # legacy: all inputs with empty scripts, and the position of the script of each input
+        self._legacy_txins = None  # type: Optional[bytes]
+        self._legacy_script_positions = None  # type: Optional[List[int]]
+        self._legacy_txouts = None  # type: Optional[bytes]
+
+    def get_bip143_shared_txdigest_fields(self) -> BIP143SharedTxDigestFields:
+        if self._bip143_shared_txdigest_fields is None:
+            self._bip143_shared_txdigest_fields = BIP143SharedTxDigestFields(
+                hashPrevouts=sha256d(b''.join(self._outpoints)).hex(),
+                hashSequence=sha256d(b''.join(self._nsequences)).hex(),
+                hashOutputs=sha256d(b''.join(self._outputs)).hex())
+        return self._bip143_shared_txdigest_fields
+
+    def get_legacy_txins_and_txouts(self, txin_index: int, script_code: bytes) -> bytes:
+        """Returns the inputs and outputs of the legacy preimage for txin_index:
+        all inputs have empty scripts, except txin_index which has script_code.
+        """
+        if self._legacy_txins is None:
+            parts = [var_int_bytes(len(self._outpoints))]
+            positions = []
+            pos = len(parts[0])
+            for outpoint, nsequence in zip(self._outpoints, self._nsequences):
+                positions.append(pos + len(outpoint))
+                parts.extend((outpoint, b'\x00', nsequence))
+                pos += len(outpoint) + 1 + len(nsequence)
+            self._legacy_txins = b''.join(parts)
+            self._legacy_script_positions = positions
+            self._legacy_txouts = var_int_bytes(len(self._outputs)) + b''.join(self._outputs)
+        txins = self._legacy_txins
+        pos = self._legacy_script_positions[txin_index]
+        # splice script_code in place of the empty script, i.e. of its length byte
+        return b''.join((txins[:pos], var_int_bytes(len(script_code)), script_code,
+                         txins[pos + 1:], self._legacy_txouts))
+
+
 class TxOutpoint(NamedTuple):
     txid: bytes  # endianness same as hex string displayed; reverse of tx serialization order
     out_idx: int
@@ -207,13 +275,14 @@ class TxOutpoint(NamedTuple):
         return [self.txid.hex(), self.out_idx]
 
     def serialize_to_network(self) -> bytes:
-        return self.txid[::-1] + bfh(int_to_hex(self.out_idx, 4))
+        return self.txid[::-1] + _UINT32.pack(self.out_idx)
 
     def is_coinbase(self) -> bool:
         return self.txid == bytes(32)
 
 
 class TxInput:
+    __slots__ = ('prevout', 'script_sig', 'nsequence', 'witness', '_is_coinbase_output')
     prevout: TxOutpoint
     script_sig: Optional[bytes]
     nsequence: int
@@ -261,8 +330,7 @@ class TxInput:
     def witness_elements(self)-> Sequence[bytes]:
         if not self.witness:
             return []
-        vds = BCDataStream()
-        vds.write(self.witness)
+        vds = BytesReader(self.witness)
         n = vds.read_compact_size()
         return list(vds.read_bytes(vds.read_compact_size()) for i in range(n))
 
@@ -394,6 +462,64 @@ class BCDataStream(object):
         self.write(s)
 
 
+class BytesReader:
+    """Reads Bitcoin-serialized data from an immutable buffer.
+    Unlike BCDataStream, the buffer is not copied; fields are sliced out of it
+    and numbers are unpacked in place.
+    """
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        self._buf = bytes(data)  # no-op for bytes
+        self.cursor = 0
+
+    def read_bytes(self, length: int) -> bytes:
+        end = self.cursor + length
+        if end > len(self._buf):
+            raise SerializationError('attempt to read past end of buffer')
+        result = self._buf[self.cursor:end]
+        self.cursor = end
+        return result
+
+    def skip_bytes(self, length: int) -> None:
+        end = self.cursor + length
+        if end > len(self._buf):
+            raise SerializationError('attempt to read past end of buffer')
+        self.cursor = end
+
+    def get_bytes_since(self, start: int) -> bytes:
+        """Returns the bytes read since the cursor was at start."""
+        return self._buf[start:self.cursor]
+
+    def can_read_more(self) -> bool:
+        return self.cursor < len(self._buf)
+
+    def read_int32(self) -> int: return self._read_num(_INT32)
+    def read_uint32(self) -> int: return self._read_num(_UINT32)
+    def read_int64(self) -> int: return self._read_num(_INT64)
+
+    def read_compact_size(self) -> int:
+        try:
+            size = self._buf[self.cursor]
+        except IndexError as e:
+            raise SerializationError("attempt to read past end of buffer") from e
+        self.cursor += 1
+        if size == 253:
+            size = self._read_num(_UINT16)
+        elif size == 254:
+            size = self._read_num(_UINT32)
+        elif size == 255:
+            size = self._read_num(_UINT64)
+        return size
+
+    def _read_num(self, fmt: struct.Struct) -> int:
+        try:
+            (i,) = fmt.unpack_from(self._buf, self.cursor)
+        except struct.error as e:
+            raise SerializationError(e) from e
+        self.cursor += fmt.size
+        return i
+
+
 def script_GetOp(_bytes : bytes):
     i = 0
     while i < len(_bytes):
@@ -560,7 +686,7 @@ def get_address_from_output_script(_bytes: bytes, *, net=None) -> Optional[str]:
     return None
 
 
-def parse_input(vds: BCDataStream) -> TxInput:
+def parse_input(vds: BytesReader) -> TxInput:
     prevout_hash = vds.read_bytes(32)[::-1]
     prevout_n = vds.read_uint32()
     prevout = TxOutpoint(txid=prevout_hash, out_idx=prevout_n)
@@ -569,13 +695,16 @@ def parse_input(vds: BCDataStream) -> TxInput:
     return TxInput(prevout=prevout, script_sig=script_sig, nsequence=nsequence)
 
 
-def parse_witness(vds: BCDataStream, txin: TxInput) -> None:
+def parse_witness(vds: BytesReader, txin: TxInput) -> None:
+    # the serialized witness is kept as is
+    start = vds.cursor
     n = vds.read_compact_size()
-    witness_elements = list(vds.read_bytes(vds.read_compact_size()) for i in range(n))
-    txin.witness = bfh(construct_witness(witness_elements))
+    for i in range(n):
+        vds.skip_bytes(vds.read_compact_size())
+    txin.witness = vds.get_bytes_since(start)
 
 
-def parse_output(vds: BCDataStream) -> TxOutput:
+def parse_output(vds: BytesReader) -> TxOutput:
     value = vds.read_int64()
     if value > TOTAL_COIN_SUPPLY_LIMIT_IN_BTC * COIN:
         raise SerializationError('invalid output amount (too large)')
@@ -596,7 +725,7 @@ def multisig_script(public_keys: Sequence[str], m: int) -> str:
 
 
 class Transaction:
-    _cached_network_ser: Optional[str]
+    _cached_network_ser: Optional[bytes]
 
     def __str__(self):
         return self.serialize()
@@ -605,10 +734,15 @@ class Transaction:
         if raw is None:
             self._cached_network_ser = None
         elif isinstance(raw, str):
-            self._cached_network_ser = raw.strip() if raw else None
-            assert is_hex_str(self._cached_network_ser)
+            raw = raw.strip()
+            try:
+                self._cached_network_ser = bytes.fromhex(raw)
+            except ValueError:
+                self._cached_network_ser = None
+            # forbid empty input and whitespaces
+            assert self._cached_network_ser and len(raw) == 2 * len(self._cached_network_ser)
         elif isinstance(raw, (bytes, bytearray)):
-            self._cached_network_ser = bh2u(raw)
+            self._cached_network_ser = bytes(raw)
         else:
             raise Exception(f"cannot initialize transaction from {raw}")
         self._inputs = None  # type: List[TxInput]
@@ -617,6 +751,8 @@ class Transaction:
         self._version = 2
 
         self._cached_txid = None  # type: Optional[str]
+        # (start, end) of inputs and outputs in _cached_network_ser, set by deserialize
+        self._raw_legacy_ser_span = None  # type: Optional[Tuple[int, int]]
 
     @property
     def locktime(self):
@@ -664,9 +800,8 @@ class Transaction:
         if self._inputs is not None:
             return
 
-        raw_bytes = bfh(self._cached_network_ser)
-        vds = BCDataStream()
-        vds.write(raw_bytes)
+        raw_bytes = self._cached_network_ser
+        vds = BytesReader(raw_bytes)
         self._version = vds.read_int32()
         n_vin = vds.read_compact_size()
         is_segwit = (n_vin == 0)
@@ -674,6 +809,7 @@ class Transaction:
             marker = vds.read_bytes(1)
             if marker != b'\x01':
                 raise ValueError('invalid txn marker byte: {}'.format(marker))
+            legacy_start = vds.cursor
             n_vin = vds.read_compact_size()
         if n_vin < 1:
             raise SerializationError('tx needs to have at least 1 input')
@@ -683,12 +819,17 @@ class Transaction:
             raise SerializationError('tx needs to have at least 1 output')
         self._outputs = [parse_output(vds) for i in range(n_vout)]
         if is_segwit:
+            legacy_end = vds.cursor
             for txin in txins:
                 parse_witness(vds, txin)
         self._inputs = txins  # only expose field after witness is parsed, for sanity
         self._locktime = vds.read_uint32()
         if vds.can_read_more():
             raise SerializationError('extra junk at the end')
+        if is_segwit:
+            self._raw_legacy_ser_span = (legacy_start, legacy_end)
+        else:
+            self._raw_legacy_ser_span = (4, len(raw_bytes) - 4)
 
     @classmethod
     def get_siglist(self, txin: 'PartialTxInput', *, estimate_size=False):
@@ -831,23 +972,21 @@ class Transaction:
 
     @classmethod
     def serialize_input(self, txin: TxInput, script: str) -> str:
-        # Prev hash and index
-        s = txin.prevout.serialize_to_network().hex()
-        # Script length, script, sequence
-        s += var_int(len(script)//2)
-        s += script
-        s += int_to_hex(txin.nsequence, 4)
-        return s
+        return self._serialize_input_bytes(txin, bfh(script)).hex()
+
+    @classmethod
+    def _serialize_input_bytes(cls, txin: TxInput, script: bytes) -> bytes:
+        return b''.join((
+            # Prev hash and index
+            txin.prevout.serialize_to_network(),
+            # Script length, script, sequence
+            var_int_bytes(len(script)),
+            script,
+            _UINT32.pack(txin.nsequence),
+        ))
 
     def _calc_bip143_shared_txdigest_fields(self) -> BIP143SharedTxDigestFields:
-        inputs = self.inputs()
-        outputs = self.outputs()
-        hashPrevouts = bh2u(sha256d(b''.join(txin.prevout.serialize_to_network() for txin in inputs)))
-        hashSequence = bh2u(sha256d(bfh(''.join(int_to_hex(txin.nsequence, 4) for txin in inputs))))
-        hashOutputs = bh2u(sha256d(bfh(''.join(o.serialize_to_network().hex() for o in outputs))))
-        return BIP143SharedTxDigestFields(hashPrevouts=hashPrevouts,
-                                          hashSequence=hashSequence,
-                                          hashOutputs=hashOutputs)
+        return SighashCache(self).get_bip143_shared_txdigest_fields()
 
     def is_segwit(self, *, guess_for_address=False):
         return any(txin.is_segwit(guess_for_address=guess_for_address)
@@ -856,14 +995,30 @@ class Transaction:
     def invalidate_ser_cache(self):
         self._cached_network_ser = None
         self._cached_txid = None
+        self._raw_legacy_ser_span = None
+
+    def _get_legacy_ser_from_raw(self) -> Optional[bytes]:
+        """Returns the pre-segwit serialization, sliced out of the raw tx we were
+        deserialized from, if we still have it.
+        """
+        if self._raw_legacy_ser_span is None or not self._cached_network_ser:
+            return None
+        raw = self._cached_network_ser
+        start, end = self._raw_legacy_ser_span
+        if start == 4 and end == len(raw) - 4:
+            return raw
+        return b''.join((raw[:4], raw[start:end], raw[-4:]))
 
     def serialize(self) -> str:
-        if not self._cached_network_ser:
-            self._cached_network_ser = self.serialize_to_network(estimate_size=False, include_sigs=True)
-        return self._cached_network_ser
+        return self._get_network_ser().hex()
 
     def serialize_as_bytes(self) -> bytes:
-        return bfh(self.serialize())
+        return self._get_network_ser()
+
+    def _get_network_ser(self) -> bytes:
+        if not self._cached_network_ser:
+            self._cached_network_ser = self._serialize_to_network_bytes(estimate_size=False, include_sigs=True)
+        return self._cached_network_ser
 
     def serialize_to_network(self, *, estimate_size=False, include_sigs=True, force_legacy=False) -> str:
         """Serialize the transaction as used on the Bitcoin network, into hex.
@@ -871,30 +1026,38 @@ class Transaction:
         `force_legacy` signals to use the pre-segwit format
         note: (not include_sigs) implies force_legacy
         """
+        return self._serialize_to_network_bytes(
+            estimate_size=estimate_size, include_sigs=include_sigs, force_legacy=force_legacy).hex()
+
+    def _serialize_to_network_bytes(self, *, estimate_size=False, include_sigs=True, force_legacy=False) -> bytes:
+        """Same as serialize_to_network, but returns bytes."""
         self.deserialize()
-        nVersion = int_to_hex(self.version, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
         inputs = self.inputs()
         outputs = self.outputs()
-
-        def create_script_sig(txin: TxInput) -> str:
-            if include_sigs:
-                return self.input_script(txin, estimate_size=estimate_size)
-            return ''
-        txins = var_int(len(inputs)) + ''.join(self.serialize_input(txin, create_script_sig(txin))
-                                               for txin in inputs)
-        txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
-
+        parts = [int_to_bytes(self.version, 4), var_int_bytes(len(inputs))]
         use_segwit_ser_for_estimate_size = estimate_size and self.is_segwit(guess_for_address=True)
         use_segwit_ser_for_actual_use = not estimate_size and self.is_segwit()
         use_segwit_ser = use_segwit_ser_for_estimate_size or use_segwit_ser_for_actual_use
-        if include_sigs and not force_legacy and use_segwit_ser:
-            marker = '00'
-            flag = '01'
-            witness = ''.join(self.serialize_witness(x, estimate_size=estimate_size) for x in inputs)
-            return nVersion + marker + flag + txins + txouts + witness + nLocktime
-        else:
-            return nVersion + txins + txouts + nLocktime
+        use_segwit_ser = include_sigs and not force_legacy and use_segwit_ser
+        if use_segwit_ser:
+            parts.insert(1, b'\x00\x01')  # marker, flag
+
+        for txin in inputs:
+            if include_sigs:
+                script_sig = bfh(self.input_script(txin, estimate_size=estimate_size))
+            else:
+                script_sig = b''
+            parts.append(self._serialize_input_bytes(txin, script_sig))
+        parts.append(var_int_bytes(len(outputs)))
+        parts.extend(o.serialize_to_network() for o in outputs)
+        if use_segwit_ser:
+            for txin in inputs:
+                if txin.witness is not None:
+                    parts.append(txin.witness)
+                else:
+                    parts.append(bfh(self.serialize_witness(txin, estimate_size=estimate_size)))
+        parts.append(int_to_bytes(self.locktime, 4))
+        return b''.join(parts)
 
     def to_qr_data(self) -> str:
         """Returns tx as data to be put into a QR code. No side-effects."""
@@ -908,15 +1071,19 @@ class Transaction:
     def txid(self) -> Optional[str]:
         if self._cached_txid is None:
             self.deserialize()
+            ser = self._get_legacy_ser_from_raw()
+            if ser is not None:
+                self._cached_txid = sha256d(ser)[::-1].hex()
+                return self._cached_txid
             all_segwit = all(txin.is_segwit() for txin in self.inputs())
             if not all_segwit and not self.is_complete():
                 return None
             try:
-                ser = self.serialize_to_network(force_legacy=True)
+                ser = self._serialize_to_network_bytes(force_legacy=True)
             except UnknownTxinType:
                 # we might not know how to construct scriptSig for some scripts
                 return None
-            self._cached_txid = bh2u(sha256d(bfh(ser))[::-1])
+            self._cached_txid = sha256d(ser)[::-1].hex()
         return self._cached_txid
 
     def wtxid(self) -> Optional[str]:
@@ -924,11 +1091,11 @@ class Transaction:
         if not self.is_complete():
             return None
         try:
-            ser = self.serialize_to_network()
+            ser = self._get_network_ser()
         except UnknownTxinType:
             # we might not know how to construct scriptSig/witness for some scripts
             return None
-        return bh2u(sha256d(bfh(ser))[::-1])
+        return sha256d(ser)[::-1].hex()
 
     def add_info_from_wallet(self, wallet: 'Abstract_Wallet', **kwargs) -> None:
         return  # no-op
@@ -950,8 +1117,9 @@ class Transaction:
     @classmethod
     def estimated_input_weight(cls, txin, is_segwit_tx):
         '''Return an estimate of serialized input weight in weight units.'''
-        script = cls.input_script(txin, estimate_size=True)
-        input_size = len(cls.serialize_input(txin, script)) // 2
+        script_len = len(cls.input_script(txin, estimate_size=True)) // 2
+        # outpoint, script, sequence
+        input_size = 36 + len(var_int_bytes(script_len)) + script_len + 4
 
         if txin.is_segwit(guess_for_address=True):
             witness_size = len(cls.serialize_witness(txin, estimate_size=True)) // 2
@@ -971,7 +1139,7 @@ class Transaction:
         """Return an estimate of serialized output size in bytes."""
         # 8 byte value + varint script len + script
         script_len = len(script) // 2
-        var_int_len = len(var_int(script_len)) // 2
+        var_int_len = len(var_int_bytes(script_len))
         return 8 + var_int_len + script_len
 
     @classmethod
@@ -986,9 +1154,9 @@ class Transaction:
     def estimated_total_size(self):
         """Return an estimated total transaction size in bytes."""
         if not self.is_complete() or self._cached_network_ser is None:
-            return len(self.serialize_to_network(estimate_size=True)) // 2
+            return len(self._serialize_to_network_bytes(estimate_size=True))
         else:
-            return len(self._cached_network_ser) // 2  # ASCII hex string
+            return len(self._cached_network_ser)
 
     def estimated_witness_size(self):
         """Return an estimate of witness size in bytes."""
@@ -996,8 +1164,12 @@ class Transaction:
         if not self.is_segwit(guess_for_address=estimate):
             return 0
         inputs = self.inputs()
-        witness = ''.join(self.serialize_witness(x, estimate_size=estimate) for x in inputs)
-        witness_size = len(witness) // 2 + 2  # include marker and flag
+        witness_size = 2  # include marker and flag
+        for txin in inputs:
+            if txin.witness is not None:
+                witness_size += len(txin.witness)
+            else:
+                witness_size += len(self.serialize_witness(txin, estimate_size=estimate)) // 2
         return witness_size
 
     def estimated_base_size(self):
@@ -1147,6 +1319,7 @@ def deser_compact_size(f) -> Optional[int]:
 
 
 class PSBTSection:
+    __slots__ = ()
 
     def _populate_psbt_fields_from_fd(self, fd=None):
         if not fd: return
@@ -1179,9 +1352,9 @@ class PSBTSection:
     def create_psbt_writer(cls, fd):
         def wr(key_type: int, val: bytes, key: bytes = b''):
             full_key = cls.get_fullkey_from_keytype_and_key(key_type, key)
-            fd.write(bytes.fromhex(var_int(len(full_key))))  # key_size
+            fd.write(var_int_bytes(len(full_key)))  # key_size
             fd.write(full_key)  # key
-            fd.write(bytes.fromhex(var_int(len(val))))  # val_size
+            fd.write(var_int_bytes(len(val)))  # val_size
             fd.write(val)  # val
         return wr
 
@@ -1195,7 +1368,7 @@ class PSBTSection:
 
     @classmethod
     def get_fullkey_from_keytype_and_key(cls, key_type: int, key: bytes) -> bytes:
-        key_type_bytes = bytes.fromhex(var_int(key_type))
+        key_type_bytes = var_int_bytes(key_type)
         return key_type_bytes + key
 
     def _serialize_psbt_section(self, fd):
@@ -1211,6 +1384,11 @@ class PSBTSection:
 
 
 class PartialTxInput(TxInput, PSBTSection):
+    __slots__ = ('_utxo', '_witness_utxo', 'part_sigs', 'sighash', 'bip32_paths', 'redeem_script',
+                 'witness_script', '_unknown', 'script_type', 'num_sig', 'pubkeys',
+                 '_trusted_value_sats', '_trusted_address', 'block_height', 'spent_height',
+                 'spent_txid', '_is_p2sh_segwit', '_is_native_segwit', 'witness_sizehint')
+
     def __init__(self, *args, **kwargs):
         TxInput.__init__(self, *args, **kwargs)
         self._utxo = None  # type: Optional[Transaction]
@@ -1577,6 +1755,9 @@ class PartialTxInput(TxInput, PSBTSection):
 
 
 class PartialTxOutput(TxOutput, PSBTSection):
+    __slots__ = ('redeem_script', 'witness_script', 'bip32_paths', '_unknown', 'script_type',
+                 'num_sig', 'pubkeys', 'is_mine', 'is_change')
+
     def __init__(self, *args, **kwargs):
         TxOutput.__init__(self, *args, **kwargs)
         self.redeem_script = None  # type: Optional[bytes]
@@ -1659,6 +1840,18 @@ class PartialTxOutput(TxOutput, PSBTSection):
         self._unknown.update(other_txout._unknown)
 
 
+def _get_signing_executor() -> Optional[concurrent.futures.Executor]:
+    global _signing_executor
+    num_workers = os.cpu_count() or 1
+    if num_workers <= 1:
+        return None
+    with _signing_executor_lock:
+        if _signing_executor is None:
+            _signing_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=num_workers, thread_name_prefix='tx_signing')
+        return _signing_executor
+
+
 class PartialTransaction(Transaction):
 
     def __init__(self):
@@ -1908,71 +2101,122 @@ class PartialTransaction(Transaction):
             return None
 
     def serialize_preimage(self, txin_index: int, *,
-                           bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None) -> str:
-        nVersion = int_to_hex(self.version, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
+                           bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None,
+                           sighash_cache: SighashCache = None) -> str:
+        return self._serialize_preimage_bytes(
+            txin_index, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+            sighash_cache=sighash_cache).hex()
+
+    def _serialize_preimage_bytes(self, txin_index: int, *,
+                                  bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None,
+                                  sighash_cache: SighashCache = None) -> bytes:
+        nVersion = int_to_bytes(self.version, 4)
+        nLocktime = int_to_bytes(self.locktime, 4)
         inputs = self.inputs()
         outputs = self.outputs()
         txin = inputs[txin_index]
         sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
         if not Sighash.is_valid(sighash):
             raise Exception("SIGHASH_FLAG not supported!")
-        nHashType = int_to_hex(sighash, 4)
-        preimage_script = self.get_preimage_script(txin)
+        nHashType = int_to_bytes(sighash, 4)
+        preimage_script = bfh(self.get_preimage_script(txin))
         if txin.is_segwit():
             if bip143_shared_txdigest_fields is None:
-                bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
+                if sighash_cache is None:
+                    sighash_cache = SighashCache(self)
+                bip143_shared_txdigest_fields = sighash_cache.get_bip143_shared_txdigest_fields()
             if not (sighash & Sighash.ANYONECANPAY):
-                hashPrevouts = bip143_shared_txdigest_fields.hashPrevouts
+                hashPrevouts = bfh(bip143_shared_txdigest_fields.hashPrevouts)
             else:
-                hashPrevouts = '00' * 32
+                hashPrevouts = bytes(32)
             if not (sighash & Sighash.ANYONECANPAY) and (sighash & 0x1f) != Sighash.SINGLE and (sighash & 0x1f) != Sighash.NONE:
-                hashSequence = bip143_shared_txdigest_fields.hashSequence
+                hashSequence = bfh(bip143_shared_txdigest_fields.hashSequence)
             else:
-                hashSequence = '00' * 32
+                hashSequence = bytes(32)
             if (sighash & 0x1f) != Sighash.SINGLE and (sighash & 0x1f) != Sighash.NONE:
-                hashOutputs = bip143_shared_txdigest_fields.hashOutputs
+                hashOutputs = bfh(bip143_shared_txdigest_fields.hashOutputs)
             elif (sighash & 0x1f) == Sighash.SINGLE and txin_index < len(outputs):
-                hashOutputs = bh2u(sha256d(outputs[txin_index].serialize_to_network()))
+                hashOutputs = sha256d(outputs[txin_index].serialize_to_network())
             else:
-                hashOutputs = '00' * 32
-            outpoint = txin.prevout.serialize_to_network().hex()
-            scriptCode = var_int(len(preimage_script) // 2) + preimage_script
-            amount = int_to_hex(txin.value_sats(), 8)
-            nSequence = int_to_hex(txin.nsequence, 4)
-            preimage = nVersion + hashPrevouts + hashSequence + outpoint + scriptCode + amount + nSequence + hashOutputs + nLocktime + nHashType
+                hashOutputs = bytes(32)
+            outpoint = txin.prevout.serialize_to_network()
+            scriptCode = var_int_bytes(len(preimage_script)) + preimage_script
+            amount = int_to_bytes(txin.value_sats(), 8)
+            nSequence = int_to_bytes(txin.nsequence, 4)
+            parts = [nVersion, hashPrevouts, hashSequence, outpoint, scriptCode, amount, nSequence, hashOutputs]
         else:
-            txins = var_int(len(inputs)) + ''.join(self.serialize_input(txin, preimage_script if txin_index==k else '')
-                                                   for k, txin in enumerate(inputs))
-            txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
-            preimage = nVersion + txins + txouts + nLocktime + nHashType
-        return preimage
+            if sighash_cache is None:
+                sighash_cache = SighashCache(self)
+            parts = [nVersion, sighash_cache.get_legacy_txins_and_txouts(txin_index, preimage_script)]
+        parts.append(nLocktime)
+        parts.append(nHashType)
+        return b''.join(parts)
 
     def sign(self, keypairs) -> None:
         # keypairs:  pubkey_hex -> (secret_bytes, is_compressed)
-        bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
+        # All sighashes are computed first, then signed in a batch, possibly in parallel.
+        sighash_cache = SighashCache(self)
+        privkeys = {}  # type: Dict[str, ecc.ECPrivkey]  # pubkey_hex -> privkey
+        to_sign = []  # type: List[Tuple[int, str, ecc.ECPrivkey, bytes]]  # (txin_idx, pubkey_hex, privkey, pre_hash)
         for i, txin in enumerate(self.inputs()):
-            pubkeys = [pk.hex() for pk in txin.pubkeys]
+            pubkeys = self._get_pubkeys_to_sign_txin_with(txin, keypairs)
+            if not pubkeys:
+                continue
+            txin.validate_data(for_signing=True)
+            pre_hash = sha256d(self._serialize_preimage_bytes(i, sighash_cache=sighash_cache))
             for pubkey in pubkeys:
-                if txin.is_complete():
-                    break
-                if pubkey not in keypairs:
-                    continue
-                _logger.info(f"adding signature for {pubkey}")
-                sec, compressed = keypairs[pubkey]
-                sig = self.sign_txin(i, sec, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)
-                self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
+                if pubkey not in privkeys:
+                    sec, compressed = keypairs[pubkey]
+                    privkeys[pubkey] = ecc.ECPrivkey(sec)
+                to_sign.append((i, pubkey, privkeys[pubkey], pre_hash))
+
+        def sign_hash(item) -> bytes:
+            i, pubkey, privkey, pre_hash = item
+            return privkey.sign_transaction(pre_hash)
+        executor = _get_signing_executor() if len(to_sign) >= MIN_SIGS_FOR_PARALLEL_SIGNING else None
+        # note: executor.map returns the results in order
+        sigs = executor.map(sign_hash, to_sign) if executor else map(sign_hash, to_sign)
+        for (i, pubkey, privkey, pre_hash), sig in zip(to_sign, sigs):
+            _logger.info(f"adding signature for {pubkey}")
+            txin = self.inputs()[i]
+            sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
+            sig = sig.hex() + sighash.to_bytes(length=1, byteorder="big").hex()
+            self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
 
         _logger.debug(f"is_complete {self.is_complete()}")
         self.invalidate_ser_cache()
 
-    def sign_txin(self, txin_index, privkey_bytes, *, bip143_shared_txdigest_fields=None) -> str:
+    @classmethod
+    def _get_pubkeys_to_sign_txin_with(cls, txin: PartialTxInput, keypairs) -> List[str]:
+        """Returns the pubkeys (hex) in keypairs that txin still needs signatures from,
+        stopping as soon as these would make txin complete.
+        """
+        pubkeys = []
+        part_sigs = txin.part_sigs
+        # placeholder sigs are added to a copy of part_sigs, to let txin.is_complete() count them
+        txin.part_sigs = dict(part_sigs)
+        try:
+            for pk in txin.pubkeys:
+                if txin.is_complete():
+                    break
+                pubkey = pk.hex()
+                if pubkey not in keypairs:
+                    continue
+                pubkeys.append(pubkey)
+                txin.part_sigs[pk] = b''
+        finally:
+            txin.part_sigs = part_sigs
+        return pubkeys
+
+    def sign_txin(self, txin_index, privkey_bytes, *, bip143_shared_txdigest_fields=None,
+                  sighash_cache: SighashCache = None) -> str:
         txin = self.inputs()[txin_index]
         txin.validate_data(for_signing=True)
         sighash = txin.sighash if txin.sighash is not None else Sighash.ALL
         sighash_type = sighash.to_bytes(length=1, byteorder="big").hex()
-        pre_hash = sha256d(bfh(self.serialize_preimage(txin_index,
-                                                       bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)))
+        pre_hash = sha256d(self._serialize_preimage_bytes(txin_index,
+                                                          bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+                                                          sighash_cache=sighash_cache))
         privkey = ecc.ECPrivkey(privkey_bytes)
         sig = privkey.sign_transaction(pre_hash)
         sig = bh2u(sig) + sighash_type
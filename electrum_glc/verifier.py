@@ -22,9 +22,10 @@
 # SOFTWARE.
 
 import asyncio
-from typing import Sequence, Optional, TYPE_CHECKING
+from typing import Sequence, Optional, TYPE_CHECKING, List, Tuple, Dict
 
 import aiorpcx
+from aiorpcx import run_in_thread
 
 from .util import bh2u, TxMinedInfo, NetworkJobOnDefaultServer
 from .crypto import sha256d
@@ -75,6 +76,8 @@ class SPV(NetworkJobOnDefaultServer):
     async def _request_proofs(self):
         local_height = self.blockchain.height()
         unverified = self.wallet.get_unverified_txs()
+        to_request = []  # type: List[Tuple[str, int]]
+        has_header = {}  # type: Dict[int, bool]  # height -> whether we have the header
 
         for tx_hash, tx_height in unverified.items():
             # do not request merkle branch if we already requested it
@@ -84,58 +87,92 @@ class SPV(NetworkJobOnDefaultServer):
             if not (0 < tx_height <= local_height):
                 continue
             # if it's in the checkpoint region, we still might not have the header
-            header = self.blockchain.read_header(tx_height)
-            if header is None:
-                if tx_height < constants.net.max_checkpoint():
+            if tx_height not in has_header:
+                has_header[tx_height] = self.blockchain.read_header(tx_height) is not None
+                if not has_header[tx_height] and tx_height < constants.net.max_checkpoint():
                     # FIXME these requests are not counted (self._requests_sent += 1)
                     await self.taskgroup.spawn(self.interface.request_chunk(tx_height, None, can_return_early=True))
+            if not has_header[tx_height]:
                 continue
             # request now
             self.logger.info(f'requested merkle {tx_hash}')
             self.requested_merkle.add(tx_hash)
-            await self.taskgroup.spawn(self._request_and_verify_single_proof, tx_hash, tx_height)
+            to_request.append((tx_hash, tx_height))
 
-    async def _request_and_verify_single_proof(self, tx_hash, tx_height):
+        # so that txs of the same block end up in the same batch
+        to_request.sort(key=lambda x: x[1])
+        batch_size = self.interface.get_request_batch_size()
+        for i in range(0, len(to_request), batch_size):
+            await self.taskgroup.spawn(self._request_and_verify_proofs, to_request[i:i+batch_size])
+
+    async def _request_and_verify_proofs(self, txs: Sequence[Tuple[str, int]]):
         try:
-            self._requests_sent += 1
+            self._requests_sent += len(txs)
             async with self._network_request_semaphore:
-                merkle = await self.interface.get_merkle_for_transaction(tx_hash, tx_height)
-        except aiorpcx.jsonrpc.RPCError:
-            self.logger.info(f'tx {tx_hash} not at height {tx_height}')
-            self.wallet.remove_unverified_tx(tx_hash, tx_height)
-            self.requested_merkle.discard(tx_hash)
-            return
+                merkles = await self.interface.get_merkle_for_transactions(txs)
         finally:
-            self._requests_answered += 1
+            self._requests_answered += len(txs)
+        proofs = []
+        for (tx_hash, tx_height), merkle in zip(txs, merkles):
+            if isinstance(merkle, aiorpcx.jsonrpc.RPCError):
+                self.logger.info(f'tx {tx_hash} not at height {tx_height}')
+                self.wallet.remove_unverified_tx(tx_hash, tx_height)
+                self.requested_merkle.discard(tx_hash)
+                continue
+            elif isinstance(merkle, Exception):
+                raise merkle
+            proofs.append((tx_hash, tx_height, merkle))
+        await self._verify_proofs(proofs)
+
+    async def _verify_proofs(self, proofs: Sequence[Tuple[str, int, dict]]):
         # Verify the hash of the server-provided merkle branch to a
         # transaction matches the merkle root of its block
-        if tx_height != merkle.get('block_height'):
-            self.logger.info('requested tx_height {} differs from received tx_height {} for txid {}'
-                             .format(tx_height, merkle.get('block_height'), tx_hash))
-        tx_height = merkle.get('block_height')
-        pos = merkle.get('pos')
-        merkle_branch = merkle.get('merkle')
+        for tx_hash, tx_height, merkle in proofs:
+            if tx_height != merkle.get('block_height'):
+                self.logger.info('requested tx_height {} differs from received tx_height {} for txid {}'
+                                 .format(tx_height, merkle.get('block_height'), tx_hash))
+        # read each header only once.
         # we need to wait if header sync/reorg is still ongoing, hence lock:
         async with self.network.bhi_lock:
-            header = self.network.blockchain().read_header(tx_height)
+            blockchain = self.network.blockchain()
+            headers = {merkle.get('block_height'): None for _, _, merkle in proofs}
+            for height in headers:
+                headers[height] = blockchain.read_header(height)
+        skip_merkle_check = self.network.config.get("skipmerklecheck")
         try:
-            verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height)
+            verified = await run_in_thread(self._check_proofs, proofs, headers, skip_merkle_check)
         except MerkleVerificationFailure as e:
-            if self.network.config.get("skipmerklecheck"):
-                self.logger.info(f"skipping merkle proof check {tx_hash}")
-            else:
-                self.logger.info(repr(e))
-                raise GracefulDisconnect(e) from e
+            self.logger.info(repr(e))
+            raise GracefulDisconnect(e) from e
         # we passed all the tests
-        self.merkle_roots[tx_hash] = header.get('merkle_root')
-        self.requested_merkle.discard(tx_hash)
-        self.logger.info(f"verified {tx_hash}")
-        header_hash = hash_header(header)
-        tx_info = TxMinedInfo(height=tx_height,
-                              timestamp=header.get('timestamp'),
-                              txpos=pos,
-                              header_hash=header_hash)
-        self.wallet.add_verified_tx(tx_hash, tx_info)
+        for tx_hash, tx_info in verified:
+            self.merkle_roots[tx_hash] = headers[tx_info.height].get('merkle_root')
+            self.requested_merkle.discard(tx_hash)
+            self.logger.info(f"verified {tx_hash}")
+        self.wallet.add_verified_txs(verified)
+
+    def _check_proofs(self, proofs: Sequence[Tuple[str, int, dict]], headers: Dict[int, Optional[dict]],
+                      skip_merkle_check: bool) -> List[Tuple[str, TxMinedInfo]]:
+        verified = []
+        header_hashes = {}  # type: Dict[int, str]
+        for tx_hash, _, merkle in proofs:
+            tx_height = merkle.get('block_height')
+            pos = merkle.get('pos')
+            header = headers[tx_height]
+            try:
+                verify_tx_is_in_block(tx_hash, merkle.get('merkle'), pos, header, tx_height)
+            except MerkleVerificationFailure:
+                if not skip_merkle_check:
+                    raise
+                self.logger.info(f"skipping merkle proof check {tx_hash}")
+            if tx_height not in header_hashes:
+                header_hashes[tx_height] = hash_header(header)
+            tx_info = TxMinedInfo(height=tx_height,
+                                  timestamp=header.get('timestamp'),
+                                  txpos=pos,
+                                  header_hash=header_hashes[tx_height])
+            verified.append((tx_hash, tx_info))
+        return verified
 
     @classmethod
     def hash_merkle_root(cls, merkle_branch: Sequence[str], tx_hash: str, leaf_pos_in_tree: int):
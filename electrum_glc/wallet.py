@@ -67,7 +67,7 @@ from .keystore import (load_keystore, Hardware_KeyStore, KeyStore, KeyStoreWithM
                        AddressIndexGeneric, CannotDerivePubkey)
 from .util import multisig_type
 from .storage import StorageEncryptionVersion, WalletStorage
-from .wallet_db import WalletDB
+from .wallet_db import WalletDB, create_wallet_db
 from . import transaction, bitcoin, coinchooser, paymentrequest, ecc, bip32
 from .transaction import (Transaction, TxInput, UnknownTxinType, TxOutput,
                           PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint)
@@ -99,6 +99,9 @@ TX_STATUS = [
     _('Local'),
 ]
 
+HISTORY_BATCH_SIZE = 100  # number of history items read at once by get_onchain_history
+ADDRESS_DISCOVERY_BLOCKS_IN_FLIGHT = 4  # see Deterministic_Wallet.discover_addresses
+
 
 class BumpFeeStrategy(enum.Enum):
     COINCHOOSER = enum.auto()
@@ -366,6 +369,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         try:
             async with self.taskgroup as group:
                 await group.spawn(asyncio.Event().wait)  # run forever (until cancel)
+                if self.db.get('needs_address_discovery'):
+                    await group.spawn(self.do_address_discovery())
                 await group.spawn(self.do_synchronize_loop())
         except Exception as e:
             self.logger.exception("taskgroup died.")
@@ -385,9 +390,27 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             #       have history that are mined and SPV-verified.
             await run_in_thread(self.synchronize)
 
-    def save_db(self):
+    async def do_address_discovery(self):
+        """Generates the addresses of a freshly restored wallet upfront, instead
+        of waiting for the gap limit to roll forward one address at a time.
+        """
+        try:
+            num_new_addrs = await self.discover_addresses()
+        except NetworkException as e:
+            self.logger.info(f"address discovery failed: {e!r}")
+        except Exception:
+            # must not kill the taskgroup of the wallet
+            self.logger.exception("address discovery failed")
+        else:
+            self.logger.info(f"address discovery done: {num_new_addrs} new addresses")
+            self.db.put('needs_address_discovery', None)
+            return
+        # the gap limit still rolls forward, one address at a time
+        await run_in_thread(self.synchronize)
+
+    def save_db(self, *, compact: bool = False):
         if self.storage:
-            self.db.write(self.storage)
+            self.db.write(self.storage, compact=compact)
 
     def save_backup(self, backup_dir):
         new_db = WalletDB(self.db.dump(), manual_upgrades=False)
@@ -454,7 +477,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         finally:  # even if we get cancelled
             if any([ks.is_requesting_to_be_rewritten_to_wallet_file for ks in self.get_keystores()]):
                 self.save_keystore()
-            self.save_db()
+            # leave a self-contained wallet file behind
+            self.save_db(compact=True)
 
     def is_up_to_date(self) -> bool:
         return self._up_to_date
@@ -936,26 +960,34 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         # return last balance
         return balance
 
-    def get_onchain_history(self, *, domain=None):
+    def get_onchain_history(self, *, domain=None, from_height=None, to_height=None, after=None):
+        """Yields the onchain history, sorted by txpos.
+        The history is read in batches, so that it is never copied as a whole.
+        after: (txpos, txid) of the item after which to start.
+        """
         if domain is None:
             domain = self.get_addresses()
-        monotonic_timestamp = 0
-        for hist_item in self.adb.get_history(domain=domain):
-            monotonic_timestamp = max(monotonic_timestamp, (hist_item.tx_mined_status.timestamp or 999_999_999_999))
-            yield {
-                'txid': hist_item.txid,
-                'fee_sat': hist_item.fee,
-                'height': hist_item.tx_mined_status.height,
-                'confirmations': hist_item.tx_mined_status.conf,
-                'timestamp': hist_item.tx_mined_status.timestamp,
-                'monotonic_timestamp': monotonic_timestamp,
-                'incoming': True if hist_item.delta>0 else False,
-                'bc_value': Satoshis(hist_item.delta),
-                'bc_balance': Satoshis(hist_item.balance),
-                'date': timestamp_to_datetime(hist_item.tx_mined_status.timestamp),
-                'label': self.get_label_for_txid(hist_item.txid),
-                'txpos_in_block': hist_item.tx_mined_status.txpos,
-            }
+        while True:
+            h = self.adb.get_history(domain=domain, from_height=from_height, to_height=to_height,
+                                     after=after, limit=HISTORY_BATCH_SIZE)
+            for hist_item in h:
+                yield {
+                    'txid': hist_item.txid,
+                    'fee_sat': hist_item.fee,
+                    'height': hist_item.tx_mined_status.height,
+                    'confirmations': hist_item.tx_mined_status.conf,
+                    'timestamp': hist_item.tx_mined_status.timestamp,
+                    'monotonic_timestamp': hist_item.monotonic_timestamp,
+                    'incoming': True if hist_item.delta>0 else False,
+                    'bc_value': Satoshis(hist_item.delta),
+                    'bc_balance': Satoshis(hist_item.balance),
+                    'date': timestamp_to_datetime(hist_item.tx_mined_status.timestamp),
+                    'label': self.get_label_for_txid(hist_item.txid),
+                    'txpos_in_block': hist_item.tx_mined_status.txpos,
+                }
+            if len(h) < HISTORY_BATCH_SIZE:
+                return
+            after = self.adb.get_txpos(h[-1].txid), h[-1].txid
 
     def create_invoice(self, *, outputs: List[PartialTxOutput], message, pr, URI) -> Invoice:
         height = self.adb.get_local_height()
@@ -1193,40 +1225,30 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     item['fiat_default'] = True
         return transactions
 
-    @profiler
-    def get_detailed_history(
+    def iter_detailed_history(
             self,
             from_timestamp=None,
             to_timestamp=None,
             fx=None,
             show_addresses=False,
             from_height=None,
-            to_height=None):
-        # History with capital gains, using utxo pricing
-        # FIXME: Lightning capital gains would requires FIFO
+            to_height=None,
+            after=None):
+        """Yields the transactions of get_detailed_history, one at a time.
+        after: (txpos, txid) of the item after which to start.
+        """
         if (from_timestamp is not None or to_timestamp is not None) \
                 and (from_height is not None or to_height is not None):
             raise Exception('timestamp and block height based filtering cannot be used together')
 
         show_fiat = fx and fx.is_enabled() and fx.get_history_config()
-        out = []
-        income = 0
-        expenditures = 0
-        capital_gains = Decimal(0)
-        fiat_income = Decimal(0)
-        fiat_expenditures = Decimal(0)
         now = time.time()
-        for item in self.get_onchain_history():
+        for item in self.get_onchain_history(from_height=from_height, to_height=to_height, after=after):
             timestamp = item['timestamp']
             if from_timestamp and (timestamp or now) < from_timestamp:
                 continue
             if to_timestamp and (timestamp or now) >= to_timestamp:
                 continue
-            height = item['height']
-            if from_height is not None and from_height > height > 0:
-                continue
-            if to_height is not None and (height >= to_height or height <= 0):
-                continue
             tx_hash = item['txid']
             tx = self.db.get_transaction(tx_hash)
             tx_fee = item['fee_sat']
@@ -1235,19 +1257,48 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
                 item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
                                            tx.outputs()))
+            # fiat computations
+            if show_fiat:
+                value = item['bc_value'].value
+                item.update(self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee))
+            yield item
+
+    @profiler
+    def get_detailed_history(
+            self,
+            from_timestamp=None,
+            to_timestamp=None,
+            fx=None,
+            show_addresses=False,
+            from_height=None,
+            to_height=None):
+        # History with capital gains, using utxo pricing
+        # FIXME: Lightning capital gains would requires FIFO
+        show_fiat = fx and fx.is_enabled() and fx.get_history_config()
+        out = []
+        income = 0
+        expenditures = 0
+        capital_gains = Decimal(0)
+        fiat_income = Decimal(0)
+        fiat_expenditures = Decimal(0)
+        items = self.iter_detailed_history(
+            from_timestamp=from_timestamp,
+            to_timestamp=to_timestamp,
+            fx=fx,
+            show_addresses=show_addresses,
+            from_height=from_height,
+            to_height=to_height)
+        for item in items:
             # fixme: use in and out values
             value = item['bc_value'].value
             if value < 0:
                 expenditures += -value
             else:
                 income += value
-            # fiat computations
             if show_fiat:
-                fiat_fields = self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee)
-                fiat_value = fiat_fields['fiat_value'].value
-                item.update(fiat_fields)
+                fiat_value = item['fiat_value'].value
                 if value < 0:
-                    capital_gains += fiat_fields['capital_gain'].value
+                    capital_gains += item['capital_gain'].value
                     fiat_expenditures += -fiat_value
                 else:
                     fiat_income += fiat_value
@@ -2874,6 +2925,10 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         """Returns the number of new addresses we generated."""
         return 0
 
+    async def discover_addresses(self) -> int:
+        """Returns the number of new addresses we generated."""
+        return 0
+
 class Simple_Wallet(Abstract_Wallet):
     # wallet with a single keystore
 
@@ -3145,6 +3200,7 @@ class Deterministic_Wallet(Abstract_Wallet):
 
     def __init__(self, db, storage, *, config):
         self._ephemeral_addr_to_addr_index = {}  # type: Dict[str, Sequence[int]]
+        self._derived_addresses = {}  # type: Dict[Tuple[bool, int], str]  # (for_change, n) -> addr, during discovery
         Abstract_Wallet.__init__(self, db, storage, config=config)
         self.gap_limit = db.get('gap_limit', 20)
         # generate addresses now. note that without libsecp this might block
@@ -3226,6 +3282,11 @@ class Deterministic_Wallet(Abstract_Wallet):
                 nmax = max(nmax, n)
         return nmax + 1
 
+    @abstractmethod
+    def derive_pubkeys_range(self, c: int, start: int, stop: int) -> Sequence[Sequence[str]]:
+        """Returns the pubkeys of the addresses at c/i for i in range(start, stop)."""
+        pass
+
     @abstractmethod
     def derive_pubkeys(self, c: int, i: int) -> Sequence[str]:
         pass
@@ -3235,6 +3296,11 @@ class Deterministic_Wallet(Abstract_Wallet):
         pubkeys = self.derive_pubkeys(for_change, n)
         return self.pubkeys_to_address(pubkeys)
 
+    def derive_addresses(self, for_change: int, start: int, stop: int) -> List[str]:
+        for_change = int(for_change)
+        return [self.pubkeys_to_address(pubkeys)
+                for pubkeys in self.derive_pubkeys_range(for_change, start, stop)]
+
     def export_private_key_for_path(self, path: Union[Sequence[int], str], password: Optional[str]) -> str:
         if isinstance(path, str):
             path = convert_bip32_path_to_list_of_uint32(path)
@@ -3263,16 +3329,23 @@ class Deterministic_Wallet(Abstract_Wallet):
             txinout.bip32_paths[pubkey] = (fp_bytes, der_full)
 
     def create_new_address(self, for_change: bool = False):
+        return self.create_new_addresses(for_change, 1)[0]
+
+    def create_new_addresses(self, for_change: bool, count: int) -> List[str]:
         assert type(for_change) is bool
         with self.lock:
             n = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
-            address = self.derive_address(int(for_change), n)
-            self.db.add_change_address(address) if for_change else self.db.add_receiving_address(address)
-            self.adb.add_address(address)
-            if for_change:
-                # note: if it's actually "old", it will get filtered later
-                self._not_old_change_addresses.append(address)
-            return address
+            addresses = []
+            while len(addresses) < count and (for_change, n + len(addresses)) in self._derived_addresses:
+                addresses.append(self._derived_addresses[(for_change, n + len(addresses))])
+            addresses += self.derive_addresses(int(for_change), n + len(addresses), n + count)
+            for address in addresses:
+                self.db.add_change_address(address) if for_change else self.db.add_receiving_address(address)
+                self.adb.add_address(address)
+                if for_change:
+                    # note: if it's actually "old", it will get filtered later
+                    self._not_old_change_addresses.append(address)
+            return addresses
 
     def synchronize_sequence(self, for_change: bool) -> int:
         count = 0  # num new addresses we generated
@@ -3280,8 +3353,7 @@ class Deterministic_Wallet(Abstract_Wallet):
         while True:
             num_addr = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
             if num_addr < limit:
-                count += 1
-                self.create_new_address(for_change)
+                count += len(self.create_new_addresses(for_change, limit - num_addr))
                 continue
             if for_change:
                 last_few_addresses = self.get_change_addresses(slice_start=-limit)
@@ -3301,6 +3373,85 @@ class Deterministic_Wallet(Abstract_Wallet):
             count += self.synchronize_sequence(True)
         return count
 
+    async def discover_addresses(self) -> int:
+        """Finds the used addresses of both chains by querying the history of
+        whole blocks of derived addresses concurrently, and generates the
+        addresses up to the gap limit after the last used one.
+        Unlike synchronize(), this does not wait for history to get mined and
+        SPV-verified, so it is only used when restoring a wallet.
+        """
+        try:
+            async with OldTaskGroup() as group:
+                tasks = [await group.spawn(self._discover_num_used_addresses(for_change))
+                         for for_change in (False, True)]
+            count = 0
+            for for_change, task in zip((False, True), tasks):
+                limit = self.gap_limit_for_change if for_change else self.gap_limit
+                count += await run_in_thread(self._create_addresses_up_to, for_change, task.result() + limit)
+            return count
+        finally:
+            self._derived_addresses.clear()
+
+    async def _discover_num_used_addresses(self, for_change: bool) -> int:
+        """Returns the index of the last used address of a chain, plus one."""
+        limit = self.gap_limit_for_change if for_change else self.gap_limit
+        block_size = max(1, int(self.config.get('address_discovery_block_size', 200)))
+        lookahead = max(limit, block_size * ADDRESS_DISCOVERY_BLOCKS_IN_FLIGHT)
+        used = set()  # indexes of addresses with history
+
+        def get_num_used() -> int:
+            # stop at the first gap that is larger than the gap limit
+            num_used = 0
+            for i in sorted(used):
+                if i >= num_used + limit:
+                    break
+                num_used = i + 1
+            return num_used
+
+        async def get_used_indexes(start: int) -> Set[int]:
+            addrs = await run_in_thread(self._get_or_derive_addresses, for_change, start, start + block_size)
+            shs = [bitcoin.address_to_scripthash(addr) for addr in addrs]
+            histories = await self.network.get_histories_for_scripthashes(shs)
+            return {start + i for i, hist in enumerate(histories) if hist}
+
+        next_index = 0
+        pending = set()
+        try:
+            while True:
+                # extend the window as soon as we know about more used addresses
+                num_used = get_num_used()
+                while next_index < num_used + lookahead:
+                    pending.add(asyncio.ensure_future(get_used_indexes(next_index)))
+                    next_index += block_size
+                if not pending:
+                    return num_used
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # retrieve every exception, not just the first one
+                errors = [fut.exception() for fut in done if fut.exception()]
+                if errors:
+                    raise errors[0]
+                for fut in done:
+                    used |= fut.result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+    def _get_or_derive_addresses(self, for_change: bool, start: int, stop: int) -> List[str]:
+        if for_change:
+            addrs = self.get_change_addresses(slice_start=start, slice_stop=stop)
+        else:
+            addrs = self.get_receiving_addresses(slice_start=start, slice_stop=stop)
+        start += len(addrs)
+        for n, address in enumerate(self.derive_addresses(int(for_change), start, stop), start):
+            self._derived_addresses[(for_change, n)] = address
+            addrs.append(address)
+        return addrs
+
+    def _create_addresses_up_to(self, for_change: bool, num_addr: int) -> int:
+        with self.lock:
+            n = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
+            return len(self.create_new_addresses(for_change, max(0, num_addr - n)))
+
     def get_all_known_addresses_beyond_gap_limit(self):
         # note that we don't stop at first large gap
         found = set()
@@ -3380,6 +3531,9 @@ class Simple_Deterministic_Wallet(Simple_Wallet, Deterministic_Wallet):
     def derive_pubkeys(self, c, i):
         return [self.keystore.derive_pubkey(c, i).hex()]
 
+    def derive_pubkeys_range(self, c, start, stop):
+        return [[pubkey.hex()] for pubkey in self.keystore.derive_pubkeys_range(c, start, stop)]
+
 
 
 
@@ -3436,6 +3590,10 @@ class Multisig_Wallet(Deterministic_Wallet):
     def derive_pubkeys(self, c, i):
         return [k.derive_pubkey(c, i).hex() for k in self.get_keystores()]
 
+    def derive_pubkeys_range(self, c, start, stop):
+        pubkeys_per_keystore = [k.derive_pubkeys_range(c, start, stop) for k in self.get_keystores()]
+        return [[pubkey.hex() for pubkey in pubkeys] for pubkeys in zip(*pubkeys_per_keystore)]
+
     def load_keystore(self):
         self.keystores = {}
         for i in range(self.n):
@@ -3527,13 +3685,27 @@ class Wallet(object):
         raise WalletFileException("Unknown wallet type: " + str(wallet_type))
 
 
+def _resolve_encrypt_file(encrypt_file: Optional[bool], *, password, db_backend: str) -> bool:
+    """Whether to encrypt the file of a new wallet. By default, the file is
+    encrypted if the backend supports it.
+    """
+    if encrypt_file is None:
+        return db_backend != 'sqlite'
+    if encrypt_file and password and db_backend == 'sqlite':
+        raise WalletFileException("Storage encryption is not supported for sqlite wallets. "
+                                  "Set encrypt_file to false, or use the json backend.")
+    return encrypt_file
+
+
 def create_new_wallet(*, path, config: SimpleConfig, passphrase=None, password=None,
-                      encrypt_file=True, seed_type=None, gap_limit=None) -> dict:
+                      encrypt_file=None, seed_type=None, gap_limit=None, db_backend=None) -> dict:
     """Create a new wallet"""
     storage = WalletStorage(path)
     if storage.file_exists():
         raise Exception("Remove the existing wallet first!")
-    db = WalletDB('', manual_upgrades=False)
+    db_backend = db_backend or config.get('wallet_db_backend', 'json')
+    encrypt_file = _resolve_encrypt_file(encrypt_file, password=password, db_backend=db_backend)
+    db = create_wallet_db(db_backend=db_backend)
 
     seed = Mnemonic('en').make_seed(seed_type=seed_type)
     k = keystore.from_seed(seed, passphrase)
@@ -3552,8 +3724,8 @@ def create_new_wallet(*, path, config: SimpleConfig, passphrase=None, password=N
 
 
 def restore_wallet_from_text(text, *, path: Optional[str], config: SimpleConfig,
-                             passphrase=None, password=None, encrypt_file=True,
-                             gap_limit=None) -> dict:
+                             passphrase=None, password=None, encrypt_file=None,
+                             gap_limit=None, db_backend=None) -> dict:
     """Restore a wallet from text. Text can be a seed phrase, a master
     public key, a master private key, a list of bitcoin addresses
     or bitcoin private keys."""
@@ -3563,7 +3735,9 @@ def restore_wallet_from_text(text, *, path: Optional[str], config: SimpleConfig,
         storage = WalletStorage(path)
         if storage.file_exists():
             raise Exception("Remove the existing wallet first!")
-    db = WalletDB('', manual_upgrades=False)
+    db_backend = db_backend or config.get('wallet_db_backend', 'json')
+    encrypt_file = _resolve_encrypt_file(encrypt_file, password=password, db_backend=db_backend)
+    db = create_wallet_db(db_backend=db_backend)
     text = text.strip()
     if keystore.is_address_list(text):
         wallet = Imported_Wallet(db, storage, config=config)
@@ -3594,6 +3768,8 @@ def restore_wallet_from_text(text, *, path: Optional[str], config: SimpleConfig,
         db.put('wallet_type', 'standard')
         if gap_limit is not None:
             db.put('gap_limit', gap_limit)
+        # generate the used addresses in bulk once we are online
+        db.put('needs_address_discovery', True)
         wallet = Wallet(db, storage, config=config)
     if storage:
         assert not storage.file_exists(), "file was created too soon! plaintext keys might have been written to disk"
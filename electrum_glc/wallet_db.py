@@ -40,7 +40,7 @@ from .logging import Logger
 from .lnutil import LOCAL, REMOTE, FeeUpdate, UpdateAddHtlc, LocalConfig, RemoteConfig, ChannelType
 from .lnutil import ImportedChannelBackupStorage, OnchainChannelBackupStorage
 from .lnutil import ChannelConstraints, Outpoint, ShachainElement
-from .json_db import StoredDict, JsonDB, locked, modifier
+from .json_db import LazyStoredDict, JsonDB, locked, modifier, apply_patches, peek
 from .plugin import run_hook, plugin_loaders
 from .submarine_swaps import SwapData
 
@@ -52,10 +52,13 @@ if TYPE_CHECKING:
 
 OLD_SEED_VERSION = 4        # electrum versions < 2.0
 NEW_SEED_VERSION = 11       # electrum versions >= 2.0
-FINAL_SEED_VERSION = 50     # electrum >= 2.7 will set this to prevent
+FINAL_SEED_VERSION = 51     # electrum >= 2.7 will set this to prevent
                             # old versions from overwriting new format
 
 
+MULTISIG_KEYSTORE_NAMES = frozenset(('x%d/' % i) for i in range(1, 16))
+
+
 class TxFeesValue(NamedTuple):
     fee: Optional[int] = None
     is_calculated_by_us: bool = False
@@ -77,7 +80,11 @@ class WalletDB(JsonDB):
 
     def load_data(self, s):
         try:
-            self.data = json.loads(s)
+            # the snapshot may be followed by journaled changes, see WalletStorage.read
+            self.data, *patches = json.loads('[' + s + ']')
+            if patches:
+                num_skipped = apply_patches(self.data, patches)
+                self.logger.info(f"replayed {len(patches)} journaled changes ({num_skipped} skipped)")
         except:
             try:
                 d = ast.literal_eval(s)
@@ -199,6 +206,7 @@ class WalletDB(JsonDB):
         self._convert_version_48()
         self._convert_version_49()
         self._convert_version_50()
+        self._convert_version_51()
         self.put('seed_version', FINAL_SEED_VERSION)  # just to be sure
 
         self._after_upgrade_tasks()
@@ -980,6 +988,14 @@ class WalletDB(JsonDB):
         self._convert_invoices_keys(requests)
         self.data['seed_version'] = 50
 
+    def _convert_version_51(self):
+        # no-op: the changes since the last save may be in a journal next
+        # to the wallet file (see WalletStorage.append_to_journal). Older
+        # versions would ignore it, and load a stale wallet.
+        if not self._is_upgrade_method_needed(50, 50):
+            return
+        self.data['seed_version'] = 51
+
     def _convert_imported(self):
         if not self._is_upgrade_method_needed(0, 13):
             return
@@ -1062,20 +1078,20 @@ class WalletDB(JsonDB):
     def get_txi_addresses(self, tx_hash: str) -> List[str]:
         """Returns list of is_mine addresses that appear as inputs in tx."""
         assert isinstance(tx_hash, str)
-        return list(self.txi.get(tx_hash, {}).keys())
+        return list(peek(self.txi, tx_hash, {}).keys())
 
     @locked
     def get_txo_addresses(self, tx_hash: str) -> List[str]:
         """Returns list of is_mine addresses that appear as outputs in tx."""
         assert isinstance(tx_hash, str)
-        return list(self.txo.get(tx_hash, {}).keys())
+        return list(peek(self.txo, tx_hash, {}).keys())
 
     @locked
     def get_txi_addr(self, tx_hash: str, address: str) -> Iterable[Tuple[str, int]]:
         """Returns an iterable of (prev_outpoint, value)."""
         assert isinstance(tx_hash, str)
         assert isinstance(address, str)
-        d = self.txi.get(tx_hash, {}).get(address, {})
+        d = peek(peek(self.txi, tx_hash, {}), address, {})
         return list(d.items())
 
     @locked
@@ -1083,7 +1099,7 @@ class WalletDB(JsonDB):
         """Returns a dict: output_index -> (value, is_coinbase)."""
         assert isinstance(tx_hash, str)
         assert isinstance(address, str)
-        d = self.txo.get(tx_hash, {}).get(address, {})
+        d = peek(peek(self.txo, tx_hash, {}), address, {})
         return {int(n): (v, cb) for (n, (v, cb)) in d.items()}
 
     @modifier
@@ -1142,13 +1158,13 @@ class WalletDB(JsonDB):
     @locked
     def get_spent_outpoints(self, prevout_hash: str) -> Sequence[str]:
         assert isinstance(prevout_hash, str)
-        return list(self.spent_outpoints.get(prevout_hash, {}).keys())
+        return list(peek(self.spent_outpoints, prevout_hash, {}).keys())
 
     @locked
     def get_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> Optional[str]:
         assert isinstance(prevout_hash, str)
         prevout_n = str(prevout_n)
-        return self.spent_outpoints.get(prevout_hash, {}).get(prevout_n)
+        return peek(self.spent_outpoints, prevout_hash, {}).get(prevout_n)
 
     @modifier
     def remove_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> None:
@@ -1172,17 +1188,20 @@ class WalletDB(JsonDB):
         assert isinstance(scripthash, str)
         assert isinstance(prevout, TxOutpoint)
         assert isinstance(value, int)
-        if scripthash not in self._prevouts_by_scripthash:
-            self._prevouts_by_scripthash[scripthash] = set()
-        self._prevouts_by_scripthash[scripthash].add((prevout.to_str(), value))
+        # note: replace the set instead of mutating it in place, so that the change is journaled
+        prevouts = set(self._prevouts_by_scripthash.get(scripthash, ()))
+        prevouts.add((prevout.to_str(), value))
+        self._prevouts_by_scripthash[scripthash] = prevouts
 
     @modifier
     def remove_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
         assert isinstance(scripthash, str)
         assert isinstance(prevout, TxOutpoint)
         assert isinstance(value, int)
-        self._prevouts_by_scripthash[scripthash].discard((prevout.to_str(), value))
-        if not self._prevouts_by_scripthash[scripthash]:
+        prevouts = self._prevouts_by_scripthash[scripthash] - {(prevout.to_str(), value)}
+        if prevouts:
+            self._prevouts_by_scripthash[scripthash] = prevouts
+        else:
             self._prevouts_by_scripthash.pop(scripthash)
 
     @locked
@@ -1238,14 +1257,46 @@ class WalletDB(JsonDB):
         return self.history.get(addr, [])
 
     @modifier
-    def set_addr_history(self, addr: str, hist) -> None:
+    def set_addr_history(self, addr: str, hist, *, status: Optional[str]) -> None:
+        """'status' is the status of hist, see synchronizer.history_status"""
         assert isinstance(addr, str)
         self.history[addr] = hist
+        self.history_status[addr] = status
 
     @modifier
     def remove_addr_history(self, addr: str) -> None:
         assert isinstance(addr, str)
         self.history.pop(addr, None)
+        self.history_status.pop(addr, None)
+        self.scripthashes.pop(addr, None)
+
+    @locked
+    def get_addr_history_status(self, addr: str) -> Optional[str]:
+        assert isinstance(addr, str)
+        return self.history_status.get(addr)
+
+    @locked
+    def list_addrs_without_history_status(self) -> Sequence[str]:
+        """Addresses whose history was stored before we kept its status."""
+        return [addr for addr in self.history.keys() if addr not in self.history_status]
+
+    @modifier
+    def set_addr_history_status(self, addr: str, status: Optional[str]) -> None:
+        assert isinstance(addr, str)
+        self.history_status[addr] = status
+
+    def get_addr_scripthash(self, addr: str) -> str:
+        assert isinstance(addr, str)
+        with self.lock:
+            scripthash = self.scripthashes.get(addr)
+            if scripthash is None:
+                scripthash = bitcoin.address_to_scripthash(addr)
+                self._set_addr_scripthash(addr, scripthash)
+            return scripthash
+
+    @modifier
+    def _set_addr_scripthash(self, addr: str, scripthash: str) -> None:
+        self.scripthashes[addr] = scripthash
 
     @locked
     def list_verified_tx(self) -> Sequence[str]:
@@ -1263,11 +1314,15 @@ class WalletDB(JsonDB):
                            txpos=txpos,
                            header_hash=header_hash)
 
-    @modifier
     def add_verified_tx(self, txid: str, info: TxMinedInfo):
-        assert isinstance(txid, str)
-        assert isinstance(info, TxMinedInfo)
-        self.verified_tx[txid] = (info.height, info.timestamp, info.txpos, info.header_hash)
+        self.add_verified_txs([(txid, info)])
+
+    @modifier
+    def add_verified_txs(self, items: Sequence[Tuple[str, TxMinedInfo]]):
+        for txid, info in items:
+            assert isinstance(txid, str)
+            assert isinstance(info, TxMinedInfo)
+            self.verified_tx[txid] = (info.height, info.timestamp, info.txpos, info.header_hash)
 
     @modifier
     def remove_verified_tx(self, txid: str):
@@ -1329,7 +1384,7 @@ class WalletDB(JsonDB):
     @locked
     def get_num_ismine_inputs_of_tx(self, txid: str) -> int:
         assert isinstance(txid, str)
-        txins = self.txi.get(txid, {})
+        txins = peek(self.txi, txid, {})
         return sum([len(tupls) for addr, tupls in txins.items()])
 
     @modifier
@@ -1359,13 +1414,13 @@ class WalletDB(JsonDB):
     def add_change_address(self, addr: str) -> None:
         assert isinstance(addr, str)
         self._addr_to_addr_index[addr] = (1, len(self.change_addresses))
-        self.change_addresses.append(addr)
+        self.data['addresses'].append_to_list('change', addr)
 
     @modifier
     def add_receiving_address(self, addr: str) -> None:
         assert isinstance(addr, str)
         self._addr_to_addr_index[addr] = (0, len(self.receiving_addresses))
-        self.receiving_addresses.append(addr)
+        self.data['addresses'].append_to_list('receiving', addr)
 
     @locked
     def get_address_index(self, address: str) -> Optional[Sequence[int]]:
@@ -1415,7 +1470,11 @@ class WalletDB(JsonDB):
 
     @profiler
     def _load_transactions(self):
-        self.data = StoredDict(self.data, self, [])
+        if self.modified():
+            # e.g. upgrades. changes made before conversion are not journaled
+            self.set_modified(True)
+        # note: the data is converted lazily, as it is accessed
+        self.data = LazyStoredDict(self.data, self, [])
         # references in self.data
         # TODO make all these private
         # txid -> address -> prev_outpoint -> value
@@ -1425,6 +1484,8 @@ class WalletDB(JsonDB):
         self.transactions = self.get_dict('transactions')        # type: Dict[str, Transaction]
         self.spent_outpoints = self.get_dict('spent_outpoints')  # txid -> output_index -> next_txid
         self.history = self.get_dict('addr_history')             # address -> list of (txid, height)
+        self.history_status = self.get_dict('addr_history_status')  # address -> status of history, or None if empty
+        self.scripthashes = self.get_dict('addr_scripthashes')   # address -> scripthash
         self.verified_tx = self.get_dict('verified_tx3')         # txid -> (height, timestamp, txpos, header_hash)
         self.tx_fees = self.get_dict('tx_fees')                  # type: Dict[str, TxFeesValue]
         # scripthash -> set of (outpoint, value)
@@ -1436,11 +1497,11 @@ class WalletDB(JsonDB):
                 self.transactions.pop(tx_hash)
         # remove unreferenced outpoints
         for prevout_hash in self.spent_outpoints.keys():
-            d = self.spent_outpoints[prevout_hash]
+            d = peek(self.spent_outpoints, prevout_hash)
             for prevout_n, spending_txid in list(d.items()):
                 if spending_txid not in self.transactions:
                     self.logger.info("removing unreferenced spent outpoint")
-                    d.pop(prevout_n)
+                    self.spent_outpoints[prevout_hash].pop(prevout_n)
 
     @modifier
     def clear_history(self):
@@ -1449,6 +1510,7 @@ class WalletDB(JsonDB):
         self.spent_outpoints.clear()
         self.transactions.clear()
         self.history.clear()
+        self.history_status.clear()
         self.verified_tx.clear()
         self.tx_fees.clear()
         self._prevouts_by_scripthash.clear()
@@ -1506,24 +1568,35 @@ class WalletDB(JsonDB):
     def _should_convert_to_stored_dict(self, key) -> bool:
         if key == 'keystore':
             return False
-        multisig_keystore_names = [('x%d/' % i) for i in range(1, 16)]
-        if key in multisig_keystore_names:
+        if key in MULTISIG_KEYSTORE_NAMES:
             return False
         return True
 
-    def write(self, storage: 'WalletStorage'):
+    def write(self, storage: 'WalletStorage', *, compact: bool = False):
+        """Saves changes to storage.
+        Changes are appended to the journal of the wallet file if possible.
+        'compact': rewrite the whole file, folding the journal into it.
+        """
         with self.lock:
-            self._write(storage)
+            self._write(storage, compact=compact)
 
     @profiler
-    def _write(self, storage: 'WalletStorage'):
+    def _write(self, storage: 'WalletStorage', *, compact: bool = False):
         if threading.current_thread().daemon:
             self.logger.warning('daemon thread cannot write db')
             return
-        if not self.modified():
+        if not self.modified() and not (compact and storage.has_journal()):
             return
-        json_str = self.dump(human_readable=not storage.is_encrypted())
-        storage.write(json_str)
+        if (compact
+                or self.needs_full_write()
+                or not storage.can_append_to_journal()
+                or storage.journal_needs_compaction()):
+            json_str = self.dump(human_readable=not storage.is_encrypted())
+            storage.write(json_str)
+        elif self._pending_changes:
+            storage.append_to_journal(self._pending_changes)
+        self._pending_changes = []
+        self._needs_full_write = False
         self.set_modified(False)
 
     def is_ready_to_be_used_by_wallet(self):
@@ -1554,3 +1627,24 @@ class WalletDB(JsonDB):
 
     def set_keystore_encryption(self, enable):
         self.put('use_encryption', enable)
+
+
+DB_BACKENDS = ('json', 'sqlite')
+
+
+def create_wallet_db(*, db_backend: str = 'json') -> WalletDB:
+    """Returns the db of a new wallet. 'db_backend': one of DB_BACKENDS."""
+    if db_backend == 'sqlite':
+        from .wallet_sqlite_db import SqliteWalletDB
+        return SqliteWalletDB('', manual_upgrades=False)
+    if db_backend != 'json':
+        raise WalletFileException(f"Unknown wallet db backend: {db_backend!r}")
+    return WalletDB('', manual_upgrades=False)
+
+
+def load_wallet_db(storage: 'WalletStorage', *, manual_upgrades: bool) -> WalletDB:
+    """Returns the db of an existing wallet file, with the backend the file uses."""
+    if storage.is_sqlite():
+        from .wallet_sqlite_db import SqliteWalletDB
+        return SqliteWalletDB(manual_upgrades=manual_upgrades, path=storage.path)
+    return WalletDB(storage.read(), manual_upgrades=manual_upgrades)
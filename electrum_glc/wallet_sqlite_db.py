@@ -0,0 +1,592 @@
+#!/usr/bin/env python
+#
+# Electrum - lightweight Bitcoin client
+# Copyright (C) 2026 The Electrum Developers
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import json
+import stat
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Dict, Optional, List, Tuple, Set, Iterable, Sequence, TYPE_CHECKING, Union
+
+from . import bitcoin
+from .util import profiler, WalletFileException, TxMinedInfo, os_chmod
+from .transaction import Transaction, TxOutpoint, tx_from_any, PartialTransaction
+from .json_db import LazyStoredDict, locked, modifier, peek, JsonDBJsonEncoder
+from .wallet_db import WalletDB
+
+if TYPE_CHECKING:
+    from .storage import WalletStorage
+
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+# keys of the wallet data that are stored in tables, instead of as json
+HISTORY_KEYS = ('txi', 'txo', 'transactions', 'spent_outpoints', 'addr_history',
+                'verified_tx3', 'prevouts_by_scripthash', 'addr_history_status', 'addr_scripthashes')
+
+
+def is_sqlite_file(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+class _Transactions(Mapping):
+    """Read-only view of the transactions table, txid -> Transaction."""
+
+    def __init__(self, db: 'SqliteWalletDB'):
+        self._db = db
+
+    def __getitem__(self, txid):
+        tx = self._db.get_transaction(txid)
+        if tx is None:
+            raise KeyError(txid)
+        return tx
+
+    def __iter__(self):
+        return iter(self._db.list_transactions())
+
+    def __len__(self):
+        with self._db.lock:
+            return self._db.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+
+class SqliteWalletDB(WalletDB):
+    """WalletDB that keeps the wallet history in the indexed tables of an sqlite file.
+
+    The rest of the wallet data is stored as json in the 'meta' table.
+    The db lives in memory until it is first written to a wallet file.
+    Note: storage encryption is not supported, keystore encryption is.
+    """
+
+    def __init__(self, raw: Optional[str] = None, *, manual_upgrades: bool, path: str = ':memory:'):
+        """'raw': the json data of the wallet. If None, it is read from 'path'."""
+        self.path = path
+        # all access to the connection is serialized by the lock of the db
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.create_database()
+        is_new = raw is not None
+        if raw is None:
+            raw = self._read_meta()
+        self.transactions = _Transactions(self)
+        # top-level keys whose meta rows are rewritten on the next write
+        self._changed_meta_keys = set()
+        WalletDB.__init__(self, raw, manual_upgrades=manual_upgrades)
+        if is_new:
+            # the meta table does not have the data yet
+            self._needs_full_write = True
+
+    def create_database(self):
+        c = self.conn.cursor()
+        c.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        c.execute("CREATE TABLE IF NOT EXISTS txi ("
+                  "tx_hash TEXT NOT NULL, address TEXT NOT NULL, prevout TEXT NOT NULL, value INTEGER NOT NULL, "
+                  "PRIMARY KEY(tx_hash, address, prevout))")
+        c.execute("CREATE TABLE IF NOT EXISTS txo ("
+                  "tx_hash TEXT NOT NULL, address TEXT NOT NULL, n TEXT NOT NULL, value INTEGER NOT NULL, "
+                  "is_coinbase INTEGER NOT NULL, PRIMARY KEY(tx_hash, address, n))")
+        c.execute("CREATE TABLE IF NOT EXISTS spent_outpoints ("
+                  "prevout_hash TEXT NOT NULL, prevout_n TEXT NOT NULL, spending_txid TEXT NOT NULL, "
+                  "PRIMARY KEY(prevout_hash, prevout_n))")
+        c.execute("CREATE INDEX IF NOT EXISTS spent_outpoints_spending_txid ON spent_outpoints (spending_txid)")
+        c.execute("CREATE TABLE IF NOT EXISTS addr_history (address TEXT PRIMARY KEY, history TEXT NOT NULL)")
+        c.execute("CREATE TABLE IF NOT EXISTS addr_history_status (address TEXT PRIMARY KEY, status TEXT)")
+        c.execute("CREATE TABLE IF NOT EXISTS addr_scripthashes (address TEXT PRIMARY KEY, scripthash TEXT NOT NULL)")
+        c.execute("CREATE TABLE IF NOT EXISTS verified_tx ("
+                  "txid TEXT PRIMARY KEY, height INTEGER NOT NULL, timestamp INTEGER, txpos INTEGER, header_hash TEXT)")
+        c.execute("CREATE TABLE IF NOT EXISTS transactions (txid TEXT PRIMARY KEY, raw TEXT NOT NULL)")
+        c.execute("CREATE TABLE IF NOT EXISTS prevouts_by_scripthash ("
+                  "scripthash TEXT NOT NULL, prevout TEXT NOT NULL, value INTEGER NOT NULL, "
+                  "PRIMARY KEY(scripthash, prevout, value))")
+        self.conn.commit()
+
+    def _read_meta(self) -> str:
+        rows = self.conn.execute("SELECT key, value FROM meta").fetchall()
+        if not rows:
+            return ''
+        return '{' + ','.join(json.dumps(k) + ':' + v for k, v in rows) + '}'
+
+    def _read_history(self) -> dict:
+        """Returns the tables as json data, in the format of WalletDB."""
+        c = self.conn.cursor()
+        d = {key: {} for key in HISTORY_KEYS}
+        for tx_hash, addr, prevout, value in c.execute("SELECT tx_hash, address, prevout, value FROM txi"):
+            d['txi'].setdefault(tx_hash, {}).setdefault(addr, {})[prevout] = value
+        for tx_hash, addr, n, value, is_cb in c.execute("SELECT tx_hash, address, n, value, is_coinbase FROM txo"):
+            d['txo'].setdefault(tx_hash, {}).setdefault(addr, {})[n] = (value, bool(is_cb))
+        for txid, raw in c.execute("SELECT txid, raw FROM transactions"):
+            d['transactions'][txid] = raw
+        for prevout_hash, n, txid in c.execute("SELECT prevout_hash, prevout_n, spending_txid FROM spent_outpoints"):
+            d['spent_outpoints'].setdefault(prevout_hash, {})[n] = txid
+        for addr, hist in c.execute("SELECT address, history FROM addr_history"):
+            d['addr_history'][addr] = json.loads(hist)
+        for addr, status in c.execute("SELECT address, status FROM addr_history_status"):
+            d['addr_history_status'][addr] = status
+        for addr, scripthash in c.execute("SELECT address, scripthash FROM addr_scripthashes"):
+            d['addr_scripthashes'][addr] = scripthash
+        for row in c.execute("SELECT txid, height, timestamp, txpos, header_hash FROM verified_tx"):
+            d['verified_tx3'][row[0]] = row[1:]
+        for scripthash, prevout, value in c.execute("SELECT scripthash, prevout, value FROM prevouts_by_scripthash"):
+            d['prevouts_by_scripthash'].setdefault(scripthash, []).append((prevout, value))
+        return d
+
+    def _write_history(self, d: dict) -> None:
+        """Replaces the content of the tables with json data, in the format of WalletDB."""
+        c = self.conn.cursor()
+        c.execute("DELETE FROM txi")
+        c.executemany("INSERT INTO txi VALUES (?,?,?,?)", (
+            (tx_hash, addr, prevout, value)
+            for tx_hash, d1 in d.get('txi', {}).items()
+            for addr, d2 in d1.items()
+            for prevout, value in d2.items()))
+        c.execute("DELETE FROM txo")
+        c.executemany("INSERT INTO txo VALUES (?,?,?,?,?)", (
+            (tx_hash, addr, str(n), value, bool(is_cb))
+            for tx_hash, d1 in d.get('txo', {}).items()
+            for addr, d2 in d1.items()
+            for n, (value, is_cb) in d2.items()))
+        c.execute("DELETE FROM transactions")
+        c.executemany("INSERT INTO transactions VALUES (?,?)", (
+            (txid, raw.serialize() if isinstance(raw, Transaction) else raw)
+            for txid, raw in d.get('transactions', {}).items()))
+        c.execute("DELETE FROM spent_outpoints")
+        c.executemany("INSERT INTO spent_outpoints VALUES (?,?,?)", (
+            (prevout_hash, str(n), txid)
+            for prevout_hash, d1 in d.get('spent_outpoints', {}).items()
+            for n, txid in d1.items()))
+        c.execute("DELETE FROM addr_history")
+        c.executemany("INSERT INTO addr_history VALUES (?,?)", (
+            (addr, json.dumps(hist))
+            for addr, hist in d.get('addr_history', {}).items()))
+        c.execute("DELETE FROM addr_history_status")
+        c.executemany("INSERT INTO addr_history_status VALUES (?,?)", d.get('addr_history_status', {}).items())
+        c.execute("DELETE FROM addr_scripthashes")
+        c.executemany("INSERT INTO addr_scripthashes VALUES (?,?)", d.get('addr_scripthashes', {}).items())
+        c.execute("DELETE FROM verified_tx")
+        c.executemany("INSERT INTO verified_tx VALUES (?,?,?,?,?)", (
+            (txid, *info)
+            for txid, info in d.get('verified_tx3', {}).items()))
+        c.execute("DELETE FROM prevouts_by_scripthash")
+        c.executemany("INSERT OR IGNORE INTO prevouts_by_scripthash VALUES (?,?,?)", (
+            (scripthash, prevout, value)
+            for scripthash, prevouts in d.get('prevouts_by_scripthash', {}).items()
+            for prevout, value in prevouts))
+
+    def upgrade(self):
+        # upgrades operate on the json data of the whole wallet
+        self.data.update(self._read_history())
+        WalletDB.upgrade(self)
+
+    @profiler
+    def _load_transactions(self):
+        # history passed as json (e.g. when converting a json wallet, or after an upgrade) is moved to the tables
+        history = {key: self.data.pop(key) for key in HISTORY_KEYS if key in self.data}
+        if history:
+            self._write_history(history)
+            self._modified = True
+        if self.modified():
+            # e.g. upgrades. changes made before conversion are not tracked
+            self.set_modified(True)
+        self.data = LazyStoredDict(self.data, self, [])
+        self.tx_fees = self.get_dict('tx_fees')
+        # remove unreferenced tx and outpoints
+        c = self.conn.cursor()
+        c.execute("DELETE FROM transactions WHERE txid NOT IN (SELECT tx_hash FROM txi) "
+                  "AND txid NOT IN (SELECT tx_hash FROM txo)")
+        if c.rowcount > 0:
+            self.logger.info(f"removed {c.rowcount} unreferenced tx")
+            self._modified = True
+        c.execute("DELETE FROM spent_outpoints WHERE spending_txid NOT IN (SELECT txid FROM transactions)")
+        if c.rowcount > 0:
+            self.logger.info(f"removed {c.rowcount} unreferenced spent outpoints")
+            self._modified = True
+        # do not keep the file locked until the next write
+        self.conn.commit()
+
+    @locked
+    def get_txi_addresses(self, tx_hash: str) -> List[str]:
+        assert isinstance(tx_hash, str)
+        rows = self.conn.execute("SELECT DISTINCT address FROM txi WHERE tx_hash=?", (tx_hash,))
+        return [r[0] for r in rows]
+
+    @locked
+    def get_txo_addresses(self, tx_hash: str) -> List[str]:
+        assert isinstance(tx_hash, str)
+        rows = self.conn.execute("SELECT DISTINCT address FROM txo WHERE tx_hash=?", (tx_hash,))
+        return [r[0] for r in rows]
+
+    @locked
+    def get_txi_addr(self, tx_hash: str, address: str) -> Iterable[Tuple[str, int]]:
+        assert isinstance(tx_hash, str)
+        assert isinstance(address, str)
+        rows = self.conn.execute("SELECT prevout, value FROM txi WHERE tx_hash=? AND address=?", (tx_hash, address))
+        return rows.fetchall()
+
+    @locked
+    def get_txo_addr(self, tx_hash: str, address: str) -> Dict[int, Tuple[int, bool]]:
+        assert isinstance(tx_hash, str)
+        assert isinstance(address, str)
+        rows = self.conn.execute("SELECT n, value, is_coinbase FROM txo WHERE tx_hash=? AND address=?", (tx_hash, address))
+        return {int(n): (v, bool(cb)) for n, v, cb in rows}
+
+    @modifier
+    def add_txi_addr(self, tx_hash: str, addr: str, ser: str, v: int) -> None:
+        assert isinstance(tx_hash, str)
+        assert isinstance(addr, str)
+        assert isinstance(ser, str)
+        assert isinstance(v, int)
+        self.conn.execute("INSERT OR REPLACE INTO txi VALUES (?,?,?,?)", (tx_hash, addr, ser, v))
+
+    @modifier
+    def add_txo_addr(self, tx_hash: str, addr: str, n: Union[int, str], v: int, is_coinbase: bool) -> None:
+        n = str(n)
+        assert isinstance(tx_hash, str)
+        assert isinstance(addr, str)
+        assert isinstance(v, int)
+        assert isinstance(is_coinbase, bool)
+        self.conn.execute("INSERT OR REPLACE INTO txo VALUES (?,?,?,?,?)", (tx_hash, addr, n, v, is_coinbase))
+
+    @locked
+    def list_txi(self) -> Sequence[str]:
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT tx_hash FROM txi")]
+
+    @locked
+    def list_txo(self) -> Sequence[str]:
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT tx_hash FROM txo")]
+
+    @modifier
+    def remove_txi(self, tx_hash: str) -> None:
+        assert isinstance(tx_hash, str)
+        self.conn.execute("DELETE FROM txi WHERE tx_hash=?", (tx_hash,))
+
+    @modifier
+    def remove_txo(self, tx_hash: str) -> None:
+        assert isinstance(tx_hash, str)
+        self.conn.execute("DELETE FROM txo WHERE tx_hash=?", (tx_hash,))
+
+    @locked
+    def list_spent_outpoints(self) -> Sequence[Tuple[str, str]]:
+        return self.conn.execute("SELECT prevout_hash, prevout_n FROM spent_outpoints").fetchall()
+
+    @locked
+    def get_spent_outpoints(self, prevout_hash: str) -> Sequence[str]:
+        assert isinstance(prevout_hash, str)
+        rows = self.conn.execute("SELECT prevout_n FROM spent_outpoints WHERE prevout_hash=?", (prevout_hash,))
+        return [r[0] for r in rows]
+
+    @locked
+    def get_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> Optional[str]:
+        assert isinstance(prevout_hash, str)
+        prevout_n = str(prevout_n)
+        row = self.conn.execute("SELECT spending_txid FROM spent_outpoints WHERE prevout_hash=? AND prevout_n=?",
+                                (prevout_hash, prevout_n)).fetchone()
+        return row[0] if row else None
+
+    @modifier
+    def remove_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str]) -> None:
+        assert isinstance(prevout_hash, str)
+        prevout_n = str(prevout_n)
+        self.conn.execute("DELETE FROM spent_outpoints WHERE prevout_hash=? AND prevout_n=?", (prevout_hash, prevout_n))
+
+    @modifier
+    def set_spent_outpoint(self, prevout_hash: str, prevout_n: Union[int, str], tx_hash: str) -> None:
+        assert isinstance(prevout_hash, str)
+        assert isinstance(tx_hash, str)
+        prevout_n = str(prevout_n)
+        self.conn.execute("INSERT OR REPLACE INTO spent_outpoints VALUES (?,?,?)", (prevout_hash, prevout_n, tx_hash))
+
+    @modifier
+    def add_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
+        assert isinstance(scripthash, str)
+        assert isinstance(prevout, TxOutpoint)
+        assert isinstance(value, int)
+        self.conn.execute("INSERT OR IGNORE INTO prevouts_by_scripthash VALUES (?,?,?)",
+                          (scripthash, prevout.to_str(), value))
+
+    @modifier
+    def remove_prevout_by_scripthash(self, scripthash: str, *, prevout: TxOutpoint, value: int) -> None:
+        assert isinstance(scripthash, str)
+        assert isinstance(prevout, TxOutpoint)
+        assert isinstance(value, int)
+        self.conn.execute("DELETE FROM prevouts_by_scripthash WHERE scripthash=? AND prevout=? AND value=?",
+                          (scripthash, prevout.to_str(), value))
+
+    @locked
+    def get_prevouts_by_scripthash(self, scripthash: str) -> Set[Tuple[TxOutpoint, int]]:
+        assert isinstance(scripthash, str)
+        rows = self.conn.execute("SELECT prevout, value FROM prevouts_by_scripthash WHERE scripthash=?", (scripthash,))
+        return {(TxOutpoint.from_str(prevout), value) for prevout, value in rows}
+
+    @modifier
+    def add_transaction(self, tx_hash: str, tx: Transaction) -> None:
+        assert isinstance(tx_hash, str)
+        assert isinstance(tx, Transaction), tx
+        # see WalletDB.add_transaction
+        tx = tx_from_any(str(tx))
+        if not tx_hash:
+            raise Exception("trying to add tx to db without txid")
+        if tx_hash != tx.txid():
+            raise Exception(f"trying to add tx to db with inconsistent txid: {tx_hash} != {tx.txid()}")
+        # don't allow overwriting complete tx with partial tx
+        tx_we_already_have = self.get_transaction(tx_hash)
+        if tx_we_already_have is None or isinstance(tx_we_already_have, PartialTransaction):
+            self.conn.execute("INSERT OR REPLACE INTO transactions VALUES (?,?)", (tx_hash, tx.serialize()))
+
+    @modifier
+    def remove_transaction(self, tx_hash: str) -> Optional[Transaction]:
+        assert isinstance(tx_hash, str)
+        tx = self.get_transaction(tx_hash)
+        if tx is not None:
+            self.conn.execute("DELETE FROM transactions WHERE txid=?", (tx_hash,))
+        return tx
+
+    @locked
+    def get_transaction(self, tx_hash: Optional[str]) -> Optional[Transaction]:
+        if tx_hash is None:
+            return None
+        assert isinstance(tx_hash, str)
+        row = self.conn.execute("SELECT raw FROM transactions WHERE txid=?", (tx_hash,)).fetchone()
+        if row is None:
+            return None
+        # note: for performance, "deserialize=False" so that we will deserialize these on-demand
+        return tx_from_any(row[0], deserialize=False)
+
+    @locked
+    def list_transactions(self) -> Sequence[str]:
+        return [r[0] for r in self.conn.execute("SELECT txid FROM transactions")]
+
+    @locked
+    def get_history(self) -> Sequence[str]:
+        return [r[0] for r in self.conn.execute("SELECT address FROM addr_history")]
+
+    @locked
+    def is_addr_in_history(self, addr: str) -> bool:
+        assert isinstance(addr, str)
+        row = self.conn.execute("SELECT 1 FROM addr_history WHERE address=?", (addr,)).fetchone()
+        return row is not None
+
+    @locked
+    def get_addr_history(self, addr: str) -> Sequence[Tuple[str, int]]:
+        assert isinstance(addr, str)
+        row = self.conn.execute("SELECT history FROM addr_history WHERE address=?", (addr,)).fetchone()
+        if row is None:
+            return []
+        return [tuple(item) for item in json.loads(row[0])]
+
+    @modifier
+    def set_addr_history(self, addr: str, hist, *, status: Optional[str]) -> None:
+        assert isinstance(addr, str)
+        self.conn.execute("INSERT OR REPLACE INTO addr_history VALUES (?,?)", (addr, json.dumps(hist)))
+        self.conn.execute("INSERT OR REPLACE INTO addr_history_status VALUES (?,?)", (addr, status))
+
+    @modifier
+    def remove_addr_history(self, addr: str) -> None:
+        assert isinstance(addr, str)
+        self.conn.execute("DELETE FROM addr_history WHERE address=?", (addr,))
+        self.conn.execute("DELETE FROM addr_history_status WHERE address=?", (addr,))
+        self.conn.execute("DELETE FROM addr_scripthashes WHERE address=?", (addr,))
+
+    @locked
+    def get_addr_history_status(self, addr: str) -> Optional[str]:
+        assert isinstance(addr, str)
+        row = self.conn.execute("SELECT status FROM addr_history_status WHERE address=?", (addr,)).fetchone()
+        return row[0] if row else None
+
+    @locked
+    def list_addrs_without_history_status(self) -> Sequence[str]:
+        rows = self.conn.execute("SELECT address FROM addr_history "
+                                 "WHERE address NOT IN (SELECT address FROM addr_history_status)")
+        return [r[0] for r in rows]
+
+    @modifier
+    def set_addr_history_status(self, addr: str, status: Optional[str]) -> None:
+        assert isinstance(addr, str)
+        self.conn.execute("INSERT OR REPLACE INTO addr_history_status VALUES (?,?)", (addr, status))
+
+    def get_addr_scripthash(self, addr: str) -> str:
+        assert isinstance(addr, str)
+        with self.lock:
+            row = self.conn.execute("SELECT scripthash FROM addr_scripthashes WHERE address=?", (addr,)).fetchone()
+            if row is not None:
+                return row[0]
+            scripthash = bitcoin.address_to_scripthash(addr)
+            self._set_addr_scripthash(addr, scripthash)
+            return scripthash
+
+    @modifier
+    def _set_addr_scripthash(self, addr: str, scripthash: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO addr_scripthashes VALUES (?,?)", (addr, scripthash))
+
+    @locked
+    def list_verified_tx(self) -> Sequence[str]:
+        return [r[0] for r in self.conn.execute("SELECT txid FROM verified_tx")]
+
+    @locked
+    def get_verified_tx(self, txid: str) -> Optional[TxMinedInfo]:
+        assert isinstance(txid, str)
+        row = self.conn.execute("SELECT height, timestamp, txpos, header_hash FROM verified_tx WHERE txid=?",
+                                (txid,)).fetchone()
+        if row is None:
+            return None
+        height, timestamp, txpos, header_hash = row
+        return TxMinedInfo(height=height,
+                           conf=None,
+                           timestamp=timestamp,
+                           txpos=txpos,
+                           header_hash=header_hash)
+
+    @modifier
+    def add_verified_txs(self, items: Sequence[Tuple[str, TxMinedInfo]]):
+        for txid, info in items:
+            assert isinstance(txid, str)
+            assert isinstance(info, TxMinedInfo)
+        self.conn.executemany("INSERT OR REPLACE INTO verified_tx VALUES (?,?,?,?,?)",
+                              [(txid, info.height, info.timestamp, info.txpos, info.header_hash)
+                               for txid, info in items])
+
+    @modifier
+    def remove_verified_tx(self, txid: str):
+        assert isinstance(txid, str)
+        self.conn.execute("DELETE FROM verified_tx WHERE txid=?", (txid,))
+
+    @locked
+    def is_in_verified_tx(self, txid: str) -> bool:
+        assert isinstance(txid, str)
+        row = self.conn.execute("SELECT 1 FROM verified_tx WHERE txid=?", (txid,)).fetchone()
+        return row is not None
+
+    @locked
+    def get_num_ismine_inputs_of_tx(self, txid: str) -> int:
+        assert isinstance(txid, str)
+        return self.conn.execute("SELECT COUNT(*) FROM txi WHERE tx_hash=?", (txid,)).fetchone()[0]
+
+    @modifier
+    def clear_history(self):
+        self._write_history({})
+        self.tx_fees.clear()
+
+    @locked
+    def dump(self, *, human_readable: bool = True) -> str:
+        """Serializes the whole DB as json, in the format of WalletDB."""
+        data = self.data.copy()
+        data.update(self._read_history())
+        return json.dumps(
+            data,
+            indent=4 if human_readable else None,
+            sort_keys=bool(human_readable),
+            cls=JsonDBJsonEncoder,
+        )
+
+    def add_patch(self, op: str, path: Sequence, *value) -> None:
+        # there is no journal. the meta rows of the changed top-level keys are rewritten
+        with self.lock:
+            self._modified = True
+            if path:
+                self._changed_meta_keys.add(path[0])
+            else:
+                self._needs_full_write = True
+
+    def _attach_to_file(self, storage: 'WalletStorage') -> None:
+        """Copies the db to the wallet file of storage, and uses that file from now on."""
+        if not storage.file_exists():
+            # see WalletStorage.write
+            assert not os.path.exists(storage.path)
+        conn = sqlite3.connect(storage.path, check_same_thread=False)
+        # note: the backup would wait forever for our own open transaction
+        self.conn.commit()
+        self.conn.backup(conn)
+        self.conn.close()
+        self.conn = conn
+        self.path = storage.path
+        os_chmod(self.path, stat.S_IREAD | stat.S_IWRITE)
+        storage.set_file_is_sqlite()
+
+    def _commit(self) -> None:
+        c = self.conn.cursor()
+        if self.needs_full_write():
+            c.execute("DELETE FROM meta")
+            keys = list(self.data.keys())
+        else:
+            keys = self._changed_meta_keys
+        # note: values that were not accessed are still raw json, and need no conversion
+        c.executemany("INSERT OR REPLACE INTO meta VALUES (?,?)", [
+            (key, json.dumps(peek(self.data, key), cls=JsonDBJsonEncoder))
+            for key in keys if key in self.data])
+        c.executemany("DELETE FROM meta WHERE key=?", [
+            (key,) for key in keys if key not in self.data])
+        self.conn.commit()
+        self._changed_meta_keys = set()
+        self._needs_full_write = False
+        self.set_modified(False)
+
+    @profiler
+    def _write(self, storage: 'WalletStorage', *, compact: bool = False):
+        if threading.current_thread().daemon:
+            self.logger.warning('daemon thread cannot write db')
+            return
+        if storage.is_encrypted():
+            raise WalletFileException("Storage encryption is not supported for sqlite wallets")
+        if self.path != storage.path:
+            self._attach_to_file(storage)
+        elif not self.modified():
+            return
+        self._commit()
+        self.logger.info(f"saved {self.path}")
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+def convert_wallet_db(storage: 'WalletStorage', db: WalletDB, *, to_sqlite: bool) -> WalletDB:
+    """Rewrites the wallet file of storage with the other db backend.
+    Returns the db of the converted file.
+    """
+    if isinstance(db, SqliteWalletDB) == to_sqlite:
+        raise WalletFileException("The wallet file already uses the requested db backend")
+    if storage.is_encrypted():
+        raise WalletFileException("Storage encryption is not supported for sqlite wallets")
+    from .storage import get_journal_path
+    json_str = db.dump()
+    if to_sqlite:
+        temp_path = "%s.tmp.%s" % (storage.path, os.getpid())
+        new_db = SqliteWalletDB(json_str, manual_upgrades=False, path=temp_path)
+        new_db._commit()
+        new_db.close()
+        mode = os.stat(storage.path).st_mode
+        os.replace(temp_path, storage.path)
+        os_chmod(storage.path, mode)
+        storage.set_file_is_sqlite()
+        # the journal of the json file is included in the db
+        try:
+            os.unlink(get_journal_path(storage.path))
+        except FileNotFoundError:
+            pass
+        new_db = SqliteWalletDB(manual_upgrades=False, path=storage.path)
+    else:
+        new_db = WalletDB(json_str, manual_upgrades=False)
+        storage.write(json_str)
+    if isinstance(db, SqliteWalletDB):
+        db.close()
+    return new_db
@@ -5,7 +5,7 @@ from typing import List, TYPE_CHECKING, Tuple, NamedTuple, Any, Dict, Optional,
 
 from electrum_glc.logging import get_logger
 from electrum_glc.storage import WalletStorage, StorageEncryptionVersion
-from electrum_glc.wallet_db import WalletDB
+from electrum_glc.wallet_db import create_wallet_db
 from electrum_glc.bip32 import normalize_bip32_derivation, xpub_type
 from electrum_glc import keystore
 from electrum_glc import bitcoin
@@ -258,17 +258,24 @@ class NewWalletWizard(AbstractWizard):
         else:
             raise Exception('unsupported/unknown keystore_type %s' % data['keystore_type'])
 
+        db_backend = self._daemon.config.get('wallet_db_backend', 'json') if self._daemon else 'json'
         if data['encrypt']:
             if k and k.may_have_password():
                 k.update_password(None, data['password'])
-            storage.set_password(data['password'], enc_version=StorageEncryptionVersion.USER_PASSWORD)
+            if db_backend == 'sqlite':
+                self._logger.info("not encrypting the wallet file: not supported for sqlite wallets")
+            else:
+                storage.set_password(data['password'], enc_version=StorageEncryptionVersion.USER_PASSWORD)
 
-        db = WalletDB('', manual_upgrades=False)
+        db = create_wallet_db(db_backend=db_backend)
         db.set_keystore_encryption(bool(data['password']) and data['encrypt'])
 
         db.put('wallet_type', data['wallet_type'])
         if 'seed_type' in data:
             db.put('seed_type', data['seed_type'])
+        if data.get('keystore_type') in ['haveseed', 'masterkey']:
+            # generate the used addresses in bulk once we are online
+            db.put('needs_address_discovery', True)
 
         if data['wallet_type'] == 'standard':
             db.put('keystore', k.dump())